@@ -0,0 +1,157 @@
+"""
+Archive Module
+Zip files assembled from members compressed on other processes
+
+Features:
+- Members compressed with the zlib, bz2 and lzma modules (deflate, bzip2, lzma, stored)
+- Zip records written as in the PKWARE APPNOTE, no zipfile internals
+- Zip64 records for members and archives over 4 GiB or 65535 entries
+
+"""
+
+import os
+import zlib
+import time
+import struct
+import shutil
+
+from tempfile import mkstemp
+
+STORED, DEFLATED, BZIP2, LZMA = 0, 8, 12, 14
+
+CHUNK_SIZE = 1024 * 1024
+
+# version needed to extract: 2.0 deflate, 4.5 zip64, 4.6 bzip2, 6.3 lzma
+_VERSION = {STORED: 20, DEFLATED: 20, BZIP2: 46, LZMA: 63}
+_ZIP64_VERSION = 45
+_LIMIT = 0xFFFFFFFF
+
+# lzma dictionary size of each preset, written on the member header
+_LZMA_DICT = [1 << 18, 1 << 20, 1 << 21, 1 << 22, 1 << 22, 1 << 23, 1 << 23, 1 << 24, 1 << 25, 1 << 26]
+
+
+class _LzmaCompressor(object):
+    """Raw LZMA1 stream after the zip lzma properties header"""
+
+    def __init__(self, level):
+        import lzma
+        preset = 6 if level is None else int(level)
+        dict_size = _LZMA_DICT[preset]
+        self._lzma = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[{
+            "id": lzma.FILTER_LZMA1, "preset": preset, "dict_size": dict_size, "lc": 3, "lp": 0, "pb": 2}])
+        # lzma sdk version 9.4, 5 bytes of properties: (pb * 5 + lp) * 9 + lc and dictionary size
+        self._header = struct.pack("<BBHBI", 9, 4, 5, (2 * 5 + 0) * 9 + 3, dict_size)
+
+    def compress(self, data):
+        header, self._header = self._header, b""
+        return header + self._lzma.compress(data)
+
+    def flush(self):
+        return self._header + self._lzma.flush()
+
+
+def compressor(method, level=None):
+    """Compressor object of method, None for stored"""
+    if method == DEFLATED:
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else int(level), zlib.DEFLATED, -15)
+    if method == BZIP2:
+        import bz2
+        return bz2.BZ2Compressor(9 if level is None else int(level))
+    if method == LZMA:
+        return _LzmaCompressor(level)
+    return None
+
+
+def compress_member(args):
+    """Compress a file into a raw member stream on a temp file (runs on a pool process).
+    Returns temp file, crc, size and compressed size"""
+    file_name, method, level, temp_folder = args
+    codec = compressor(method, level)
+    crc, size, compress_size = 0, 0, 0
+    fd, temp_file = mkstemp(dir=temp_folder)
+    with os.fdopen(fd, "wb") as raw, open(file_name, "rb") as src:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            if codec:
+                chunk = codec.compress(chunk)
+            compress_size += len(chunk)
+            raw.write(chunk)
+        if codec:
+            chunk = codec.flush()
+            compress_size += len(chunk)
+            raw.write(chunk)
+    return temp_file, crc & 0xffffffff, size, compress_size
+
+
+def _dos_time(timestamp):
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipWriter(object):
+    """Write a zip file with members already compressed by compress_member"""
+
+    def __init__(self, file_name):
+        self.fp = open(file_name, "wb")
+        self.entries = []
+
+    def add(self, source_file, arcname, method, member):
+        """Append the compressed member of source_file (its mtime and mode are kept), removes the temp file"""
+        temp_file, crc, size, compress_size = member
+        st = os.stat(source_file)
+        dos_time, dos_date = _dos_time(st.st_mtime)
+        name = arcname.encode("cp437") if not isinstance(arcname, bytes) else arcname
+        offset = self.fp.tell()
+        zip64 = size >= _LIMIT or compress_size >= _LIMIT
+        # lzma streams carry an end-of-stream marker
+        flags = 0x02 if method == LZMA else 0x00
+        version = max(_VERSION[method], _ZIP64_VERSION if zip64 or offset >= _LIMIT else 0)
+
+        extra = struct.pack("<HHQQ", 0x0001, 16, size, compress_size) if zip64 else b""
+        self.fp.write(struct.pack("<4sHHHHHIIIHH", b"PK\x03\x04", version, flags, method, dos_time, dos_date,
+                                  crc, _LIMIT if zip64 else compress_size, _LIMIT if zip64 else size,
+                                  len(name), len(extra)))
+        self.fp.write(name)
+        self.fp.write(extra)
+        with open(temp_file, "rb") as raw:
+            shutil.copyfileobj(raw, self.fp, CHUNK_SIZE)
+        os.remove(temp_file)
+        self.entries.append((name, version, flags, method, dos_time, dos_date, crc, size, compress_size,
+                             offset, (st.st_mode & 0xFFFF) << 16))
+
+    def close(self):
+        start = self.fp.tell()
+        for name, version, flags, method, dos_time, dos_date, crc, size, compress_size, offset, attr in self.entries:
+            # zip64 extra has the values that do not fit on the record, on this order
+            values = [v for v in (size, compress_size, offset) if v >= _LIMIT]
+            extra = struct.pack("<HH" + "Q" * len(values), 0x0001, 8 * len(values), *values) if values else b""
+            self.fp.write(struct.pack("<4sBBHHHHHIIIHHHHHII", b"PK\x01\x02", version, 3, version, flags, method,
+                                      dos_time, dos_date, crc, min(compress_size, _LIMIT), min(size, _LIMIT),
+                                      len(name), len(extra), 0, 0, 0, attr, min(offset, _LIMIT)))
+            self.fp.write(name)
+            self.fp.write(extra)
+        end = self.fp.tell()
+        count, size = len(self.entries), end - start
+        if count >= 0xFFFF or start >= _LIMIT or size >= _LIMIT:
+            self.fp.write(struct.pack("<4sQHHIIQQQQ", b"PK\x06\x06", 44, _ZIP64_VERSION, _ZIP64_VERSION,
+                                      0, 0, count, count, size, start))
+            self.fp.write(struct.pack("<4sIQI", b"PK\x06\x07", 0, end, 1))
+            count, size, start = min(count, 0xFFFF), min(size, _LIMIT), min(start, _LIMIT)
+        self.fp.write(struct.pack("<4sHHHHIIH", b"PK\x05\x06", 0, 0, count, count, size, start, 0))
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.fp.close()
@@ -13,6 +13,9 @@ from time import sleep
 from shutil import copy
 
 from .processor import Watcher
+from .claim import ClaimQueue
+from .taskrun import TaskRunner
+from .history import History, report
 from .log import add_log_handler, ConsoleHandler, FileHandler, DebugHandler
 
 
@@ -27,22 +30,41 @@ def init():
 
 def main():
     parser = ArgumentParser(description="DasLaden ETL")
+    parser.add_argument("command", nargs="?", default=None, choices=["stats", "daemon"],
+                        help="'stats' shows durations, throughput and regressions from run history. "
+                             "'daemon' watches capture folder and accepts jobs on a local HTTP endpoint")
     parser.add_argument("-task", nargs="?", default=None, const=None, help="Task file to process")
     parser.add_argument("-capture", default="capture", help="Capture folder. Default 'capture'")
     parser.add_argument("-watch-time", default=10, help="Capture watch time in seconds. Default 10s")
     parser.add_argument("--no-log", nargs="?", default=False, const=True, help="Disable file log")
     parser.add_argument("--verbose", nargs="?", default=False, const=True, help="Output logs to console")
     parser.add_argument("--no-init", nargs="?", default=False, const=False, help="Don't create folder structure")
+    parser.add_argument("-history", default="log/history.db", help="Run history file. Default 'log/history.db'")
+    parser.add_argument("-days", type=float, default=None, help="Stats of the last days only")
+    parser.add_argument("-top", type=int, default=10, help="Number of slowest tasks on stats. Default 10")
+    parser.add_argument("-port", type=int, default=8765, help="Daemon port on 127.0.0.1. Default 8765")
+    parser.add_argument("--shared", nargs="?", default=False, const=True,
+                        help="Capture folder shared by other nodes, claim files before processing")
+    parser.add_argument("-node", default=None, help="Node name on shared capture. Default host-pid")
+    parser.add_argument("-lease", type=float, default=300, help="Claim lease in seconds on shared capture. Default 300")
+    parser.add_argument("-workers", type=int, default=2, help="Daemon jobs running at same time. Default 2")
+    parser.add_argument("-token", default=None, help="Daemon token. Default a new token on 'log/daemon.token'")
     
     args = parser.parse_args()
     v = vars(args)    
 
+    if v["command"] == "stats":
+        report(History(v["history"]), v["days"], v["top"])
+        return
+
     if not v["no_init"]:
         init()
 
     if not v["no_log"]:
         add_log_handler(FileHandler())
 
+    TaskRunner.history = History(v["history"])
+
     if v["verbose"]:
         logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
         add_log_handler(DebugHandler())
@@ -53,13 +75,21 @@ def main():
     else:
         # make path for dynamic module import
         sys.path.append('{}/module'.format(os.getcwd()))
-        watch = Watcher(v["capture"])
+        claims = ClaimQueue(v["capture"], v["node"], v["lease"]) if v["shared"] else None
+        watch = Watcher(v["capture"], claims)
 
         if v["task"]:
             print("DasLaden ETL started.")
             watch.process_file(v["task"])
 
         else:
+            if v["command"] == "daemon":
+                from .daemon import Daemon
+                daemon = Daemon(v["port"], v["workers"], token=v["token"])
+                daemon.start()
+                print("DasLaden ETL daemon on http://{}:{}/jobs".format(*daemon.address))
+                if daemon.token_file:
+                    print("Daemon token on '{}'".format(daemon.token_file))
             print("DasLaden ETL started. (Press CTRL+C to stop)")
 
             if os.path.isfile("./start.zip"):
@@ -0,0 +1,46 @@
+"""
+Cache Module
+Objects shared by the tasks of a run, without heavy dependencies
+
+Features:
+- Lookup indexes shared by tasks, with optional ttl for next runs
+
+"""
+
+import time
+import threading
+
+
+class LookupCache(object):
+    """Lookup indexes shared by the tasks of a run. An index with ttl is kept for next runs until expired"""
+
+    def __init__(self):
+        self._items = {}
+        # locks of indexes being built, so a slow build does not block other names
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def expire(self):
+        """Drop indexes of the previous run, except those with ttl not expired"""
+        now = time.time()
+        with self._lock:
+            for name, (created, ttl, index) in list(self._items.items()):
+                if ttl is None or now - created > ttl:
+                    del self._items[name]
+
+    def get(self, name, build, ttl=None):
+        """Return the index for name, calling build to load it when not cached.
+        Tasks asking for the same name wait for a single build"""
+        with self._lock:
+            if name in self._items:
+                return self._items[name][2], True
+            building = self._building.setdefault(name, threading.Lock())
+        with building:
+            with self._lock:
+                if name in self._items:
+                    return self._items[name][2], True
+            index = build()
+            with self._lock:
+                self._items[name] = (time.time(), ttl, index)
+                self._building.pop(name, None)
+            return index, False
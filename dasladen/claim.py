@@ -0,0 +1,151 @@
+"""
+Claim Module
+Leases on captured files so several nodes can share one capture folder
+
+Features:
+- Claim a file by an atomic rename into the node folder (capture/.claims/<node>), only one node wins
+- Claim a drop (a task file and the files it reads) as one unit, by its first file
+- Heartbeat: claimed files are touched while the node works on them
+- Files of a node that stops touching them for the lease time go back to the capture folder
+- Works with processes on the same host or hosts sharing the folder (NFS, SMB)
+
+"""
+
+import os
+import time
+import socket
+import logging
+import threading
+
+CLAIMS = ".claims"
+
+
+def node_name():
+    """Default node name, host and process id"""
+    return u"{}-{}".format(socket.gethostname(), os.getpid())
+
+
+def _touch(path):
+    try:
+        os.utime(path, None)
+        return True
+    except OSError:
+        return False
+
+
+class ClaimQueue(object):
+    """Claims of a node on the files of a capture folder. A claim expires when not touched in lease seconds"""
+
+    def __init__(self, path, node=None, lease=300, heartbeat=None):
+        self.path = path
+        self.node = node or node_name()
+        self.lease = float(lease)
+        self.heartbeat = float(heartbeat or self.lease / 3)
+        self.root = os.path.join(path, CLAIMS)
+        self.folder = os.path.join(self.root, self.node)
+        self.held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+    @staticmethod
+    def is_claim(filename):
+        return filename == CLAIMS
+
+    def claim(self, filename):
+        """Move filename to the node folder, return False if other node got it first"""
+        target = os.path.join(self.folder, filename)
+        try:
+            os.rename(os.path.join(self.path, filename), target)
+        except OSError:
+            return False
+        # rename keeps the mtime of the file, lease starts now
+        _touch(target)
+        with self._lock:
+            self.held.add(filename)
+        return True
+
+    def claimed(self):
+        """Paths of the files claimed by all nodes"""
+        paths = []
+        if os.path.isdir(self.root):
+            for node in os.listdir(self.root):
+                folder = os.path.join(self.root, node)
+                try:
+                    paths += [os.path.join(folder, f) for f in os.listdir(folder)]
+                except OSError:
+                    continue
+        return paths
+
+    def claim_drop(self, files):
+        """Claim the files of a drop, the first one decides: return the claimed files,
+        empty when other node got the first"""
+        if not self.claim(files[0]):
+            return []
+        claimed = [files[0]]
+        for filename in files[1:]:
+            if self.claim(filename):
+                claimed.append(filename)
+            else:
+                logging.info(u"Claim: '{}' of '{}' taken by other node".format(filename, files[0]))
+        return claimed
+
+    def release(self, files):
+        """End the claims of files. Files not consumed by processors are removed, as on capture folder"""
+        with self._lock:
+            for filename in files:
+                self.held.discard(filename)
+                path = os.path.join(self.folder, filename)
+                if os.path.isfile(path):
+                    logging.info(u"Claim: removing unprocessed file '{}'".format(filename))
+                    os.remove(path)
+
+    def touch(self):
+        """Renew the lease of held files"""
+        with self._lock:
+            for filename in list(self.held):
+                if not _touch(os.path.join(self.folder, filename)):
+                    self.held.discard(filename)
+
+    def reclaim(self):
+        """Move files of expired claims back to the capture folder, return their names"""
+        moved = []
+        if not os.path.isdir(self.root):
+            return moved
+        limit = time.time() - self.lease
+        for node in os.listdir(self.root):
+            folder = os.path.join(self.root, node)
+            if node == self.node or not os.path.isdir(folder):
+                continue
+            for filename in os.listdir(folder):
+                source = os.path.join(folder, filename)
+                target = os.path.join(self.path, filename)
+                try:
+                    if os.path.getmtime(source) > limit or os.path.exists(target):
+                        continue
+                    os.rename(source, target)
+                except OSError:
+                    continue  # taken by other node or renewed
+                logging.info(u"Claim: lease of '{}' by '{}' expired, file back to capture".format(filename, node))
+                moved.append(filename)
+        return moved
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat):
+            self.touch()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._beat)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        try:
+            os.rmdir(self.folder)  # only when empty
+        except OSError:
+            pass
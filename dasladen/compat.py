@@ -7,6 +7,7 @@ Compatibility functions for run Python 2 and 3 versions
 
 import sys
 import io
+import heapq
 
 import importlib
 
@@ -14,6 +15,17 @@ import importlib
 PY2 = sys.version_info.major == 2
 PY3 = sys.version_info.major == 3
 
+if PY2:
+    import Queue as queue
+    text = unicode
+    string_types = basestring
+    integer_types = (int, long)
+else:
+    import queue
+    text = str
+    string_types = str
+    integer_types = (int, )
+
 def maketrans(from_str, to_str):
     if PY2:
         from string import maketrans
@@ -33,7 +45,45 @@ def translate_unicode(str_input):
     else:
         return str_input
 
+class LazyModule(object):
+    """Proxy of a module imported on first attribute access"""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
 def open(file, mode='r', buffering=-1, encoding=None):
     if buffering == 0 and (not 'b' in mode):
         buffering = 2
     return io.open(file, mode, buffering, encoding)
+
+
+class _Reversed(object):
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def merge(iterables, key=None, reverse=False):
+    """Merge sorted iterables, heapq.merge without key and reverse arguments on Python 2"""
+    if PY3:
+        return heapq.merge(*iterables, key=key, reverse=reverse)
+    key = key or (lambda x: x)
+    wrap = _Reversed if reverse else (lambda x: x)
+    decorated = [((wrap(key(row)), i, row) for row in it) for i, it in enumerate(iterables)]
+    return (row for _, _, row in heapq.merge(*decorated))
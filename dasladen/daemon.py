@@ -0,0 +1,237 @@
+"""
+Daemon Module
+Run task files submitted to a local HTTP endpoint, in a process that keeps modules,
+drivers and connection pools loaded between jobs
+
+Features:
+- POST /jobs with a task file config (json body) or {"path": "tasks/file.json"}, returns a job id
+- GET /jobs/<id> returns job status and progress, GET /jobs lists jobs
+- Jobs run on worker threads, sharing lookup indexes and connection pools
+- Listen on 127.0.0.1 only
+- Requests need the daemon token (Authorization: Bearer or X-Dasladen-Token header) and a local
+  Host header, POST needs a json Content-Type: a web page can't submit jobs (CSRF, DNS rebinding)
+
+"""
+
+import os
+import hmac
+import json
+import time
+import uuid
+import binascii
+import logging
+import threading
+import traceback
+
+from collections import OrderedDict
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+from . import compat
+from .log import Logger, get_time_filename
+from .cache import LookupCache
+from .taskrun import Runner, TaskRunner
+from .processor import Scheduler
+
+
+class Job(object):
+    """A submitted task file and its progress"""
+
+    def __init__(self, job_id, runner):
+        self.id = job_id
+        self.runner = runner
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.total = len(runner.config.get("tasks", []))
+        self.done = 0
+        self.current = None
+        self.log = None
+        self.error = None
+
+    def progress(self, current, done):
+        self.current = current
+        self.done = done
+
+    def as_dict(self):
+        return {"id": self.id, "file": self.runner.filename, "status": self.status,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished,
+                "tasks": self.total, "done": self.done, "current": self.current,
+                "log": self.log, "error": self.error}
+
+
+class JobManager(object):
+    """Queue of jobs run by worker threads. Keeps the last max_jobs jobs"""
+
+    def __init__(self, workers=2, max_jobs=1000):
+        self.jobs = OrderedDict()
+        self.max_jobs = max_jobs
+        self.lookups = LookupCache()
+        self._lock = threading.Lock()
+        self._queue = compat.queue.Queue()
+        self._threads = []
+        for _ in range(max(1, workers)):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, body):
+        """Queue a job for a task file config or a path, raise ValueError if not a task file"""
+        job_id = uuid.uuid4().hex[:12]
+        if not isinstance(body, dict):
+            raise ValueError("Body must be a json object")
+        if "path" in body:
+            runner = Runner(body["path"])
+        elif "tasks" in body:
+            runner = Runner(u"job_{}.json".format(job_id), body)
+        else:
+            raise ValueError("Body needs tasks or path")
+        job = Job(job_id, runner)
+        with self._lock:
+            self.jobs[job_id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id, None)
+
+    def list(self):
+        with self._lock:
+            return [job.as_dict() for job in self.jobs.values()]
+
+    def _work(self):
+        while True:
+            self._run(self._queue.get())
+
+    def _run(self, job):
+        job.log = u"job_{}_{}".format(job.id, get_time_filename())
+        with Logger(job.log) as log:
+            job.status = "running"
+            job.started = time.time()
+            try:
+                log.write(u"Executing Tasks: {} (job {})".format(job.runner.filename, job.id))
+                if job.runner.has_schedule:
+                    res = Scheduler.enqueue(job.runner, job.runner.filename)
+                    log.write(u"Scheduling Tasks: {}, for: {}".format(job.runner.filename, res))
+                    job.status = "scheduled"
+                else:
+                    TaskRunner(job.runner, self.lookups, job.progress).run(log)
+                    job.status = "finished"
+            except Exception:
+                job.status = "failed"
+                job.error = traceback.format_exc()
+                log.write(u"Error: {}".format(job.error))
+            finally:
+                job.finished = time.time()
+                log.write(u"Finished: {0} (job {1}), elapsed: {2:.2f}s".format(
+                    job.runner.filename, job.id, job.finished - job.started))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def new_token(file_name):
+    """Random token written on file_name, readable by the owner only"""
+    token = binascii.hexlify(os.urandom(24)).decode("ascii")
+    if os.path.isfile(file_name):
+        os.remove(file_name)
+    fd = os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+class _Handler(BaseHTTPRequestHandler):
+    manager = None
+    token = None
+    hosts = ()
+
+    def _reply(self, code, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _denied(self):
+        """Reply and return True when the request has no local Host or no valid token"""
+        if self.headers.get("Host", "").lower() not in self.hosts:
+            self._reply(403, {"error": "invalid host"})
+            return True
+        auth = self.headers.get("Authorization", "")
+        token = auth[7:].strip() if auth.lower().startswith("bearer ") else self.headers.get("X-Dasladen-Token", "")
+        if not hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8")):
+            self._reply(401, {"error": "invalid token"})
+            return True
+        return False
+
+    def do_POST(self):
+        if self._denied():
+            return
+        if self.path.rstrip("/") != "/jobs":
+            return self._reply(404, {"error": "not found"})
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            return self._reply(415, {"error": "Content-Type must be application/json"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+            job = self.manager.submit(body)
+        except ValueError as e:
+            return self._reply(400, {"error": compat.text(e)})
+        self._reply(202, {"id": job.id, "status": job.status})
+
+    def do_GET(self):
+        if self._denied():
+            return
+        path = self.path.rstrip("/")
+        if path == "/jobs":
+            return self._reply(200, self.manager.list())
+        if path.startswith("/jobs/"):
+            job = self.manager.get(path[6:])
+            if job is not None:
+                return self._reply(200, job.as_dict())
+        self._reply(404, {"error": "not found"})
+
+    def log_message(self, fmt, *args):
+        logging.info(u"Daemon: {}".format(fmt % args))
+
+
+class Daemon(object):
+    """HTTP endpoint on a background thread that submits jobs to a JobManager.
+    Without token, a new one is written on token_file"""
+
+    def __init__(self, port=8765, workers=2, host="127.0.0.1", token=None, token_file="log/daemon.token"):
+        self.token_file = None if token else token_file
+        self.token = token or new_token(token_file)
+        self.manager = JobManager(workers)
+        hosts = tuple(u"{}:{}".format(name, int(port)) for name in ("127.0.0.1", "localhost"))
+        handler = type("Handler", (_Handler, ), {"manager": self.manager, "token": self.token, "hosts": hosts})
+        self.server = _ThreadingHTTPServer((host, int(port)), handler)
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        logging.info(u"Daemon listening on http://{}:{}".format(*self.address))
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,179 @@
+"""
+Governor Module
+Limits of tasks and sessions running at same time, shared by all runs of the process
+
+Features:
+- Slots by key (connection max_concurrent, task file max_parallel), the lowest limit seen is kept
+- Requests take slots of several keys at once: a task never holds some of its sessions while
+  waiting for the others, so tasks can't deadlock on each other
+- Fair queue: a request waits for the earlier requests on the same slots, in arrival order
+- Each open session counts, a task with two sessions of a connection takes two slots
+- Queue wait time reported on the task log
+
+"""
+
+import time
+import threading
+
+
+class Slot(object):
+    """Limit and active count of a key"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.active = 0
+
+
+class _Request(object):
+
+    def __init__(self, needs):
+        self.needs = needs
+
+
+class Governor(object):
+    """Slots by key, created on first use"""
+
+    def __init__(self):
+        self._slots = {}
+        self._queue = []
+        self._cond = threading.Condition(threading.Lock())
+
+    def slot(self, key, limit):
+        """Slot of key. When configs disagree on the limit, the lowest one is kept"""
+        with self._cond:
+            slot = self._slots.get(key, None)
+            if slot is None:
+                slot = self._slots[key] = Slot(key, limit)
+            else:
+                slot.limit = min(slot.limit, max(1, int(limit)))
+            return slot
+
+    def _ready(self, request):
+        for other in self._queue:
+            if other is request:
+                break
+            if any(slot in other.needs for slot in request.needs):
+                return False
+        return all(slot.active + count <= slot.limit for slot, count in request.needs.items())
+
+    def acquire(self, needs, log=None):
+        """Take at once count slots of each slot of needs (dict of slot to count).
+        Return the seconds waited on queue. Raise ValueError when a count is over the limit"""
+        needs = dict([(slot, count) for slot, count in needs.items() if count > 0])
+        if not needs:
+            return 0.0
+        start = time.time()
+        request = _Request(needs)
+        with self._cond:
+            for slot, count in needs.items():
+                if count > slot.limit:
+                    raise ValueError(u"{} sessions of {} needed at same time, limit is {}".format(
+                        count, slot.name, slot.limit))
+            self._queue.append(request)
+            queued = not self._ready(request)
+            if queued and log is not None:
+                log.write(u"Governor: waiting for {}, {} queued".format(u", ".join([
+                    u"{} ({} running)".format(slot.name, slot.active) for slot in needs]), len(self._queue)))
+            try:
+                while not self._ready(request):
+                    self._cond.wait()
+            finally:
+                self._queue.remove(request)
+                # a request that waited behind this one may fit now
+                self._cond.notify_all()
+            for slot, count in needs.items():
+                slot.active += count
+        wait = time.time() - start
+        if queued and log is not None:
+            log.write(u"Governor: acquired after {0:.2f}s on queue".format(wait))
+        return wait
+
+    def release(self, needs):
+        with self._cond:
+            for slot, count in needs.items():
+                slot.active -= count
+            self._cond.notify_all()
+
+    def take(self, slot, log=None):
+        """Wait for a session of slot, return the function that gives it back"""
+        self.acquire({slot: 1}, log)
+        return lambda: self.release({slot: 1})
+
+
+class Reservation(object):
+    """Slots taken at once for a task item and handed to its sessions.
+    A session over the reserved count waits on the governor, unless the task already holds
+    the whole limit of the slot: nothing else would give a session back, so it raises"""
+
+    def __init__(self, governor, needs):
+        self.governor = governor
+        self.needs = dict([(slot, count) for slot, count in needs.items() if count > 0])
+        self._free = {}
+        # sessions over the reserved count, taken on the governor
+        self._extra = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, log=None):
+        wait = self.governor.acquire(self.needs, log)
+        self._free = dict(self.needs)
+        return wait
+
+    def release(self):
+        self.governor.release(self.needs)
+
+    def take(self, slot, log=None):
+        """Session of slot from the reservation, return the function that gives it back.
+        Raise ValueError when the sessions of the task would be over the limit of slot"""
+        with self._lock:
+            if self._free.get(slot, 0) > 0:
+                self._free[slot] -= 1
+                return lambda: self._give_back(slot)
+            held = self.needs.get(slot, 0) + self._extra.get(slot, 0)
+            if held >= slot.limit:
+                raise ValueError(u"{} sessions of {} opened at same time by the task, limit is {}".format(
+                    held + 1, slot.name, slot.limit))
+            self._extra[slot] = self._extra.get(slot, 0) + 1
+        try:
+            release = self.governor.take(slot, log)
+        except Exception:
+            self._give_back_extra(slot)
+            raise
+
+        def give_back():
+            release()
+            self._give_back_extra(slot)
+        return give_back
+
+    def _give_back(self, slot):
+        with self._lock:
+            self._free[slot] += 1
+
+    def _give_back_extra(self, slot):
+        with self._lock:
+            self._extra[slot] -= 1
+
+
+class GovernedConnection(object):
+    """Proxy of a connection that gives back its session on close"""
+
+    def __init__(self, release, db):
+        self._release = release
+        self._db = db
+
+    def close(self):
+        if self._db is not None:
+            db, self._db = self._db, None
+            try:
+                db.close()
+            finally:
+                self._release()
+
+    def __getattr__(self, item):
+        return getattr(self._db, item)
+
+    def __setattr__(self, key, value):
+        if key.startswith("_"):
+            object.__setattr__(self, key, value)
+        else:
+            setattr(self._db, key, value)
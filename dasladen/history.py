@@ -0,0 +1,172 @@
+"""
+History Module
+Run history of task items on a local SQLite database
+
+Features:
+- Record file, task, type, start/end, rows, bytes and status of each task execution
+- Duration percentiles (p50/p95) and throughput by task
+- Slowest tasks
+- Regression flags against a rolling baseline of previous runs
+
+"""
+
+import os
+import math
+import time
+import threading
+
+from . import compat
+
+sqlite3 = compat.LazyModule("sqlite3")
+
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS task_run (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file TEXT, task TEXT, type TEXT,
+        started REAL, finished REAL, duration REAL,
+        row_count INTEGER, byte_count INTEGER,
+        status TEXT, error TEXT)""",
+    "CREATE INDEX IF NOT EXISTS ix_task_run ON task_run (file, task, started)"
+]
+
+
+def percentile(values, p):
+    """Nearest rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def median(values):
+    return percentile(sorted(values), 50)
+
+
+class History(object):
+    """Task executions stored on a SQLite file, default log/history.db"""
+
+    def __init__(self, path="log/history.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            for sql in _SCHEMA:
+                db.execute(sql)
+            db.commit()
+            self._ready = True
+        return db
+
+    def record(self, file_name, task, task_type, start, end, rows=None, size=None, status="success", error=None):
+        with self._lock:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.mkdir(folder)
+            db = self._connect()
+            try:
+                db.execute("INSERT INTO task_run (file, task, type, started, finished, duration, "
+                           "row_count, byte_count, status, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (file_name, task, task_type, start, end, end - start, rows, size, status, error))
+                db.commit()
+            finally:
+                db.close()
+
+    def runs(self, days=None):
+        """Rows of task runs, oldest first, of the last days if given"""
+        if not os.path.isfile(self.path):
+            return []
+        db = self._connect()
+        try:
+            sql = "SELECT file, task, type, started, duration, row_count, byte_count, status FROM task_run"
+            args = []
+            if days:
+                sql += " WHERE started >= ?"
+                args.append(time.time() - float(days) * 86400)
+            return db.execute(sql + " ORDER BY started, id", args).fetchall()
+        finally:
+            db.close()
+
+    def stats(self, days=None, window=20, threshold=1.5):
+        """Summary by file and task. A task regressed when its last successful run took more than
+        threshold times the median of the window runs before it"""
+        items = {}
+        for file_name, task, task_type, start, duration, rows, size, status in self.runs(days):
+            item = items.setdefault((file_name, task), {"file": file_name, "task": task, "type": task_type,
+                                                        "runs": 0, "failed": 0, "durations": [], "rates": []})
+            item["runs"] += 1
+            if status == "failed":
+                item["failed"] += 1
+            if status != "success":
+                continue
+            item["durations"].append(duration)
+            item["rates"].append(rows / duration if rows and duration > 0 else None)
+
+        result = []
+        for item in items.values():
+            durations = item.pop("durations")
+            rates = item.pop("rates")
+            ordered = sorted(durations)
+            item["p50"] = percentile(ordered, 50)
+            item["p95"] = percentile(ordered, 95)
+            item["last"] = durations[-1] if durations else None
+
+            # throughput trend: recent half of window against the runs before
+            rates = [r for r in rates if r is not None][-window:]
+            half = len(rates) // 2
+            item["rate"] = rates[-1] if rates else None
+            item["trend"] = None
+            if half >= 2:
+                before, recent = median(rates[:half]), median(rates[half:])
+                item["trend"] = (recent - before) / before * 100.0 if before else None
+
+            baseline = durations[-window - 1:-1]
+            item["baseline"] = median(baseline) if len(baseline) >= 5 else None
+            item["regression"] = bool(item["baseline"] and item["last"] > item["baseline"] * threshold)
+            result.append(item)
+        return result
+
+
+def _seconds(value):
+    return u"-" if value is None else u"{0:.2f}s".format(value)
+
+
+def report(history, days=None, top=10, window=20, threshold=1.5, out=None):
+    """Print the stats of history"""
+    def write(line):
+        if out is None:
+            print(line)
+        else:
+            out.write(line + u"\n")
+
+    items = history.stats(days, window, threshold)
+    if not items:
+        write(u"No task runs on history '{}'".format(history.path))
+        return items
+
+    write(u"{:<30} {:<30} {:>5} {:>5} {:>10} {:>10} {:>12} {:>8}".format(
+        u"File", u"Task", u"Runs", u"Fail", u"p50", u"p95", u"Rows/s", u"Trend"))
+    for item in sorted(items, key=lambda i: (i["file"], i["task"])):
+        write(u"{:<30} {:<30} {:>5} {:>5} {:>10} {:>10} {:>12} {:>8}{}".format(
+            compat.text(item["file"])[:30], compat.text(item["task"])[:30], item["runs"], item["failed"],
+            _seconds(item["p50"]), _seconds(item["p95"]),
+            u"-" if item["rate"] is None else u"{0:.0f}".format(item["rate"]),
+            u"-" if item["trend"] is None else u"{0:+.0f}%".format(item["trend"]),
+            u"  REGRESSION" if item["regression"] else u""))
+
+    write(u"")
+    write(u"Slowest tasks (p95):")
+    slowest = sorted([i for i in items if i["p95"] is not None], key=lambda i: i["p95"], reverse=True)
+    for item in slowest[:top]:
+        write(u"  {0:>10}  {1} / {2}".format(_seconds(item["p95"]), item["file"], item["task"]))
+
+    regressions = [i for i in items if i["regression"]]
+    if regressions:
+        write(u"")
+        write(u"Regressions (last run over {0:.1f}x the median of previous {1} runs):".format(threshold, window))
+        for item in regressions:
+            write(u"  {} / {}: last {}, baseline {}".format(item["file"], item["task"],
+                                                        _seconds(item["last"]), _seconds(item["baseline"])))
+    return items
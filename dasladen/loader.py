@@ -0,0 +1,650 @@
+"""
+Loader Module
+Load tables into database targets
+
+External Dependencies:
+- petl : (c) 2012 Alistair Miles - MIT License (https://pypi.python.org/pypi/petl/)
+
+Features:
+- Load in one transaction or committed in batches of rows
+- Checkpoint of committed batches to resume a failed load
+- Pipelined load: extract and transform on a thread, insert on other, connected by a bounded queue
+- Load strategies: append, truncate (real TRUNCATE) and swap (load a shadow table and put it in place)
+- Insert batch size of the driver cursor on the log
+- Indexes and constraints disabled during the load and always restored after
+- Delta load: only rows inserted, updated or deleted since the last snapshot, found by row fingerprints
+
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import decimal
+import hashlib
+import datetime
+import operator
+
+from itertools import islice
+
+import petl as etl
+
+from . import compat
+from .log import get_time_filename
+from .pipeline import batches, QueueView, Consumer, ABORT
+
+
+class Checkpoint(object):
+    """Committed progress of a load, persisted as a json file on checkpoint folder"""
+
+    def __init__(self, name, folder="checkpoint"):
+        self.folder = folder
+        self.file = u"{}/{}.json".format(folder, re.sub(r"[^\w.-]", "_", name))
+
+    def load(self):
+        if os.path.isfile(self.file):
+            with compat.open(self.file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def save(self, state):
+        if not os.path.exists(self.folder):
+            os.mkdir(self.folder)
+        temp_file = u"{}.tmp".format(self.file)
+        with compat.open(temp_file, "w", encoding="utf-8") as f:
+            f.write(compat.text(json.dumps(state)))
+        if os.path.isfile(self.file):
+            os.remove(self.file)
+        os.rename(temp_file, self.file)
+
+    def clear(self):
+        if os.path.isfile(self.file):
+            os.remove(self.file)
+
+
+def _key_value(value):
+    """Key value as saved on checkpoint"""
+    if value is None or isinstance(value, (int, float, bool)) or isinstance(value, compat.string_types):
+        return value
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return compat.text(value)
+
+
+def _parse_datetime(value):
+    value = compat.text(value).replace(u"T", u" ")
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(u"Invalid datetime: {}".format(value))
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(compat.text(value)[:10], "%Y-%m-%d").date()
+
+
+# converters of checkpoint_key values, so keys compare by type and not as text ("10" > "9")
+_KEY_TYPES = {
+    "int": int,
+    "float": float,
+    "decimal": lambda v: decimal.Decimal(compat.text(v)),
+    "date": lambda v: v if type(v) is datetime.date else _parse_date(v),
+    "datetime": lambda v: v if isinstance(v, datetime.datetime) else _parse_datetime(v),
+    "text": compat.text
+}
+
+
+def _key_type(value):
+    """Type name of a key value, text values (csv) are taken as the first type that parses them"""
+    if isinstance(value, bool) or value is None:
+        return "text"
+    if isinstance(value, compat.integer_types):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, decimal.Decimal):
+        return "decimal"
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.date):
+        return "date"
+    for name in ("int", "decimal", "date", "datetime"):
+        try:
+            _KEY_TYPES[name](value)
+            if name != "date" or len(compat.text(value)) == 10:
+                return name
+        except (ValueError, TypeError, decimal.InvalidOperation):
+            pass
+    return "text"
+
+
+def _source_stamp(source):
+    """Size and mtime of a source file (or of the zip of a zip member), None if not a file"""
+    path = getattr(source, "filename", source)
+    if not isinstance(path, compat.string_types) or not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    return [getattr(source, "membername", None), st.st_size, int(st.st_mtime)]
+
+
+class DbLoader(object):
+    """Load a table into a database target.
+    With commit_every, rows are committed in batches and the checkpoint let a rerun resume
+    after the last committed batch, by source offset or by the last value of checkpoint_key
+    (compared as checkpoint_key_type, or the type found on the first checkpoint).
+    The load_strategy "truncate" runs TRUNCATE TABLE before the load (instead of petl DELETE)
+    and "swap" loads into a shadow table that replaces the table at the end"""
+
+    def __init__(self, driver, target, log_name, log=None, source=None):
+        self.target = target
+        # source file, offset checkpoints are not resumed when it changed
+        self.source = source
+        self.output_driver = driver.get_driver(target["connection"])
+        self.log_name = log_name
+        self.log = log
+
+        table = target["table"]
+        self.table = compat.translate_unicode(table)
+        if "schema" in target:
+            schema_name = target["schema"]
+            self.schema = compat.translate_unicode(schema_name)
+        else:
+            self.schema = None
+
+        self.strategy = target.get("load_strategy", None)
+        self.truncate = target.get("truncate", False) and self.strategy is None
+        self.checkpoint = Checkpoint(u"{}_{}_{}".format(log_name, target["connection"], self.table))
+
+    def _execute(self, db, statements):
+        cursor = db.cursor()
+        for sql in statements:
+            self._write(u"Executing: {}".format(sql))
+            cursor.execute(sql)
+
+    def _write(self, msg):
+        if self.log is not None:
+            self.log.write(msg)
+
+    def _begin(self, db, cursor):
+        """Run the transaction statements of defer_constraints on the load cursor, after each commit"""
+        if self.target.get("defer_constraints", False):
+            for sql in self.output_driver.transaction_sql(db, self.table, self.schema):
+                self._write(u"Executing: {}".format(sql))
+                cursor.execute(sql)
+
+    def load(self, record_set, pipeline=False):
+        db = self.output_driver.get_db()
+        table = self.table
+        try:
+            resume = "commit_every" in self.target and self.checkpoint.load().get("rows", 0)
+            if self.strategy == "truncate" and not resume:
+                self._execute(db, self.output_driver.truncate_sql(table, self.schema))
+            elif self.strategy == "swap":
+                self.table = self.target.get("shadow_table", u"{}_swap".format(table))
+                if not resume:
+                    self._create_shadow(db, table)
+
+            restore = self._disable(db)
+            try:
+                self._load(record_set, db, pipeline)
+            except Exception:
+                # keep the load error, restore failures are on the log
+                db.rollback()
+                self._restore(db, restore)
+                raise
+            if self._restore(db, restore):
+                raise RuntimeError(u"Restore of indexes and constraints failed, see the log")
+
+            if self.strategy == "swap":
+                old = self.target.get("old_table", u"{}_old".format(table))
+                self._execute(db, self.output_driver.swap_sql(table, self.table, old, self.schema,
+                                                              self.target.get("partition", None)))
+                db.commit()
+        finally:
+            self.table = table
+            db.close()
+
+    def _disable(self, db):
+        """Run the disable statements of disable_indexes and defer_constraints options.
+        Return the restore statements of those executed"""
+        pairs = []
+        if self.target.get("disable_indexes", False):
+            pairs += self.output_driver.index_sql(db, self.table, self.schema)
+        if self.target.get("defer_constraints", False):
+            pairs += self.output_driver.constraint_sql(db, self.table, self.schema)
+        restore = []
+        try:
+            for disable_sql, restore_sql in pairs:
+                self._execute(db, [disable_sql])
+                if restore_sql:
+                    restore.append(restore_sql)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore(db, restore)
+            raise
+        return restore
+
+    def _restore(self, db, restore):
+        """Run restore statements in reverse order, a failed statement does not stop the others.
+        Return the number of failed statements"""
+        failed = 0
+        for sql in reversed(restore):
+            try:
+                self._execute(db, [sql])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                self._write(u"Restore failed: {}, error: {}".format(sql, e))
+        return failed
+
+    def _create_shadow(self, db, table):
+        try:
+            # shadow left by a failed load
+            self._execute(db, self.output_driver.drop_sql(self.table, self.schema))
+            db.commit()
+        except Exception:
+            db.rollback()
+        self._execute(db, self.output_driver.shadow_sql(db, table, self.table, self.schema))
+        db.commit()
+
+    def _load(self, record_set, db, pipeline):
+        task_log = "log/{}_{}.log".format(self.log_name, get_time_filename())
+        with open(task_log, "w") as lg:
+            record_set = record_set.progress(10000, out=lg)
+            if pipeline:
+                self._load_pipelined(record_set, db)
+            elif "commit_every" in self.target or "batch_size" in self.target:
+                self._load_batches(record_set, db)
+            else:
+                cursor = self.output_driver.cursor(db)
+                self._begin(db, cursor)
+                if self.truncate:
+                    record_set.todb(cursor, tablename=self.table, schema=self.schema)
+                else:
+                    record_set.appenddb(cursor, tablename=self.table, schema=self.schema)
+                self._write_batch_size(cursor)
+
+    def _write_batch_size(self, cursor):
+        batcher = getattr(cursor, "batcher", None)
+        if batcher is not None and batcher.batches:
+            self._write(u"Insert batch size: {} ({}), {} batches".format(
+                batcher.size, "adaptive" if batcher.adaptive else "fixed", batcher.batches))
+
+    def _load_pipelined(self, record_set, db):
+        """Fetch and transform rows on this thread while a consumer thread inserts them"""
+        batch_size = int(self.target.get("batch_size", 1000))
+        queue_depth = int(self.target.get("queue_depth", 4))
+        self._write(u"Pipelined load, batch size: {}, queue depth: {}".format(batch_size, queue_depth))
+
+        it = iter(record_set)
+        hdr = next(it)
+        queue = compat.queue.Queue(queue_depth)
+        view = QueueView(hdr, queue)
+        consumer = Consumer(view, lambda v: self._load_batches(v, db))
+        consumer.start()
+
+        start = time.time()
+        put_wait = 0.0
+        failed = True
+        try:
+            for batch in batches(it, batch_size):
+                if consumer.error:
+                    break
+                wait = time.time()
+                queue.put(batch)
+                put_wait += time.time() - wait
+            failed = False
+        finally:
+            # on a source error the consumer fails before its commit, load rolls back
+            queue.put(ABORT if failed else None)
+            consumer.join()
+
+        if consumer.error:
+            raise RuntimeError(u"Load failed: {}".format(consumer.error))
+        self._write(u"Pipelined load finished in {0:.2f}s, source waited {1:.2f}s on full queue, "
+                    u"target waited {2:.2f}s on empty queue".format(time.time() - start, put_wait, view.wait))
+
+    def _load_batches(self, record_set, db):
+        """Insert rows in batches of batch_size (or commit_every) rows. Without commit_every
+        all batches are committed at the end, with it each commit saves the checkpoint"""
+        commit_every = int(self.target.get("commit_every", 0))
+        batch_size = int(self.target.get("batch_size", commit_every or 1000))
+        checkpoint = self.checkpoint
+        state = checkpoint.load() if commit_every else {}
+        committed = state.get("rows", 0)
+
+        it = iter(record_set)
+        hdr = tuple(next(it))
+        key = self.target.get("checkpoint_key", None) if commit_every else None
+        key_index = [compat.translate_unicode(f) for f in hdr].index(key) if key else None
+        stamp = _source_stamp(self.source)
+        key_type = self.target.get("checkpoint_key_type", state.get("key_type", None))
+        if committed:
+            if key:
+                parse = _KEY_TYPES[key_type or "text"]
+                last = parse(state["key"])
+                self._write(u"Resuming load after {}: {} ({} rows committed)".format(key, last, committed))
+                it = (row for row in it if row[key_index] is not None and parse(row[key_index]) > last)
+            else:
+                if state.get("source", stamp) != stamp:
+                    raise RuntimeError(u"Source changed since {} rows were committed, remove checkpoint {} "
+                                       u"to load it again".format(committed, checkpoint.file))
+                self._write(u"Resuming load after {} rows committed".format(committed))
+                it = islice(it, committed, None)
+
+        cursor = self.output_driver.cursor(db)
+        self._begin(db, cursor)
+        truncate = self.truncate and not committed
+        pending = 0
+        for batch in batches(it, batch_size):
+            if truncate:
+                etl.todb([hdr] + batch, cursor, tablename=self.table, schema=self.schema, commit=False)
+                truncate = False
+            else:
+                etl.appenddb([hdr] + batch, cursor, tablename=self.table, schema=self.schema, commit=False)
+            pending += len(batch)
+            if commit_every and pending >= commit_every:
+                db.commit()
+                committed += pending
+                pending = 0
+                state = {"rows": committed, "source": stamp}
+                if key:
+                    value = batch[-1][key_index]
+                    key_type = key_type or _key_type(value)
+                    state["key"] = _key_value(value)
+                    state["key_type"] = key_type
+                checkpoint.save(state)
+                self._begin(db, cursor)
+
+        if truncate:
+            # no rows to load, but truncate the target as a full load would do
+            etl.todb([hdr], cursor, tablename=self.table, schema=self.schema, commit=False)
+        db.commit()
+        committed += pending
+        self._write_batch_size(cursor)
+        if commit_every:
+            self._write(u"Load complete. {} rows committed every {} rows".format(committed, commit_every))
+            checkpoint.clear()
+
+
+def _row_hash(row):
+    """8 bytes fingerprint of row values"""
+    data = u"\x1f".join([u"\x00" if v is None else compat.text(v) for v in row]).encode("utf-8")
+    if hasattr(hashlib, "blake2b"):
+        return hashlib.blake2b(data, digest_size=8).digest()
+    return hashlib.md5(data).digest()[:8]
+
+
+def _replace(source, target):
+    if compat.PY3:
+        os.replace(source, target)
+    else:
+        if os.path.isfile(target):
+            os.remove(target)
+        os.rename(source, target)
+
+
+class Fingerprints(object):
+    """Fingerprints of the last loaded snapshot on a SQLite file: key hash, row hash and key (json).
+    A load writes the fingerprints of the new snapshot on a temp file while it looks up the previous
+    ones by batches of keys. The snapshot is moved to a .new file before the commit of the target and
+    replaces the saved one after it. A .new file found on open means a load stopped between both, so
+    the target may hold either snapshot and the load recovers. Nothing is kept in memory"""
+
+    # previous fingerprint of a key already added to the new snapshot
+    DUPLICATE = object()
+    # keys by lookup query, below the bind variables limit of SQLite
+    query_size = 500
+
+    def __init__(self, name, folder="checkpoint", buffer_size=10000):
+        self.folder = folder
+        self.file = u"{}/{}.fpdb".format(folder, re.sub(r"[^\w.-]", "_", name))
+        self.temp_file = u"{}.tmp".format(self.file)
+        self.new_file = u"{}.new".format(self.file)
+        self.buffer_size = buffer_size
+        self.previous = False
+        self.recover = False
+        self._db = None
+        self._saved = []
+        self._pending = []
+
+    @staticmethod
+    def _key(key):
+        data = json.dumps(list(key) if isinstance(key, tuple) else [key], default=compat.text)
+        return data, sqlite3.Binary(hashlib.md5(data.encode("utf-8")).digest())
+
+    def _attach(self, path, name):
+        self._db.execute("ATTACH DATABASE ? AS {}".format(name), [path])
+        self._db.execute("CREATE TABLE IF NOT EXISTS {}.fp (kh BLOB PRIMARY KEY, h BLOB, k TEXT) WITHOUT ROWID"
+                         .format(name))
+        self._saved.append(name)
+
+    def open(self):
+        """Start the fingerprints of a new snapshot, previous is True when there are saved ones
+        and recover is True when the target may hold the saved or the .new snapshot"""
+        if not os.path.exists(self.folder):
+            os.mkdir(self.folder)
+        if os.path.isfile(self.temp_file):
+            os.remove(self.temp_file)  # left by a failed load
+        self._db = sqlite3.connect(self.temp_file, check_same_thread=False)
+        self._db.execute("PRAGMA main.journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE fp (kh BLOB PRIMARY KEY, h BLOB, k TEXT) WITHOUT ROWID")
+        self._saved = []
+        self.recover = os.path.isfile(self.new_file)
+        self.previous = self.recover or os.path.isfile(self.file)
+        if os.path.isfile(self.file):
+            self._attach(self.file, "prev")
+        if self.recover:
+            self._attach(self.new_file, "rec")
+        return self
+
+    def lookup(self, items):
+        """Add a batch of (key, fingerprint) items to the new snapshot. Return the previous fingerprint
+        of each key, None when not found (always on recover) or DUPLICATE for a key added before,
+        which is not added again"""
+        self._flush()
+        items = [self._key(key) + (fingerprint, ) for key, fingerprint in items]
+        hashes = [key_hash for data, key_hash, fingerprint in items]
+        added, previous = set(), {}
+        for chunk in batches(iter(hashes), self.query_size):
+            markers = u", ".join([u"?"] * len(chunk))
+            for key_hash, in self._db.execute(u"SELECT kh FROM fp WHERE kh IN ({})".format(markers), chunk):
+                added.add(bytes(key_hash))
+            if "prev" in self._saved and not self.recover:
+                for key_hash, fingerprint in self._db.execute(
+                        u"SELECT kh, h FROM prev.fp WHERE kh IN ({})".format(markers), chunk):
+                    previous[bytes(key_hash)] = bytes(fingerprint)
+        result, rows = [], []
+        for data, key_hash, fingerprint in items:
+            key_hash_bytes = bytes(key_hash)
+            if key_hash_bytes in added:
+                result.append(Fingerprints.DUPLICATE)
+                continue
+            added.add(key_hash_bytes)
+            rows.append((key_hash, sqlite3.Binary(fingerprint), data))
+            result.append(previous.get(key_hash_bytes))
+        self._db.executemany("INSERT INTO fp VALUES (?, ?, ?)", rows)
+        return result
+
+    def add(self, key, fingerprint):
+        """Add a key to the new snapshot, the first fingerprint of a key is kept"""
+        data, key_hash = self._key(key)
+        self._pending.append((key_hash, sqlite3.Binary(fingerprint), data))
+        if len(self._pending) >= self.buffer_size:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._db.executemany("INSERT OR IGNORE INTO fp VALUES (?, ?, ?)", self._pending)
+            del self._pending[:]
+
+    def missing(self):
+        """Keys (as lists) of the saved snapshots not added to the new one"""
+        self._flush()
+        if not self._saved:
+            return
+        cur = self._db.execute(u" UNION ".join([
+            u"SELECT o.k FROM {}.fp o WHERE NOT EXISTS (SELECT 1 FROM fp n WHERE n.kh = o.kh)".format(name)
+            for name in self._saved]))
+        for data, in cur:
+            yield json.loads(data)
+
+    def prepare(self):
+        """Write the new snapshot in one transaction and move it to the .new file, before the commit
+        of the target. On recover, the keys of the .new file it replaces are kept on the saved file"""
+        self._flush()
+        if self.recover:
+            if "prev" not in self._saved:
+                self._attach(self.file, "prev")
+            self._db.execute("INSERT OR IGNORE INTO prev.fp SELECT * FROM rec.fp")
+        self._db.commit()
+        self._db.close()
+        self._db = None
+        _replace(self.temp_file, self.new_file)
+
+    def save(self):
+        """Put the .new snapshot in place of the saved one, after the commit of the target"""
+        _replace(self.new_file, self.file)
+        self.recover = False
+
+    def close(self):
+        """Close the new snapshot, not prepared fingerprints are removed"""
+        if self._db is not None:
+            db, self._db = self._db, None
+            del self._pending[:]
+            db.close()
+            os.remove(self.temp_file)
+
+
+class FingerprintView(etl.Table):
+    """Pass rows through, adding the fingerprint of each row to fingerprints by key fields"""
+
+    def __init__(self, table, key, fingerprints):
+        self.table = table
+        self.key = key
+        self.fingerprints = fingerprints
+
+    def __iter__(self):
+        it = iter(self.table)
+        hdr = next(it)
+        yield hdr
+        flds = [compat.translate_unicode(f) for f in hdr]
+        get_key = operator.itemgetter(*[flds.index(k) for k in self.key])
+        fingerprints = self.fingerprints
+        for row in it:
+            fingerprints.add(get_key(row), _row_hash(row))
+            yield row
+
+
+class DeltaLoader(DbLoader):
+    """Load only the changes of a snapshot. Rows are compared to the fingerprints of the previous
+    load by key, in one pass: new keys are inserted, changed rows updated and missing keys deleted.
+    Repeated keys are skipped after the first row. The first run (no fingerprints) is a full load"""
+
+    def __init__(self, driver, target, log_name, log=None):
+        DbLoader.__init__(self, driver, target, log_name, log)
+        delta = target["delta"]
+        key = delta["key"]
+        self.key = [compat.translate_unicode(k) for k in (key if isinstance(key, list) else [key])]
+        self.batch_size = int(delta.get("batch_size", 1000))
+        self.fingerprints = Fingerprints(u"{}_{}_{}".format(log_name, target["connection"], self.table),
+                                         delta.get("folder", "checkpoint"))
+
+    def load(self, record_set, pipeline=False):
+        fingerprints = self.fingerprints.open()
+        try:
+            if not fingerprints.previous:
+                self._write(u"Delta load: no fingerprints of a previous load, loading all rows")
+                DbLoader.load(self, FingerprintView(record_set, self.key, fingerprints), pipeline)
+                fingerprints.prepare()
+            else:
+                # prepares the fingerprints before its commit
+                self._load_delta(record_set, fingerprints)
+            fingerprints.save()
+        finally:
+            fingerprints.close()
+
+    def _load_delta(self, record_set, fingerprints):
+        start = time.time()
+        driver = self.output_driver
+        table_name = driver.table_name(self.table, self.schema)
+        it = iter(record_set)
+        hdr = tuple(next(it))
+        flds = [compat.translate_unicode(f) for f in hdr]
+        key_index = [flds.index(k) for k in self.key]
+        value_index = [i for i in range(len(flds)) if i not in key_index]
+        get_key = operator.itemgetter(*key_index)
+
+        columns = [driver.quote(flds[i]) for i in value_index] + [driver.quote(flds[i]) for i in key_index]
+        markers = [driver.marker(i) for i in range(len(columns))]
+        where = u" AND ".join([u"{} = {}".format(c, m) for c, m in zip(columns[len(value_index):],
+                                                                     markers[len(value_index):])])
+        update_sql = u"UPDATE {} SET {} WHERE {}".format(table_name, u", ".join(
+            [u"{} = {}".format(c, m) for c, m in zip(columns[:len(value_index)], markers[:len(value_index)])]), where)
+        delete_sql = u"DELETE FROM {} WHERE {}".format(table_name, u" AND ".join(
+            [u"{} = {}".format(driver.quote(k), driver.marker(i)) for i, k in enumerate(self.key)]))
+
+        recover = fingerprints.recover
+        if recover:
+            self._write(u"Delta load: a previous load stopped before its fingerprints were saved, "
+                        u"replacing all rows by key")
+        db = driver.get_db()
+        try:
+            cursor = driver.cursor(db)
+            inserts, updates, replaces = [], [], []
+            counts = {"insert": 0, "update": 0, "delete": 0, "same": 0, "duplicate": 0}
+
+            def flush(force=False):
+                if replaces and (force or len(replaces) >= self.batch_size):
+                    cursor.executemany(delete_sql, replaces)
+                    del replaces[:]
+                if inserts and (force or len(inserts) >= self.batch_size):
+                    etl.appenddb([hdr] + inserts, cursor, tablename=self.table, schema=self.schema, commit=False)
+                    counts["insert"] += len(inserts)
+                    del inserts[:]
+                if updates and (force or len(updates) >= self.batch_size):
+                    cursor.executemany(update_sql, updates)
+                    counts["update"] += len(updates)
+                    del updates[:]
+
+            for rows in batches(it, self.batch_size):
+                keys = [get_key(row) for row in rows]
+                hashes = [_row_hash(row) for row in rows]
+                previous = fingerprints.lookup(zip(keys, hashes))
+                for row, fingerprint, old in zip(rows, hashes, previous):
+                    if old is Fingerprints.DUPLICATE:
+                        # the first row of a key is loaded
+                        counts["duplicate"] += 1
+                    elif recover:
+                        replaces.append([row[i] for i in key_index])
+                        inserts.append(row)
+                    elif old is None:
+                        inserts.append(row)
+                    elif old != fingerprint:
+                        if value_index:
+                            updates.append([row[i] for i in value_index] + [row[i] for i in key_index])
+                    else:
+                        counts["same"] += 1
+                flush()
+            flush(True)
+
+            # keys not found on this snapshot
+            for batch in batches(fingerprints.missing(), self.batch_size):
+                cursor.executemany(delete_sql, batch)
+                counts["delete"] += len(batch)
+            fingerprints.prepare()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self._write(u"Delta load complete in {0:.2f}s: {1[insert]} inserted, {1[update]} updated, "
+                    u"{1[delete]} deleted, {1[same]} unchanged, {1[duplicate]} duplicate keys skipped".format(
+                        time.time() - start, counts))
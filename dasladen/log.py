@@ -14,28 +14,30 @@ from . import compat
 
 
 class FileHandler(object):
+    """Log file by logger key, so loggers of concurrent jobs write to its own file"""
+
     def __init__(self):
-        self.file = None
+        self.files = {}
 
     def open(self, key):
-        self.file = compat.open('log/{}.log'.format(key), 'a', 0)
+        self.files[key] = compat.open('log/{}.log'.format(key), 'a', 0)
 
-    def write(self, data):
-        self.file.write(u"{} {}\n".format(get_time(), data))
+    def write(self, data, key=None):
+        self.files[key].write(u"{} {}\n".format(get_time(), data))
 
-    def close(self):
-        self.file.close()
+    def close(self, key=None):
+        self.files.pop(key).close()
 
 
 class ConsoleHandler(object):
     def open(self, key):
         pass
 
-    # noinspection PyMethodMayBeStatic
-    def write(self, data):
+    # noinspection PyMethodMayBeStatic,PyUnusedLocal
+    def write(self, data, key=None):
         print(u"{} {}".format(get_time(), data))
 
-    def close(self):
+    def close(self, key=None):
         pass
 
 
@@ -43,11 +45,11 @@ class DebugHandler(object):
     def open(self, key):
         pass
 
-    # noinspection PyMethodMayBeStatic
-    def write(self, data):
+    # noinspection PyMethodMayBeStatic,PyUnusedLocal
+    def write(self, data, key=None):
         logging.info(data)
 
-    def close(self):
+    def close(self, key=None):
         pass
 
 
@@ -62,6 +64,9 @@ class LogManager(object):
     def get(self, key):
         return self.log_manager_instance[key]
 
+    def remove(self, key):
+        self.log_manager_instance.pop(key, None)
+
 
 _manager = LogManager()
 
@@ -85,15 +90,31 @@ class Logger(object):
 
     def write(self, data):
         for handler in _manager.get(self.key):
-            handler.write(data)
+            handler.write(data, self.key)
 
     def __enter__(self):
-        for handler in _manager.get(self.key):
-            handler.open(self.key)
+        opened = []
+        try:
+            for handler in _manager.get(self.key):
+                handler.open(self.key)
+                opened.append(handler)
+        except Exception:
+            self._close(opened)
+            raise
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for handler in _manager.get(self.key):
-            handler.close()
+        self._close(_manager.get(self.key))
+
+    def _close(self, handlers):
+        """Close handlers and release the key, so a long running process does not keep one by log"""
+        try:
+            for handler in handlers:
+                try:
+                    handler.close(self.key)
+                except Exception:
+                    logging.exception("Log handler not closed: %s", self.key)
+        finally:
+            _manager.remove(self.key)
 
 
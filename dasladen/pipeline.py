@@ -0,0 +1,132 @@
+"""
+Pipeline Module
+Move rows between threads through bounded queues of row batches
+
+External Dependencies:
+- petl : (c) 2012 Alistair Miles - MIT License (https://pypi.python.org/pypi/petl/)
+
+Features:
+- Batches of rows from a table
+- Table view of a queue of batches, consumed once
+- Fan out of a table into many queue views
+- Consumer threads that report errors and never block the producer
+- Abort marker, so consumers fail (and roll back) when the producer failed
+- Row counter view
+
+"""
+
+import time
+import threading
+import traceback
+
+from itertools import islice
+
+import petl as etl
+
+from . import compat
+
+
+# end of a queue when the producer failed, the view raises SourceFailed instead of ending
+ABORT = object()
+
+
+class SourceFailed(Exception):
+    """Producer of a queue view failed before the end of rows"""
+
+
+def batches(it, size):
+    """Split an iterator of rows into lists of size rows"""
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            break
+        yield batch
+
+
+class CountView(etl.Table):
+    """Pass rows through, calling done with the number of data rows at the end"""
+
+    def __init__(self, table, done):
+        self.table = table
+        self.done = done
+
+    def __iter__(self):
+        count = -1
+        try:
+            for row in self.table:
+                count += 1
+                yield row
+        finally:
+            self.done(max(count, 0))
+
+
+class QueueView(etl.Table):
+    """Table view of row batches taken from a queue until a None batch (or ABORT). It can be iterated once"""
+
+    def __init__(self, header, queue):
+        self.header = tuple(header)
+        self.queue = queue
+        self.done = False
+        self.wait = 0.0
+
+    def __iter__(self):
+        yield self.header
+        while not self.done:
+            start = time.time()
+            batch = self.queue.get()
+            self.wait += time.time() - start
+            if batch is None:
+                self.done = True
+                break
+            if batch is ABORT:
+                self.done = True
+                raise SourceFailed(u"Source failed before the end of rows")
+            for row in batch:
+                yield row
+
+    def drain(self):
+        """Discard remaining batches, so producer does not block on a full queue"""
+        while not self.done:
+            if self.queue.get() in (None, ABORT):
+                self.done = True
+
+
+class Fanout(object):
+    """Copy each batch of rows into a bounded queue per consumer"""
+
+    def __init__(self, header, count, depth):
+        self.header = header
+        self.queues = [compat.queue.Queue(depth) for _ in range(count)]
+        self.views = [QueueView(header, q) for q in self.queues]
+        self.failed = [False] * count
+
+    def put(self, batch):
+        for i, q in enumerate(self.queues):
+            if not self.failed[i]:
+                q.put(batch)
+
+    def close(self, failed=False):
+        """End of rows, or ABORT to every queue when the producer failed"""
+        for q in self.queues:
+            q.put(ABORT if failed else None)
+
+
+class Consumer(threading.Thread):
+    """Thread that runs work over a queue view, keeping the error to the producer"""
+
+    def __init__(self, view, work, on_fail=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.view = view
+        self.work = work
+        self.on_fail = on_fail
+        self.error = None
+
+    def run(self):
+        try:
+            self.work(self.view)
+        except Exception:
+            self.error = traceback.format_exc()
+            if self.on_fail:
+                self.on_fail()
+            self.view.drain()
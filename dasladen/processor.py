@@ -14,20 +14,24 @@ Features:
 - Schedule task to later execution and recurring execution
 - Capture new files on capture folder
 - Process captured files
+- Claim captured files with a lease when the capture folder is shared by several nodes,
+  a task file together with the data files it reads
 
 """
 
 import traceback
-import zipfile
 import logging
 
 import schedule
 from shutil import copy2
-from backports import tempfile
 
+from . import compat
 from .log import Logger, get_time_filename
+from .claim import ClaimQueue
 from .taskrun import *
 
+zipfile = compat.LazyModule("zipfile")
+
 
 class SchedulerJob(object):
     """Job information for scheduler processor"""
@@ -65,7 +69,7 @@ class Scheduler(object):
     def enqueue(runner, filename):
         result = ""
         # get schedule info in task file
-        props = runner.schedule()
+        props = runner.schedule
         recurring = props.get("recurring", False)
         manager = TaskRunner(runner)
         job_item = SchedulerJob(manager, filename, not recurring)
@@ -139,9 +143,10 @@ class Scheduler(object):
 class TaskProcessor(object):
     """Main processor for task files. Take a task file and process they entries"""
 
-    def __init__(self, files, log):
+    def __init__(self, files, log, archive=None):
         self.log = log
         self.files = files
+        self.archive = archive
 
     def selection(self):
         return [f for f in self.files if f.endswith('.json')]
@@ -151,6 +156,8 @@ class TaskProcessor(object):
         f = "{}/{}".format(path, filename)
         try:
             r = Runner(f)
+            if self.archive:
+                r.use_archive(*self.archive)
             if r.has_schedule:
                 props = r.schedule
                 if "times" in props:
@@ -183,7 +190,8 @@ class TaskProcessor(object):
 
         finally:
             self.log.write("Finished: {0}, elapsed: {1:.2f}s".format(filename, (time.time() - start)))
-            os.remove(f)
+            if os.path.isfile(f):
+                os.remove(f)
 
 
 def parse_to_int(value, fail=None):
@@ -227,12 +235,13 @@ class CopyProcessor(object):
 
 
 class ExtractProcessor(object):
-    """Extract zip files"""
+    """Extract zip files. Members read by task sources are kept in the zip, moved to input folder"""
 
     def __init__(self, files, log):
         self.log = log
         self.files = files
         self.target = ''
+        self.archive = None
 
     def set_target(self, target):
         self.target = target
@@ -240,17 +249,43 @@ class ExtractProcessor(object):
     def selection(self):
         return [f for f in self.files if f.endswith('.zip')]
 
+    def _lazy_members(self, z):
+        """Members that tasks in the zip read as source files. Json members that are not
+        task files are skipped, they are extracted as the other files"""
+        names = z.namelist()
+        members = set()
+        for name in names:
+            if name.endswith('.json'):
+                try:
+                    with z.open(name) as f:
+                        config = json.loads(f.read().decode('utf-8'))
+                    if isinstance(config, dict):
+                        members.update([m for m in Runner.zip_sources(config) if m in names])
+                except (ValueError, TypeError, AttributeError) as e:
+                    self.log.write("Skipping member: {}, not a task file ({})".format(name, e))
+        return members
+
     def execute(self, path, filename):
         start = time.time()
         source_file = "{}/{}".format(path, filename)
         target = self.target if self.target != '' else path
+        self.archive = None
         try:
             self.log.write("Extracting: {} into '{}'".format(filename, target))
             z = zipfile.ZipFile(source_file)
-            z.extractall(target)
+            lazy = self._lazy_members(z)
+            z.extractall(target, [m for m in z.namelist() if m not in lazy])
             z.close()
-            self.log.write("Removing ZIP: {}".format(filename))
-            os.remove(source_file)
+            if lazy:
+                self.log.write("Moving ZIP: {} to 'input', {} member(s) read on demand".format(filename, len(lazy)))
+                archive_file = "input/{}".format(filename)
+                if os.path.isfile(archive_file):
+                    os.remove(archive_file)
+                os.rename(source_file, archive_file)
+                self.archive = (filename, lazy)
+            else:
+                self.log.write("Removing ZIP: {}".format(filename))
+                os.remove(source_file)
         except Exception:
             self.log.write("Error: {}".format(traceback.format_exc()))
         finally:
@@ -274,6 +309,7 @@ class ZipFilesProcessor(object):
 
     # noinspection PyUnusedLocal
     def execute(self, path, filename):
+        from backports import tempfile
         extract = ExtractProcessor(self.files, self.log)
         try:
             for zip_file in extract.selection():
@@ -284,7 +320,7 @@ class ZipFilesProcessor(object):
                         extract.execute(path, zip_file)
                         files = [f for f in os.listdir(temp_folder)]
                         _process(CopyProcessor(files, self.log), temp_folder)
-                        _process(TaskProcessor(files, self.log), temp_folder)
+                        _process(TaskProcessor(files, self.log, extract.archive), temp_folder)
                     except Exception:
                         self.log.write("Error: {}".format(traceback.format_exc()))
                     finally:
@@ -296,45 +332,106 @@ class ZipFilesProcessor(object):
 
 
 class Watcher(object):
-    """Watch a folder to capture files and process task on it"""
+    """Watch a folder to capture files and process task on it.
+    With claims (ClaimQueue) files are processed only by the node that claimed them"""
 
-    def __init__(self, path):
+    def __init__(self, path, claims=None):
         self.path = path
+        self.claims = claims
         self.before = dict([(f, None) for f in os.listdir(path)])
+        if claims:
+            claims.start()
+            logging.info(u"Watcher node '{}', lease {}s".format(claims.node, claims.lease))
         logging.info(u"Watcher started on '{}'".format(path))
 
-    def _process(self, processor):
+    def _process(self, processor, path=None):
         for f in processor.selection():
-            processor.execute(self.path, f)
+            processor.execute(path or self.path, f)
 
-    def _process_list(self, file_list, file_type_log):
+    def _process_list(self, file_list, file_type_log, path=None):
         """first unzip, then copy and finally execute tasks"""
         with Logger('{}_{}'.format(file_type_log, get_time_filename())) as log:
             log.write("Starting...")
-            self._process(ZipFilesProcessor(file_list, log))
-            self._process(CopyProcessor(file_list, log))
-            self._process(TaskProcessor(file_list, log))
+            if self.claims:
+                log.write("Claimed by node: {}".format(self.claims.node))
+            self._process(ZipFilesProcessor(file_list, log), path)
+            self._process(CopyProcessor(file_list, log), path)
+            self._process(TaskProcessor(file_list, log), path)
+
+    @staticmethod
+    def _input_files(task_file):
+        """files read by the tasks of task_file, None when the file is gone (claimed by a node)"""
+        try:
+            with compat.open(task_file, 'r', encoding='utf-8') as fp:
+                config = json.load(fp)
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            return []
+        return Runner.input_files(config) if isinstance(config, dict) else []
+
+    def _drops(self, file_list):
+        """split files into drops claimed as one unit: zip files, other files alone, then each task file
+        with the files on the list that its tasks read"""
+        tasks = sorted([f for f in file_list if f.endswith('.json')])
+        inputs = dict([(f, self._input_files(os.path.join(self.path, f))) for f in tasks])
+        # listed after reading, a task file moved from capture is on a claim folder by now.
+        # Its node claims the files it reads, they are not claimed alone
+        held = set()
+        for path in self.claims.claimed():
+            if path.endswith('.json'):
+                held.update(self._input_files(path) or [])
+        grouped = set()
+        task_drops = []
+        for f in tasks:
+            files = [i for i in inputs[f] or [] if i in file_list and i not in tasks and i not in grouped]
+            grouped.update(files)
+            task_drops.append([f] + files)
+        others = sorted([f for f in file_list if f not in grouped and f not in held and f not in tasks],
+                        key=lambda name: not name.endswith('.zip'))
+        return [[f] for f in others] + task_drops
+
+    def _process_claims(self, file_list, file_type_log):
+        """claim and process one drop at a time, other nodes take the rest"""
+        for drop in self._drops([f for f in file_list if not self.claims.is_claim(f)]):
+            files = self.claims.claim_drop(drop)
+            if not files:
+                continue
+            try:
+                self._process_list(files, file_type_log, self.claims.folder)
+            finally:
+                self.claims.release(files)
 
     def _process_file_list(self, file_list):
-        self._process_list(file_list, "watcher")
+        if self.claims:
+            self._process_claims(file_list, "watcher")
+        else:
+            self._process_list(file_list, "watcher")
 
     def process_file(self, path):
         path_name = os.path.split(path)
         try:
             target = '{}/{}'.format(self.path, path_name[1])
             copy2(path, target)
-            self._process_list([path_name[1]], "task")
+            if self.claims:
+                self._process_claims([path_name[1]], "task")
+            else:
+                self._process_list([path_name[1]], "task")
         except Exception:
             logging.error("Error: {}".format(traceback.format_exc()))
 
     def check(self):
-        after = dict([(f, None) for f in os.listdir(self.path)])
+        if self.claims:
+            self.claims.reclaim()
+        after = dict([(f, None) for f in os.listdir(self.path) if not ClaimQueue.is_claim(f)])
         added = [f for f in after if f not in self.before]
 
         # on add, process files on that order
         if added:
             self._process_file_list(added)
 
-        self.before = after
-
-
+        if self.claims:
+            # files left by other nodes stay as added until some node claims them
+            self.before = dict([(f, None) for f in self.before if f in after])
+        else:
+            self.before = after
@@ -0,0 +1,196 @@
+"""
+Reader Module
+Streaming sources for tasks
+
+External Dependencies:
+- petl : (c) 2012 Alistair Miles - MIT License (https://pypi.python.org/pypi/petl/)
+- openpyxl: (c) 2010 openpyxl - MIT License (https://pypi.org/project/openpyxl/)
+
+Features:
+- XLSX sheet reader in read only mode (rows are streamed from the workbook)
+- Workbook opened once for many sheets
+- XML reader with iterparse, processed elements are dropped to keep memory flat
+
+"""
+
+from collections import deque
+
+import petl as etl
+from petl.io.sources import read_source_from_arg
+
+try:
+    from xml.etree import cElementTree as etree
+except ImportError:
+    from xml.etree import ElementTree as etree
+try:
+    import openpyxl
+except ImportError:
+    pass
+
+
+class XlsxWorkbook(object):
+    """Open a xlsx workbook once in read only mode and give views of its sheets"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.workbook = None
+
+    def __enter__(self):
+        self.workbook = openpyxl.load_workbook(self.filename, read_only=True, data_only=True)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.workbook.close()
+        self.workbook = None
+
+    def sheet(self, sheet=None):
+        return XlsxView(self.filename, sheet, self.workbook)
+
+
+class XlsxView(etl.Table):
+    """Table view of a xlsx sheet, rows are read on demand"""
+
+    def __init__(self, filename, sheet=None, workbook=None):
+        self.filename = filename
+        self.sheet = sheet
+        self.workbook = workbook
+
+    def __iter__(self):
+        wb = self.workbook
+        if wb is None:
+            wb = openpyxl.load_workbook(self.filename, read_only=True, data_only=True)
+        try:
+            if self.sheet is None:
+                ws = wb.worksheets[0]
+            elif isinstance(self.sheet, int):
+                ws = wb.worksheets[self.sheet]
+            else:
+                ws = wb[self.sheet]
+            for row in ws.iter_rows(values_only=True):
+                yield tuple(row)
+        finally:
+            if self.workbook is None:
+                wb.close()
+
+
+def _path_steps(path):
+    """Steps of a row path relative to the root, as (tag, at any depth) pairs. Supports the
+    ElementPath subset of tags, '{ns}tag', '*', '.' and '//'"""
+    parts, part, depth = [], u"", 0
+    for c in path[1:] if path.startswith("/") else path:
+        if c == "/" and depth == 0:
+            parts.append(part)
+            part = u""
+            continue
+        depth += 1 if c == "{" else -1 if c == "}" else 0
+        part += c
+    parts.append(part)
+    steps = []
+    anywhere = False
+    for part in parts:
+        if part == "":
+            anywhere = True
+        elif part == ".":
+            continue
+        elif "[" in part or part.startswith("@") or part == "..":
+            raise ValueError(u"Row path '{}' not supported on stream, use tags, '*' and '//'".format(path))
+        else:
+            steps.append((part, anywhere))
+            anywhere = False
+    if not steps:
+        raise ValueError(u"Row path '{}' matches no element".format(path))
+    return steps
+
+
+def _path_match(steps, tags):
+    """True when tags (from a child of the root to the element) match all steps"""
+    if not steps:
+        return not tags
+    (name, anywhere), rest = steps[0], steps[1:]
+    for i in range(len(tags) if anywhere else min(1, len(tags))):
+        if (name == "*" or name == tags[i]) and _path_match(rest, tags[i + 1:]):
+            return True
+    return False
+
+
+class XmlIterView(etl.Table):
+    """Table view of a xml file parsed incrementally. Rows are the elements that match the row path
+    from the root, in document order, as petl fromxml (iterfind) finds them.
+    Values are found like petl fromxml: a value path (of elements or its attribute) or a mapping"""
+
+    def __init__(self, source, row_match, value_match=None, attr=None, mapping=None, missing=None):
+        self.source = read_source_from_arg(source)
+        self.row_steps = _path_steps(row_match)
+        self.value_match = value_match
+        self.attr = attr
+        self.mapping = mapping
+        self.missing = missing
+
+    def _getter(self, path, attr):
+        missing = self.missing
+
+        def _get(elm):
+            values = elm.findall(path)
+            values = [v.text if attr is None else v.get(attr) for v in values]
+            if len(values) > 1:
+                return tuple(values)
+            return values[0] if values else missing
+        return _get
+
+    def _values(self, elm):
+        paths = [self.value_match] if not isinstance(self.value_match, (list, tuple)) else self.value_match
+        for path in paths:
+            for v in elm.findall(path):
+                yield v.text if self.attr is None else v.get(self.attr)
+
+    def __iter__(self):
+        if self.mapping:
+            fields = tuple(sorted(self.mapping.keys()))
+            getters = []
+            for f in fields:
+                match = self.mapping[f]
+                if isinstance(match, (list, tuple)):
+                    getters.append(self._getter(match[0], match[1]))
+                else:
+                    getters.append(self._getter(match, None))
+            yield fields
+            make_row = lambda e: tuple(get(e) for get in getters)
+        else:
+            make_row = lambda e: tuple(self._values(e))
+
+        with self.source.open('rb') as xmlf:
+            parents = []
+            tags = []
+            matched = []
+            # rows in document order, a row waits for the rows that contain it
+            pending = deque()
+            open_rows = 0
+            for event, elm in etree.iterparse(xmlf, events=("start", "end")):
+                if event == "start":
+                    parents.append(elm)
+                    if len(parents) > 1:
+                        tags.append(elm.tag)
+                    is_row = len(parents) > 1 and _path_match(self.row_steps, tags)
+                    matched.append(is_row)
+                    if is_row:
+                        pending.append([elm, None])
+                        open_rows += 1
+                    continue
+                parents.pop()
+                if parents:
+                    tags.pop()
+                if matched.pop():
+                    open_rows -= 1
+                    for entry in reversed(pending):
+                        if entry[0] is elm:
+                            entry[1] = make_row(elm)
+                            break
+                    while pending and pending[0][1] is not None:
+                        yield pending.popleft()[1]
+                if open_rows > 0:
+                    # part of a row still open
+                    continue
+                # drop processed element from the tree
+                elm.clear()
+                if parents:
+                    parents[-1].remove(elm)
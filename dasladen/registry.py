@@ -0,0 +1,75 @@
+"""
+Registry Module
+Names of task types and drivers mapped to classes loaded on first use
+
+Features:
+- Built-in entries as "module:Class" strings, imported only when used
+- Plugins from entry points of the dasladen.tasks and dasladen.drivers groups
+- Register classes at runtime
+
+"""
+
+import importlib
+import threading
+
+from . import compat
+
+
+def _entry_points(group):
+    """Entry points of group as (name, loader) pairs"""
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+    if metadata is not None:
+        eps = metadata.entry_points()
+        eps = eps.select(group=group) if hasattr(eps, "select") else eps.get(group, [])
+        return [(ep.name, ep.load) for ep in eps]
+    try:
+        import pkg_resources
+    except ImportError:
+        return []
+    return [(ep.name, ep.load) for ep in pkg_resources.iter_entry_points(group)]
+
+
+class Registry(object):
+    """Map names to classes. An entry is a class or a "module:Class" string imported on first get.
+    Entry points of group are looked up only for names not registered"""
+
+    def __init__(self, group, entries=None):
+        self.group = group
+        self._entries = dict(entries or {})
+        self._plugins = None
+        self._lock = threading.Lock()
+
+    def register(self, name, target):
+        with self._lock:
+            self._entries[name] = target
+
+    def __contains__(self, name):
+        return name in self._entries or name in self._load_plugins()
+
+    def names(self):
+        return sorted(set(self._entries) | set(self._load_plugins()))
+
+    def _load_plugins(self):
+        if self._plugins is None:
+            self._plugins = dict(_entry_points(self.group))
+        return self._plugins
+
+    def get(self, name):
+        """Return the class for name, None if not found"""
+        with self._lock:
+            target = self._entries.get(name, None)
+            if target is None:
+                loader = self._load_plugins().get(name, None)
+                if loader is None:
+                    return None
+                target = loader()
+            elif not isinstance(target, compat.string_types):
+                return target
+            else:
+                module_name, class_name = target.split(":", 1)
+                target = getattr(importlib.import_module(module_name), class_name)
+            self._entries[name] = target
+            return target
@@ -0,0 +1,135 @@
+"""
+Script Module
+Split SQL scripts into statements
+
+Features:
+- Quotes, quoted identifiers and comments are skipped when looking for the end of a statement
+- PostgreSQL dollar quoted bodies ($$ or $tag$)
+- MySQL DELIMITER command and # comments
+- MSSQL batches separated by GO lines
+- Oracle PL/SQL blocks ended by a / line
+
+"""
+
+import re
+
+_GO = re.compile(r"^\s*GO(\s+\d+)?\s*$", re.IGNORECASE)
+_SLASH = re.compile(r"^\s*/\s*$")
+_DELIMITER = re.compile(r"^\s*DELIMITER\s+(\S+)\s*$", re.IGNORECASE)
+_PLSQL = re.compile(r"^\s*(DECLARE|BEGIN|CREATE\s+(OR\s+REPLACE\s+)?"
+                    r"((EDITIONABLE|NONEDITIONABLE)\s+)?(PROCEDURE|FUNCTION|PACKAGE|TRIGGER|TYPE|LIBRARY))\b",
+                    re.IGNORECASE)
+_DOLLAR = re.compile(r"\$([A-Za-z_][A-Za-z_0-9]*)?\$")
+
+
+def _strip_comments(sql, dialect=None):
+    comments = r"/\*.*?\*/|--[^\n]*|#[^\n]*" if dialect == "mysql" else r"/\*.*?\*/|--[^\n]*"
+    return re.sub(comments, "", sql, flags=re.DOTALL).strip()
+
+
+def _split_mssql(script):
+    """T-SQL batches are sent whole, GO n repeats a batch n times"""
+    statements, lines = [], []
+    for line in script.splitlines():
+        match = _GO.match(line)
+        if match:
+            batch = u"\n".join(lines).strip()
+            if _strip_comments(batch):
+                statements.extend([batch] * int(match.group(1) or 1))
+            lines = []
+        else:
+            lines.append(line)
+    batch = u"\n".join(lines).strip()
+    if _strip_comments(batch):
+        statements.append(batch)
+    return statements
+
+
+def _split(script, dialect):
+    """Scan the script char by char, tracking quotes and comments"""
+    statements = []
+    current = []
+    delimiter = u";"
+    i, n = 0, len(script)
+    line_start = True
+    plsql = False
+
+    def flush(keep=u""):
+        sql = (u"".join(current) + keep).strip()
+        del current[:]
+        if _strip_comments(sql, dialect):
+            statements.append(sql)
+
+    while i < n:
+        c = script[i]
+        if line_start:
+            end = script.find(u"\n", i)
+            end = n if end < 0 else end
+            line = script[i:end]
+            if dialect == "mysql" and _DELIMITER.match(line):
+                flush()
+                delimiter = _DELIMITER.match(line).group(1)
+                i = end + 1
+                continue
+            if dialect == "oracle":
+                if _SLASH.match(line):
+                    # ends the PL/SQL block or statement above; after a statement already ended
+                    # by the delimiter it adds nothing, the statement is not run twice as in sqlplus
+                    flush()
+                    plsql = False
+                    i = end + 1
+                    continue
+                if not _strip_comments(u"".join(current), dialect) and _PLSQL.match(line):
+                    plsql = True
+        line_start = False
+
+        if c == u"\n":
+            line_start = True
+            current.append(c)
+            i += 1
+        elif c in u"'\"`" or (c == u"[" and dialect == "mssql"):
+            close = u"]" if c == u"[" else c
+            j = i + 1
+            while j < n:
+                if script[j] == close:
+                    if j + 1 < n and script[j + 1] == close:
+                        j += 2
+                        continue
+                    break
+                if script[j] == u"\\" and dialect == "mysql" and c != u"`":
+                    j += 1
+                j += 1
+            current.append(script[i:j + 1])
+            i = j + 1
+        elif script.startswith(u"--", i) or (c == u"#" and dialect == "mysql"):
+            end = script.find(u"\n", i)
+            end = n if end < 0 else end
+            current.append(script[i:end])
+            i = end
+        elif script.startswith(u"/*", i):
+            end = script.find(u"*/", i + 2)
+            end = n if end < 0 else end + 2
+            current.append(script[i:end])
+            i = end
+        elif c == u"$" and dialect == "postgresql" and _DOLLAR.match(script, i):
+            tag = _DOLLAR.match(script, i).group(0)
+            end = script.find(tag, i + len(tag))
+            end = n if end < 0 else end + len(tag)
+            current.append(script[i:end])
+            i = end
+        elif script.startswith(delimiter, i) and not plsql:
+            flush()
+            i += len(delimiter)
+        else:
+            current.append(c)
+            i += 1
+    flush()
+    return statements
+
+
+def split_sql(script, dialect=None):
+    """Split a script into statements without the ending delimiter.
+    dialect is one of oracle, mssql, mysql or postgresql"""
+    if dialect == "mssql":
+        return _split_mssql(script)
+    return _split(script, dialect)
@@ -5,6 +5,7 @@ Task Module
 External Dependencies:
 - petl : (c) 2012 Alistair Miles - MIT License (https://pypi.python.org/pypi/petl/)
 - xlrd : (c) 2005-2018 Stephen John Machin, Lingfo Pty Ltd. (https://pypi.org/project/xlrd/)
+- openpyxl: (c) 2010 openpyxl - MIT License (https://pypi.org/project/openpyxl/)
 - ftputil: (c) 2017 Stefan Schwarzer and contributors (https://pypi.org/project/ftputil/)
 
 Features:
@@ -13,30 +14,65 @@ Features:
 - DB -> DB task
 - CSV -> CSV task
 - XLS -> CSV task
+- XLS -> DB task
 - XML -> DB task
 - XML -> CSV task
 - FTP Upload task
 - ZIP task
 - UNZIP task
 - Python Module task
-- SQL task
+- SQL task (scripts of many statements, parallel groups)
 - Download task
+- Tee task (one source into many targets)
+- Foreach block to run a task once for each set of params
+- Remove transforms of db sources pushed down into the query, and filters where opted in
+- Governor of sessions by connection (max_concurrent) and tasks by task file (max_parallel)
 
 """
 
+import io
 import os
 import sys
+import csv
+import json
+import glob
+import time
+import gzip
+import shutil
+import re
+import ast
+import copy
+import threading
+import itertools
+import traceback
 
-import petl as etl
-import ftputil
-import zipfile
 import importlib
-from requests import get
+from tempfile import mkstemp
 
 from . import compat
 from .log import get_time_filename
+from .cache import LookupCache
+from .registry import Registry
+from .governor import Governor, Reservation
 from .taskdriver import *
 
+# imported on first use, so a run loads only what its tasks need
+etl = compat.LazyModule("petl")
+ftputil = compat.LazyModule("ftputil")
+ftputil_session = compat.LazyModule("ftputil.session")
+requests = compat.LazyModule("requests")
+multiprocessing = compat.LazyModule("multiprocessing")
+multiprocessing_pool = compat.LazyModule("multiprocessing.pool")
+tempfile = compat.LazyModule("backports.tempfile")
+stage = compat.LazyModule("dasladen.transform")
+pipeline = compat.LazyModule("dasladen.pipeline")
+reader = compat.LazyModule("dasladen.reader")
+loader = compat.LazyModule("dasladen.loader")
+writer = compat.LazyModule("dasladen.writer")
+script = compat.LazyModule("dasladen.script")
+archive = compat.LazyModule("dasladen.archive")
+zipfile = compat.LazyModule("zipfile")
+
 
 class Connection(object):
     def __init__(self, config):
@@ -50,9 +86,54 @@ class Connection(object):
         raise KeyError()
 
 
+def task_sessions(task):
+    """Sessions by connection name that a task item opens at same time: one for each node with a
+    connection (source, target, tee targets, lookups), sql-exec parallel groups one each"""
+    counts = {}
+
+    def walk(node):
+        if isinstance(node, dict):
+            name = node.get("connection", None)
+            if isinstance(name, compat.string_types):
+                counts[name] = counts.get(name, 0) + 1
+            for key, value in node.items():
+                # foreach query runs before its instances
+                if key != "foreach":
+                    walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(task)
+    groups = len(task.get("source", {}).get("parallel_groups", []))
+    if task.get("type") == "sql-exec" and groups and "connection" in task.get("target", {}):
+        name = task["target"]["connection"]
+        parallel = int(task["source"].get("parallel", groups))
+        counts[name] = max(counts.get(name, 0), min(parallel, groups))
+    return counts
+
+
 class DriverFactory(object):
-    def __init__(self, config):
+    """Drivers of the dasladen.drivers registry. Plugins add drivers with entry points on that group"""
+
+    _drivers = Registry("dasladen.drivers", {
+        "MySQL": "dasladen.taskdriver:MySQLDriver",
+        "Oracle": "dasladen.taskdriver:OracleDriver",
+        "MSSQL": "dasladen.taskdriver:MSSQLDriver",
+        "PostgreSQL": "dasladen.taskdriver:PostgreSQLDriver"
+    })
+
+    # limits of connections and task files, shared by all runs of the process
+    governor = Governor()
+    # slots taken for a task item, see reserve
+    reservation = None
+
+    def __init__(self, config, lookups=None, log=None):
         self._connections = Connection(config)
+        # lookup indexes shared by tasks of a run
+        self.lookups = lookups if lookups is not None else LookupCache()
+        # log of queue waits on the governor
+        self.log = log
 
     def get_connection(self, name):
         return self._connections.get_connection(name)
@@ -68,21 +149,61 @@ class DriverFactory(object):
                 value = compat.translate_unicode(value)
                 os.environ[key] = value
         # select driver 
-        if item["driver"] == "MySQL":
-            return MySQLDriver(item)
-        elif item["driver"] == "Oracle":
-            return OracleDriver(item)
-        elif item["driver"] == "MSSQL":
-            return MSSQLDriver(item)
-        elif item["driver"] == "PostgreSQL":
-            return PostgreSQLDriver(item)
-        
-        raise NotImplementedError    
+        driver_class = self._drivers.get(item["driver"])
+        if driver_class is None:
+            raise NotImplementedError
+        driver = driver_class(item)
+        slot = self._connection_slot(item)
+        if slot is not None:
+            driver.slot = slot
+            driver.sessions = self.reservation or self.governor
+            driver.log = self.log
+        return driver
+
+    def _connection_slot(self, item):
+        """Slot of a connection with max_concurrent, keyed by server, database and user:
+        connections with other names to the same database share it"""
+        if "max_concurrent" not in item:
+            return None
+        key = u"connection {}://{}@{}:{}/{}".format(item.get("driver"), item.get("user"), item.get("host"),
+                                                    item.get("port"), item.get("service", item.get("database")))
+        return self.governor.slot(key, item["max_concurrent"])
+
+    def reserve(self, task, filename=None, max_parallel=None):
+        """Factory for a run of a task item, holding at once the slot of its task file (max_parallel)
+        and the sessions it opens at same time on connections with max_concurrent"""
+        needs = {}
+        if max_parallel:
+            needs[self.governor.slot(u"task file {}".format(filename), max_parallel)] = 1
+        for name, count in task_sessions(task).items():
+            try:
+                slot = self._connection_slot(self.get_connection(name))
+            except KeyError:
+                continue  # the task reports it
+            if slot is not None:
+                needs[slot] = needs.get(slot, 0) + count
+        factory = copy.copy(self)
+        factory.reservation = Reservation(self.governor, needs)
+        factory.reservation.acquire(self.log)
+        return factory
+
+    def release(self):
+        if self.reservation is not None:
+            self.reservation.release()
+
+    @staticmethod
+    def register(name, driver_class):
+        DriverFactory._drivers.register(name, driver_class)
 
 
 class BaseTask(object):
     """Base class for tasks"""
 
+    # rows and bytes written, kept on run history
+    rows_written = None
+    bytes_written = None
+    _metrics_lock = threading.Lock()
+
     def run(self, driver, task, log):
         """Run Forrest, run
         :param driver: driver factory
@@ -91,26 +212,158 @@ class BaseTask(object):
         """
         raise NotImplementedError("implement it")
 
-    def _parse_sql(self, task_node):
+    def _add_metrics(self, rows=None, size=None):
+        with self._metrics_lock:
+            if rows is not None:
+                self.rows_written = (self.rows_written or 0) + rows
+            if size is not None:
+                self.bytes_written = (self.bytes_written or 0) + size
+
+    def _counted(self, record_set):
+        return pipeline.CountView(record_set, lambda n: self._add_metrics(rows=n))
+
+    def _add_file_size(self, out, before=0):
+        if os.path.isfile(out):
+            self._add_metrics(size=os.path.getsize(out) - before)
+
+    # query files by path, with modified time when read
+    _queries = {}
+    _queries_lock = threading.Lock()
+
+    def _read_query(self, input_query):
+        mtime = os.path.getmtime(input_query)
+        with self._queries_lock:
+            cached = self._queries.get(input_query, None)
+            if cached is None or cached[0] != mtime:
+                with open(input_query, "r") as q:
+                    cached = (mtime, u" ".join(q.readlines()))
+                self._queries[input_query] = cached
+            return cached[1]
+
+    def _sql_text(self, task_node):
         sql = u''
         if isinstance(task_node, dict):
             if "command" in task_node:
                 sql = task_node["command"]
             elif "query" in task_node:
                 path = task_node.get("path", "input")
-                input_query = u"{}/{}".format(path, task_node["query"])
-                with open(input_query, "r") as q:
-                    sql = reduce(lambda x, y: u"{} {}".format(x, y), q.readlines())
+                sql = self._read_query(u"{}/{}".format(path, task_node["query"]))
+        return sql
+
+    def _parse_sql(self, task_node):
+        sql = self._sql_text(task_node)
+        if isinstance(task_node, dict):
             sql = sql.format(**task_node["params"]) if "params" in task_node else sql
 
         sql = sql[:-1] if sql.endswith(";") else sql
         return sql
 
+    def _parse_query(self, task_node, db_driver):
+        """Return SQL and its args. With bind, params are passed as bind variables of the driver
+        instead of formatted into the SQL, so the database reuses the parsed statement"""
+        if not (isinstance(task_node, dict) and task_node.get("bind", False) and "params" in task_node):
+            return self._parse_sql(task_node), None
+        sql = self._sql_text(task_node).rstrip()
+        sql = sql[:-1] if sql.endswith(";") else sql
+        return db_driver.bind_sql(sql, task_node["params"])
+
+    # noinspection PyMethodMayBeStatic
+    def _from_db(self, db, sql, args=None):
+        return etl.fromdb(db, sql) if args is None else etl.fromdb(db, sql, args)
+
+    # noinspection PyMethodMayBeStatic
+    def _source_file(self, source_node, default_folder="input"):
+        """Return the source file path, or a zip member source for 'archive.zip!member' or 'zip_member'"""
+        folder = source_node.get("folder", default_folder)
+        folder = compat.translate_unicode(folder)
+        name = source_node["file"]
+        name = compat.translate_unicode(name)
+        member = source_node.get("zip_member", None)
+        if member is None and "!" in name:
+            name, member = name.split("!", 1)
+        path = "{}/{}".format(folder, name)
+        if member is None:
+            return path
+        # stream the decompressed member instead of extracting it
+        return etl.ZipSource(path, compat.translate_unicode(member))
+
+    def _from_xml(self, source_node):
+        inp = self._source_file(source_node)
+        row_match = source_node.get("row", None)
+        value_match = source_node.get("value", None)
+        attr = source_node.get("attr", None)
+        mapping = source_node.get("mapping", None)
+
+        if source_node.get("stream", False):
+            if row_match and (value_match or mapping):
+                return reader.XmlIterView(inp, row_match, value_match, attr, mapping)
+        elif row_match and value_match:
+            if attr:
+                return etl.fromxml(inp, row_match, value_match, attr)
+            else:
+                return etl.fromxml(inp, row_match, value_match)
+        elif row_match and mapping:
+            return etl.fromxml(inp, row_match, mapping)
+
+        raise ValueError('Incorrect parameter for source')
+
+    def _write_csv(self, record_set, target_node, log_name):
+        fld = target_node.get("folder", "output")
+        fld = compat.translate_unicode(fld)
+        target = target_node["file"]
+        target = compat.translate_unicode(target)
+        out = "{}/{}".format(fld, target)
+
+        separator = target_node.get("delimiter", ";")
+        separator = compat.translate_unicode(separator)
+        enc = target_node.get("encoding", "utf-8")
+
+        record_set = self._counted(record_set)
+        task_log = "log/{}_{}.log".format(log_name, get_time_filename())
+        with open(task_log, "w") as lg:
+            if "split" in target_node:
+                split = target_node["split"]
+                split_writer = writer.SplitCsvWriter(out, enc, separator, split.get("max_rows"), split.get("max_bytes"))
+                parts = split_writer.write(record_set.progress(10000, out=lg))
+                lg.write("{} part(s) written, manifest: {}\n".format(len(parts), split_writer.manifest))
+                self._add_metrics(size=sum([p["bytes"] for p in parts]))
+            elif "truncate" in target_node and target_node["truncate"]:
+                record_set.progress(10000, out=lg).tocsv(out, encoding=enc, delimiter=separator)
+                self._add_file_size(out)
+            else:
+                before = os.path.getsize(out) if os.path.isfile(out) else 0
+                record_set.progress(10000, out=lg).appendcsv(out, encoding=enc, delimiter=separator)
+                self._add_file_size(out, before)
+
+    def _write_db(self, record_set, driver, target_node, log_name, log=None, pipeline=False, source=None):
+        loader.DbLoader(driver, target_node, log_name, log, source).load(self._counted(record_set),
+                                                                  target_node.get("pipeline", pipeline))
+
+    # noinspection PyMethodMayBeStatic
+    def _list_files(self, path, patterns):
+        """Expand a file name, a glob pattern or a list of them into file names relative to path"""
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        files = []
+        for pattern in patterns:
+            pattern = compat.translate_unicode(pattern)
+            matches = sorted(glob.glob("{}/{}".format(path, pattern)))
+            if matches:
+                names = [os.path.relpath(f, path).replace(os.sep, "/") for f in matches if os.path.isfile(f)]
+            elif not glob.has_magic(pattern):
+                # keep plain names so a missing file fails on use
+                names = [pattern]
+            else:
+                names = []
+            files.extend([f for f in names if f not in files])
+        return files
+
 
 class TransformSubTask(object):
-    def __init__(self, task, log):
+    def __init__(self, task, log, driver=None):
         self.task = task
         self.log = log
+        self.driver = driver
 
     def _modules_transform(self, record_set):
         if "transforms" in self.task:
@@ -123,7 +376,7 @@ class TransformSubTask(object):
 
     # noinspection PyMethodMayBeStatic
     def _module_transform(self, record_set, transform=None):
-        if transform is not None:
+        if transform is not None and "module" in transform:
             module_name = transform["module"]
             package = transform.get("package", None)
             module_obj = importlib.import_module(module_name, package)
@@ -151,11 +404,16 @@ class TransformSubTask(object):
             if "filter" in transform:
                 record_set = etl.select(record_set, transform["filter"])
 
+            if "lookup" in transform:
+                lookups = transform["lookup"]
+                for item in (lookups if isinstance(lookups, list) else [lookups]):
+                    record_set = self._lookup_transform(record_set, item)
+
             if "remove" in transform:
                 cuts = []
                 for field in transform["remove"]:
                     cuts.append(field)
-                record_set = etl.cutout(record_set, cuts)
+                record_set = etl.cutout(record_set, *cuts)
 
             if "rename" in transform:
                 names = {}
@@ -163,6 +421,61 @@ class TransformSubTask(object):
                     names[old] = new_one
                 record_set = etl.rename(record_set, names)
 
+            record_set = self._sort_transform(record_set, transform)
+
+        return record_set
+
+    def _lookup_index(self, item):
+        source = item["source"]
+        if "connection" in source:
+            input_driver = self.driver.get_driver(source["connection"])
+            db = input_driver.get_db()
+            try:
+                base = BaseTask()
+                table = base._from_db(db, *base._parse_query(source, input_driver))
+                return stage.build_index(table, item["key"], item["values"])
+            finally:
+                db.close()
+        separator = source.get("delimiter", ";")
+        separator = compat.translate_unicode(separator)
+        enc = source.get("encoding", "utf-8")
+        enc = compat.translate_unicode(enc)
+        table = etl.fromcsv(BaseTask()._source_file(source), encoding=enc, delimiter=separator)
+        return stage.build_index(table, item["key"], item["values"])
+
+    def _lookup_transform(self, record_set, item):
+        """Join rows with a key index loaded once from a query or a csv file"""
+        name = item.get("name", None) or json.dumps([item["source"], item["key"], item["values"]], sort_keys=True)
+        start = time.time()
+        index, cached = self.driver.lookups.get(name, lambda: self._lookup_index(item), item.get("ttl", None))
+        self.log.write(u"Transform data with lookup {0}: {1} keys, {2} in {3:.2f}s".format(
+            item.get("name", item["values"]), len(index), "cached" if cached else "loaded", time.time() - start))
+        return stage.lookup(record_set, index, item.get("on", item["key"]), item["values"],
+                            item.get("default", None), item.get("inner", False))
+
+    def _sort_transform(self, record_set, transform):
+        """sort, distinct and dedupe_on stages, sorted on disk within 'spill' memory budget"""
+        spill = transform.get("spill", {})
+        spill = dict(memory_mb=spill.get("memory_mb", 64),
+                     compress=spill.get("compress", False),
+                     folder=spill.get("folder", None))
+        sort = transform.get("sort", None)
+        key, reverse = None, False
+        if isinstance(sort, dict):
+            key, reverse = sort.get("key", None), sort.get("reverse", False)
+        elif sort:
+            key = sort
+
+        if "dedupe_on" in transform:
+            self.log.write(u"Transform data with dedupe on {}".format(transform["dedupe_on"]))
+            record_set = stage.dedupe_on(record_set, transform["dedupe_on"], key, reverse, **spill)
+        elif transform.get("distinct", False):
+            self.log.write(u"Transform data with distinct")
+            record_set = stage.distinct(record_set, key, reverse, **spill)
+        elif key:
+            self.log.write(u"Transform data with sort on {}".format(key))
+            record_set = stage.sort(record_set, key, reverse, **spill)
+
         return record_set
 
     def get_result(self, record_set):
@@ -171,46 +484,277 @@ class TransformSubTask(object):
         return record_set
 
 
-class DbCsvTask(BaseTask):
+class PushdownSubTask(object):
+    """Move remove fields and a simple filter of a db source transform into its SQL.
+    The query is wrapped as a subquery selecting only kept fields, with the filter as WHERE.
+    A filter is pushed only with pushdown_filter on the source, as the database compares with its
+    own rules (collation, case, trailing spaces, numeric coercion), and when it is made of
+    {field} op literal terms joined by and, on fields not converted.
+    Module transforms, ORDER BY queries and unknown fields fall back to petl"""
 
-    def run(self, driver, task, log):
-        input_driver = driver.get_driver(task["source"]["connection"])
-        sql = self._parse_sql(task["source"])
-        db = input_driver.get_db()
-        record_set = etl.fromdb(db, sql)
-        if not etl.data(record_set).any():
-            log.write("Task skipped. No rows on source")
-        else:
-            transform = TransformSubTask(task, log)
-            record_set = transform.get_result(record_set)
+    _literal = r"(-?\d+(?:\.\d+)?|'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|None)"
+    _term = re.compile(r"\s*\{([^{}]+)\}\s*(==|!=|<=|>=|<|>)\s*" + _literal + r"\s*$")
+    _operators = {"==": u"=", "!=": u"<>", "<=": u"<=", ">=": u">=", "<": u"<", ">": u">"}
 
-            fld = task["target"].get("folder", "output")
-            fld = compat.translate_unicode(fld)
-            target = task["target"]["file"]
-            target = compat.translate_unicode(target)
-            out = "{}/{}".format(fld, target)
+    def __init__(self, task, log):
+        self.task = task
+        self.log = log
 
-            separator = task["target"].get("delimiter", ";")
-            separator = compat.translate_unicode(separator)
-            enc = task["target"].get("encoding", "utf-8")
+    @staticmethod
+    def _fields(expr):
+        return set(re.findall(r"\{([^{}]+)\}", expr))
+
+    def _filter_sql(self, expr, quote):
+        """SQL predicate of a petl select expression, None if it can't be translated"""
+        terms = []
+        for term in re.split(r"\s+and\s+", expr.strip()):
+            match = self._term.match(term)
+            if match is None:
+                return None
+            field, op, literal = match.groups()
+            value = ast.literal_eval(literal)
+            column = u"q.{}".format(quote(field))
+            if value is None:
+                if op not in ("==", "!="):
+                    return None
+                terms.append(u"{} IS {}NULL".format(column, u"" if op == "==" else u"NOT "))
+                continue
+            if isinstance(value, compat.string_types):
+                value = u"'{}'".format(value.replace(u"'", u"''"))
+            else:
+                value = repr(value)
+            if op == "!=":
+                # None != value is True on python
+                terms.append(u"({0} <> {1} OR {0} IS NULL)".format(column, value))
+            else:
+                terms.append(u"{} {} {}".format(column, self._operators[op], value))
+        return u" AND ".join(terms)
 
-            task_log = "log/db-csv_{}_{}.log".format(task["name"], get_time_filename())
-            with open(task_log, "w") as lg:
-                if "truncate" in task["target"] and task["target"]["truncate"]:
-                    record_set.progress(10000, out=lg).tocsv(out, encoding=enc, delimiter=separator)
+    # noinspection PyMethodMayBeStatic
+    def _columns(self, db, sql, args):
+        cur = db.cursor()
+        try:
+            probe = u"SELECT * FROM ({}) q WHERE 1 = 0".format(sql)
+            if args is None:
+                cur.execute(probe)
+            else:
+                cur.execute(probe, args)
+            return [d[0] for d in cur.description]
+        finally:
+            cur.close()
+
+    def optimize(self, db, input_driver, sql, args=None):
+        """Return the SQL and the task with the transform stages left to petl"""
+        task = self.task
+        transform = task.get("transform", None)
+        if not task["source"].get("pushdown", True) or not isinstance(transform, dict) or \
+                "transforms" in task or "module" in transform:
+            return sql, task
+        if "filter" not in transform and "remove" not in transform:
+            return sql, task
+        if not re.match(r"^\s*select\b", sql, re.IGNORECASE) or re.search(r"\border\s+by\b", sql, re.IGNORECASE):
+            self.log.write(u"Pushdown skipped: query is not a plain SELECT without ORDER BY")
+            return sql, task
+
+        transform = dict(transform)
+        converted = set([field for field, func in transform.get("convert", [])])
+        where = None
+        if "filter" in transform and task["source"].get("pushdown_filter", False):
+            expr = transform["filter"]
+            if not (self._fields(expr) & converted):
+                where = self._filter_sql(expr, input_driver.quote)
+            if where is not None:
+                del transform["filter"]
+            else:
+                self.log.write(u"Pushdown skipped for filter: {}".format(expr))
+
+        columns = None
+        if "remove" in transform:
+            # fields used by stages before remove must be fetched
+            used = set(converted)
+            if "filter" in transform:
+                used |= self._fields(transform["filter"])
+            lookups = transform.get("lookup", [])
+            for item in (lookups if isinstance(lookups, list) else [lookups]):
+                used |= set(stage._fields(item.get("on", item["key"])))
+            try:
+                fields = self._columns(db, sql, args)
+            except Exception as e:
+                fields = []
+                self.log.write(u"Pushdown skipped for remove, columns not found: {}".format(e))
+            pushed = [f for f in transform["remove"] if f not in used and f in fields]
+            if pushed:
+                columns = [f for f in fields if f not in pushed]
+                left = [f for f in transform["remove"] if f not in pushed]
+                if left:
+                    transform["remove"] = left
                 else:
-                    record_set.progress(10000, out=lg).appendcsv(out, encoding=enc, delimiter=separator)
-        db.close()
+                    del transform["remove"]
+
+        if where is None and columns is None:
+            return sql, task
+        select = u", ".join([u"q.{}".format(input_driver.quote(f)) for f in columns]) if columns else u"q.*"
+        sql = u"SELECT {} FROM ({}) q".format(select, sql)
+        if where is not None:
+            sql = u"{} WHERE {}".format(sql, where)
+        self.log.write(u"Pushdown SQL: {}".format(sql))
+
+        task = dict(task)
+        if transform:
+            task["transform"] = transform
+        else:
+            del task["transform"]
+        return sql, task
+
+
+class ForEachSubTask(object):
+    """Expand a task with a foreach block into one task instance per set of params.
+    Params sets come from values (list of dicts, or dict of lists for all combinations),
+    a csv file or a query. Params are merged into source params and format the task name
+    and the file names of source and target"""
+
+    def __init__(self, task, driver):
+        self.task = task
+        self.foreach = task["foreach"]
+        self.driver = driver
+        self.parallel = max(1, int(self.foreach.get("parallel", 1)))
+
+    def params(self):
+        foreach = self.foreach
+        if "values" in foreach:
+            values = foreach["values"]
+            if isinstance(values, dict):
+                names = sorted(values.keys())
+                return [dict(zip(names, v)) for v in itertools.product(*[values[n] for n in names])]
+            return list(values)
+        elif "connection" in foreach:
+            input_driver = self.driver.get_driver(foreach["connection"])
+            db = input_driver.get_db()
+            try:
+                base = BaseTask()
+                return list(base._from_db(db, *base._parse_query(foreach, input_driver)).dicts())
+            finally:
+                db.close()
+        elif "file" in foreach:
+            inp = BaseTask()._source_file(foreach)
+            separator = compat.translate_unicode(foreach.get("delimiter", ";"))
+            enc = compat.translate_unicode(foreach.get("encoding", "utf-8"))
+            return list(etl.fromcsv(inp, encoding=enc, delimiter=separator).dicts())
+        raise ValueError("foreach needs values, file or connection")
+
+    @staticmethod
+    def _format(value, params):
+        return value.format(**params) if isinstance(value, compat.string_types) and "{" in value else value
+
+    def instances(self):
+        instances = []
+        for i, params in enumerate(self.params()):
+            params = dict(params)
+            item = copy.deepcopy(self.task)
+            del item["foreach"]
+            name = self._format(item["name"], params)
+            item["name"] = name if name != item["name"] else u"{}_{}".format(name, i + 1)
+            for node in ("source", "target"):
+                if isinstance(item.get(node), dict):
+                    if "file" in item[node]:
+                        item[node]["file"] = self._format(item[node]["file"], params)
+                    if node == "source":
+                        merged = dict(item[node].get("params", {}))
+                        merged.update(params)
+                        item[node]["params"] = merged
+            instances.append(item)
+        return instances
+
+
+class DbCsvTask(BaseTask):
+
+    @staticmethod
+    def _can_copy(task, input_driver):
+        """Native export is used when the target asks for it (native), the driver has it and rows
+        don't need transforms. Its csv is the one of the database, not the one of petl"""
+        return hasattr(input_driver, "copy_to") and task["target"].get("native", False) and \
+            "transform" not in task and "transforms" not in task and "split" not in task["target"]
+
+    @staticmethod
+    def _count_csv(file_name, delimiter, encoding, header, compressed):
+        """Data rows of a csv file, quoted line breaks are part of a row"""
+        with gzip.open(file_name, "rb") if compressed else open(file_name, "rb") as raw:
+            f = raw if compat.PY2 else io.TextIOWrapper(raw, encoding=encoding, newline="")
+            rows = sum(1 for _ in csv.reader(f, delimiter=str(delimiter)))
+        return rows - 1 if header and rows else rows
+
+    # noinspection PyMethodMayBeStatic
+    def _copy_csv(self, input_driver, db, sql, args, task, log):
+        target_node = task["target"]
+        fld = target_node.get("folder", "output")
+        fld = compat.translate_unicode(fld)
+        target = target_node["file"]
+        target = compat.translate_unicode(target)
+        out = "{}/{}".format(fld, target)
+
+        separator = target_node.get("delimiter", ";")
+        separator = compat.translate_unicode(separator)
+        enc = target_node.get("encoding", "utf-8")
+        truncate = target_node.get("truncate", False)
+        header = target_node.get("header", truncate)
+
+        start = time.time()
+        # copy into a temp file, so an empty result leaves the target as the petl path does
+        fd, temp_file = mkstemp(suffix=".tmp", dir=fld)
+        os.close(fd)
+        try:
+            compressed = target_node.get("compress", None) == "gzip" or out.endswith(".gz")
+            if compressed:
+                f = gzip.open(temp_file, "wb")
+            else:
+                f = open(temp_file, "wb")
+            with f:
+                rows = input_driver.copy_to(db, sql, f, separator, enc, header, args)
+            if rows is None or rows < 0:
+                # driver without row count of COPY
+                rows = self._count_csv(temp_file, separator, enc, header, compressed)
+            if not rows:
+                log.write("Task skipped. No rows on source")
+                return
+            self._add_metrics(rows, os.path.getsize(temp_file))
+            if truncate or not os.path.isfile(out):
+                if os.path.isfile(out):
+                    os.remove(out)
+                os.rename(temp_file, out)
+            else:
+                # gzip members appended one after other are a valid gzip file
+                with open(out, "ab") as dst, open(temp_file, "rb") as src:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+        finally:
+            if os.path.isfile(temp_file):
+                os.remove(temp_file)
+        log.write(u"Native copy complete. {0} rows exported in {1:.2f}s".format(rows, time.time() - start))
+
+    def run(self, driver, task, log):
+        input_driver = driver.get_driver(task["source"]["connection"])
+        sql, args = self._parse_query(task["source"], input_driver)
+        db = input_driver.get_db()
+        try:
+            sql, task = PushdownSubTask(task, log).optimize(db, input_driver, sql, args)
+            if self._can_copy(task, input_driver):
+                self._copy_csv(input_driver, db, sql, args, task, log)
+                return
+
+            record_set = self._from_db(db, sql, args)
+            if not etl.data(record_set).any():
+                log.write("Task skipped. No rows on source")
+            else:
+                transform = TransformSubTask(task, log, driver)
+                record_set = transform.get_result(record_set)
+                self._write_csv(record_set, task["target"], "db-csv_{}".format(task["name"]))
+        finally:
+            db.close()
 
 
 class CsvDbTask(BaseTask):
 
     def run(self, driver, task, log):
-        source_folder = task["source"].get("folder", "input")
-        source_folder = compat.translate_unicode(source_folder)
-        source = task["source"]["file"]
-        source = compat.translate_unicode(source)
-        inp = "{}/{}".format(source_folder, source)
+        inp = self._source_file(task["source"])
 
         separator = task["source"].get("delimiter", ";")
         separator = compat.translate_unicode(separator)
@@ -223,71 +767,39 @@ class CsvDbTask(BaseTask):
         if not etl.data(record_set).any():
             log.write("Task skipped. No rows on source")
         else:
-            transform = TransformSubTask(task, log)
+            transform = TransformSubTask(task, log, driver)
             record_set = transform.get_result(record_set)
-
-            output_driver = driver.get_driver(task["target"]["connection"])
-            db = output_driver.get_db()
-
-            table = task["target"]["table"]
-            table = compat.translate_unicode(table)
-            if "schema" in task["target"]:
-                schema_name = task["target"]["schema"]
-                schema_name = compat.translate_unicode(schema_name)
+            if "delta" in task["target"]:
+                loader.DeltaLoader(driver, task["target"], "csv-db_{}".format(task["name"]), log).load(
+                    self._counted(record_set))
             else:
-                schema_name = None
-
-            task_log = "log/csv-db_{}_{}.log".format(task["name"], get_time_filename())
-            with open(task_log, "w") as lg:
-                if "truncate" in task["target"] and task["target"]["truncate"]:
-                    record_set.progress(10000, out=lg).todb(output_driver.cursor(db), tablename=table, schema=schema_name)
-                else:
-                    record_set.progress(10000, out=lg).appenddb(output_driver.cursor(db), tablename=table, schema=schema_name)
-
-            db.close()
+                self._write_db(record_set, driver, task["target"], "csv-db_{}".format(task["name"]), log,
+                               source=inp)
 
 
 class DbDbTask(BaseTask):
 
     def run(self, driver, task, log):
         input_driver = driver.get_driver(task["source"]["connection"])
-        sql = self._parse_sql(task["source"])
+        sql, args = self._parse_query(task["source"], input_driver)
         db = input_driver.get_db()
-        record_set = etl.fromdb(db, sql)
-        if not etl.data(record_set).any():
-            log.write("Task skipped. No rows on source")
-        else:
-            transform = TransformSubTask(task, log)
-            record_set = transform.get_result(record_set)
-
-            output_driver = driver.get_driver(task["target"]["connection"])
-            out_db = output_driver.get_db()
-
-            table = task["target"]["table"]
-            table = compat.translate_unicode(table)
-            if "schema" in task["target"]:
-                schema_name = task["target"]["schema"]
-                schema_name = compat.translate_unicode(schema_name)
+        try:
+            sql, task = PushdownSubTask(task, log).optimize(db, input_driver, sql, args)
+            record_set = self._from_db(db, sql, args)
+            if not etl.data(record_set).any():
+                log.write("Task skipped. No rows on source")
             else:
-                schema_name = None
-
-            task_log = "log/db-db_{}_{}.log".format(task["name"], get_time_filename())
-            with open(task_log, "w") as lg:
-                if "truncate" in task["target"] and task["target"]["truncate"]:
-                    record_set.progress(10000, out=lg).todb(output_driver.cursor(out_db), tablename=table, schema=schema_name)
-                else:
-                    record_set.progress(10000, out=lg).appenddb(output_driver.cursor(out_db), tablename=table, schema=schema_name)
-
-            out_db.close()
-        db.close()
+                transform = TransformSubTask(task, log, driver)
+                record_set = transform.get_result(record_set)
+                self._write_db(record_set, driver, task["target"], "db-db_{}".format(task["name"]), log, True)
+        finally:
+            db.close()
 
 
 class CsvCsvTask(BaseTask):
 
     def run(self, driver, task, log):
-        inp = task["source"]["file"]
-        inp = compat.translate_unicode(inp)
-        inp = "input/{}".format(inp)
+        inp = self._source_file(task["source"])
         separator = task["source"].get("delimiter", ";")
         separator = compat.translate_unicode(separator)
 
@@ -298,7 +810,7 @@ class CsvCsvTask(BaseTask):
         if not etl.data(record_set).any():
             log.write("Task skipped. No rows on source")
         else:
-            transform = TransformSubTask(task, log)
+            transform = TransformSubTask(task, log, driver)
             record_set = transform.get_result(record_set)
 
             out = task["target"]["file"]
@@ -308,165 +820,210 @@ class CsvCsvTask(BaseTask):
             separator = compat.translate_unicode(separator)
             enc = task["target"].get("encoding", "utf-8")
 
+            record_set = self._counted(record_set)
             task_log = "log/csv-csv_{}_{}.log".format(task["name"], get_time_filename())
             with open(task_log, "w") as lg:
                 if "truncate" in task["target"] and task["target"]["truncate"]:
                     record_set.progress(10000, out=lg).tocsv(out, encoding=enc, delimiter=separator)
+                    self._add_file_size(out)
                 else:
+                    before = os.path.getsize(out) if os.path.isfile(out) else 0
                     record_set.progress(10000, out=lg).appendcsv(out, encoding=enc, delimiter=separator)
+                    self._add_file_size(out, before)
 
 
 class XlsCsvTask(BaseTask):
+    """Export one or more sheets of a workbook. A .xlsx workbook is streamed and opened once"""
+
+    @staticmethod
+    def _sheet_items(task):
+        """Expand source sheets into task items, each sheet can override target and transforms"""
+        if "sheets" not in task["source"]:
+            return [(task["source"].get("sheet", None), task)]
+        items = []
+        for entry in task["source"]["sheets"]:
+            entry = entry if isinstance(entry, dict) else {"sheet": entry}
+            item = dict(task)
+            item.update([(k, v) for k, v in entry.items() if k not in ("sheet", "target")])
+            item["name"] = u"{}_{}".format(task["name"], entry["sheet"])
+            item["target"] = dict(task["target"])
+            item["target"].update(entry.get("target", {}))
+            items.append((entry["sheet"], item))
+        return items
+
+    def _write(self, record_set, driver, item, log):
+        self._write_csv(record_set, item["target"], "xls-csv_{}".format(item["name"]))
+
+    def _export(self, record_set, driver, item, log):
+        if not etl.data(record_set).any():
+            log.write(u"Task skipped. No rows on source: {}".format(item["name"]))
+        else:
+            transform = TransformSubTask(item, log, driver)
+            record_set = transform.get_result(record_set)
+            self._write(record_set, driver, item, log)
 
     def run(self, driver, task, log):
         inp = task["source"]["file"]
         inp = compat.translate_unicode(inp)
         inp = "input/{}".format(inp)
-        sheet = task["source"].get("sheet", None)
-        use_view = task["source"].get("use_view", True)
-       
-        record_set = etl.fromxls(inp, sheet, use_view=use_view)
-        if not etl.data(record_set).any():
-            log.write("Task skipped. No rows on source")
+        self._input = inp
+
+        if inp.lower().endswith((".xlsx", ".xlsm")):
+            with reader.XlsxWorkbook(inp) as workbook:
+                for sheet, item in self._sheet_items(task):
+                    self._export(workbook.sheet(sheet), driver, item, log)
         else:
-            transform = TransformSubTask(task, log)
-            record_set = transform.get_result(record_set)
+            use_view = task["source"].get("use_view", True)
+            for sheet, item in self._sheet_items(task):
+                self._export(etl.fromxls(inp, sheet, use_view=use_view), driver, item, log)
 
-            out = task["target"]["file"]
-            out = compat.translate_unicode(out)
-            out = "output/{}".format(out)
-            separator = task["target"].get("delimiter", ";")
-            separator = compat.translate_unicode(separator)
-            enc = task["target"].get("encoding", "utf-8")
 
-            task_log = "log/xls-csv_{}_{}.log".format(task["name"], get_time_filename())
-            with open(task_log, "w") as lg:
-                if "truncate" in task["target"] and task["target"]["truncate"]:
-                    record_set.progress(10000, out=lg).tocsv(out, encoding=enc, delimiter=separator)
-                else:
-                    record_set.progress(10000, out=lg).appendcsv(out, encoding=enc, delimiter=separator)
+class XlsDbTask(XlsCsvTask):
+    """Load one or more sheets of a workbook into database tables"""
+
+    def _write(self, record_set, driver, item, log):
+        self._write_db(record_set, driver, item["target"], "xls-db_{}".format(item["name"]), log,
+                       source=self._input)
 
 
 class XmlCsvTask(BaseTask):
 
     def run(self, driver, task, log):
-        inp = task["source"]["file"]
-        inp = compat.translate_unicode(inp)
-        inp = "input/{}".format(inp)
-        row_match = task["source"].get("row", None)
-        value_match = task["source"].get("value", None)
-        attr = task["source"].get("attr", None)
-        mapping = task["source"].get("mapping", None)
-
-        if row_match and value_match:
-            if attr:
-                record_set = etl.fromxml(inp, row_match, value_match, attr)
-            else:
-                record_set = etl.fromxml(inp, row_match, value_match)
-        elif row_match and mapping:
-            record_set = etl.fromxml(inp, row_match, mapping)
-        else:
-            raise ValueError('Incorrect parameter for source')
+        record_set = self._from_xml(task["source"])
 
         if not etl.data(record_set).any():
             log.write("Task skipped. No rows on source")
         else:
-            transform = TransformSubTask(task, log)
+            transform = TransformSubTask(task, log, driver)
             record_set = transform.get_result(record_set)
-
-            out = task["target"]["file"]
-            out = compat.translate_unicode(out)
-            out = "output/{}".format(out)
-            separator = task["target"].get("delimiter", ";")
-            separator = compat.translate_unicode(separator)
-            enc = task["target"].get("encoding", "utf-8")
-
-            task_log = "log/xml-csv_{}_{}.log".format(task["name"], get_time_filename())
-            with open(task_log, "w") as lg:
-                if "truncate" in task["target"] and task["target"]["truncate"]:
-                    record_set.progress(10000, out=lg).tocsv(out, encoding=enc, delimiter=separator)
-                else:
-                    record_set.progress(10000, out=lg).appendcsv(out, encoding=enc, delimiter=separator)
+            self._write_csv(record_set, task["target"], "xml-csv_{}".format(task["name"]))
 
 
 class XmlDbTask(BaseTask):
 
     def run(self, driver, task, log):
-        inp = task["source"]["file"]
-        inp = compat.translate_unicode(inp)
-        inp = "input/{}".format(inp)
-        row_match = task["source"].get("row", None)
-        value_match = task["source"].get("value", None)
-        attr = task["source"].get("attr", None)
-        mapping = task["source"].get("mapping", None)
-
-        if row_match and value_match:
-            if attr:
-                record_set = etl.fromxml(inp, row_match, value_match, attr)
-            else:
-                record_set = etl.fromxml(inp, row_match, value_match)
-        elif row_match and mapping:
-            record_set = etl.fromxml(inp, row_match, mapping)
-        else:
-            raise ValueError('Incorrect parameter for source')
+        record_set = self._from_xml(task["source"])
 
         if not etl.data(record_set).any():
             log.write("Task skipped. No rows on source")
         else:
-            transform = TransformSubTask(task, log)
+            transform = TransformSubTask(task, log, driver)
             record_set = transform.get_result(record_set)
+            self._write_db(record_set, driver, task["target"], "xml-db_{}".format(task["name"]), log,
+                           source=self._source_file(task["source"]))
 
-            output_driver = driver.get_driver(task["target"]["connection"])
-            db = output_driver.get_db()
 
-            table = task["target"]["table"]
-            table = compat.translate_unicode(table)
-            if "schema" in task["target"]:
-                schema_name = task["target"]["schema"]
-                schema_name = compat.translate_unicode(schema_name)
-            else:
-                schema_name = None
-
-            task_log = "log/xml-db_{}_{}.log".format(task["name"], get_time_filename())
-            with open(task_log, "w") as lg:
-                if "truncate" in task["target"] and task["target"]["truncate"]:
-                    record_set.progress(10000, out=lg).todb(output_driver.cursor(db),
-                                                            tablename=table, schema=schema_name)
-                else:
-                    record_set.progress(10000, out=lg).appenddb(output_driver.cursor(db),
-                                                                tablename=table, schema=schema_name)
-            db.close()
+class FtpUploadTask(BaseTask):
+    """Upload one or more files (names or glob patterns) over a pool of persistent FTP sessions"""
 
+    # callable of the connection config that returns an ftputil.FTPHost like object, default ftputil
+    host_factory = None
 
-class FtpUploadTask(BaseTask):
+    def _open_host(self, item):
+        if self.host_factory is not None:
+            return self.host_factory(item)
+        if "port" in item:
+            factory = ftputil_session.session_factory(port=int(item["port"]))
+            return ftputil.FTPHost(item["host"], item["user"], item["pass"], session_factory=factory)
+        return ftputil.FTPHost(item["host"], item["user"], item["pass"])
 
     def run(self, driver, task, log):
-        source = task["source"]["file"]
-        source = compat.translate_unicode(source)
         source_path = task["source"].get("path", "output")
         source_path = compat.translate_unicode(source_path)
-        source_path = "{}/{}".format(source_path, source)
-        target = task["target"].get("file", source)
-        target_path = "{}/{}".format(task["target"]["path"], target)
-        
+        files = self._list_files(source_path, task["source"].get("files", task["source"].get("file")))
+        if not files:
+            log.write("Task skipped. No files on source")
+            return
+
+        target_path = compat.translate_unicode(task["target"]["path"])
+        if len(files) == 1:
+            targets = {files[0]: task["target"].get("file", files[0])}
+        else:
+            if "file" in task["target"]:
+                log.write(u"Warning: target file ignored, {} files on source keep their names".format(len(files)))
+            targets = dict([(f, f) for f in files])
+
         item = driver.get_connection(task["target"]["connection"])
-        with ftputil.FTPHost(item["host"],
-                             item["user"],
-                             item["pass"]) as host:
-            host.upload_if_newer(source_path, target_path)
-            
+        sessions = max(1, min(int(task["target"].get("sessions", 4)), len(files)))
+
+        # idle sessions are opened on first use and reused by the next file
+        hosts = compat.queue.Queue()
+        for _ in range(sessions):
+            hosts.put(None)
+
+        def upload(file_name):
+            host = hosts.get()
+            try:
+                if host is None:
+                    host = self._open_host(item)
+                source_file = "{}/{}".format(source_path, file_name)
+                start = time.time()
+                uploaded = host.upload_if_newer(source_file, "{}/{}".format(target_path, targets[file_name]))
+                return file_name, uploaded, os.path.getsize(source_file), time.time() - start
+            except Exception:
+                # the session may be broken, next file opens a new one
+                if host is not None:
+                    try:
+                        host.close()
+                    except Exception:
+                        pass
+                    host = None
+                raise
+            finally:
+                hosts.put(host)
+
+        log.write(u"Uploading {} file(s) over {} FTP session(s)".format(len(files), sessions))
+        start = time.time()
+        total = 0
+        pool = multiprocessing_pool.ThreadPool(sessions)
+        try:
+            for file_name, uploaded, size, elapsed in pool.imap_unordered(upload, files):
+                if uploaded:
+                    total += size
+                    log.write(u"Uploaded: {0}, {1} bytes in {2:.2f}s ({3:.1f} KB/s)".format(
+                        file_name, size, elapsed, size / 1024.0 / max(elapsed, 0.001)))
+                else:
+                    log.write(u"Skipped: {}, target is up to date".format(file_name))
+        finally:
+            pool.close()
+            pool.join()
+            while not hosts.empty():
+                host = hosts.get()
+                if host is not None:
+                    host.close()
+
+        elapsed = time.time() - start
+        log.write(u"Upload complete. {0} bytes in {1:.2f}s ({2:.1f} KB/s)".format(
+            total, elapsed, total / 1024.0 / max(elapsed, 0.001)))
+
 
 class ZipTask(BaseTask):
+    """Compress files (names or glob patterns) into a zip file using a pool of processes"""
+
+    # names of the archive methods, read on run so archive loads only with a zip task
+    compressions = {
+        "deflate": "DEFLATED",
+        "bzip2": "BZIP2",
+        "lzma": "LZMA",
+        "stored": "STORED"
+    }
 
     @staticmethod
     def _encode_cp437(s):
-        return s.encode('cp437', errors='replace').translate(compat.maketrans('?', '_'))
+        if compat.PY2:
+            return s.encode('cp437', errors='replace').translate(compat.maketrans('?', '_'))
+        return s.encode('cp437', errors='replace').decode('cp437').replace('?', '_')
 
     def run(self, driver, task, log):
-        source = task["source"]["files"]
         source_path = task["source"].get("path", "output")
         source_path = compat.translate_unicode(source_path)
+        source = self._list_files(source_path, task["source"]["files"])
+        if not source:
+            log.write("Task skipped. No files on source")
+            return
+
         remove_after = task["source"].get("remove_after", [])
+        remove_after = source if remove_after is True else self._list_files(source_path, remove_after)
         if "target" in task:
             target = task["target"]["file"] if "file" in task["target"] else "{}.zip".format(source[0])
             target_path = task["target"].get("path", source_path)
@@ -476,15 +1033,42 @@ class ZipTask(BaseTask):
         target = compat.translate_unicode(target)
         target = "{}.zip".format(target) if not target.endswith(".zip") else target
         target_path = compat.translate_unicode(target_path)
-
         target_file = "{}/{}".format(target_path, target)
-        with zipfile.ZipFile(target_file, 'w', zipfile.ZIP_DEFLATED) as z:
-            for file_name in source:
-                file_name = compat.translate_unicode(file_name)
-                z.write("{}/{}".format(target_path, file_name), ZipTask._encode_cp437(file_name))
+
+        options = task.get("target", {})
+        compression = options.get("compression", "deflate")
+        if compression not in ZipTask.compressions:
+            raise ValueError("Unsupported compression: {}".format(compression))
+        compress_type = getattr(archive, ZipTask.compressions[compression])
+        level = options.get("level", None)
+        level = int(level) if level is not None else None
+        # fails here when the codec or level is not available
+        archive.compressor(compress_type, level)
+        workers = max(1, min(int(options.get("workers", multiprocessing.cpu_count())), len(source)))
+
+        start = time.time()
+        input_size = 0
+        with tempfile.TemporaryDirectory(dir=target_path) as temp_folder:
+            jobs = [("{}/{}".format(source_path, f), compress_type, level, temp_folder) for f in source]
+            pool = multiprocessing.Pool(workers) if workers > 1 else None
+            try:
+                members = pool.imap(archive.compress_member, jobs) if pool else \
+                    (archive.compress_member(j) for j in jobs)
+                with archive.ZipWriter(target_file) as z:
+                    # members are assembled in source order as soon as they are ready
+                    for file_name, job, member in zip(source, jobs, members):
+                        input_size += member[2]
+                        z.add(job[0], ZipTask._encode_cp437(file_name), compress_type, member)
+            finally:
+                if pool:
+                    pool.terminate()
+                    pool.join()
+
+        log.write(u"Zip complete. {0} file(s), {1} bytes into {2} bytes ({3}, {4} worker(s)) in {5:.2f}s".format(
+            len(source), input_size, os.path.getsize(target_file), compression, workers, time.time() - start))
 
         for file_name in remove_after:
-            os.remove("{}/{}".format(target_path, file_name))
+            os.remove("{}/{}".format(source_path, file_name))
 
 
 class UnzipTask(BaseTask):
@@ -525,15 +1109,82 @@ class PyExecTask(BaseTask):
 
 
 class SqlExecTask(BaseTask):
+    """Run a SQL script statement by statement on one connection. Each group of parallel_groups
+    runs after it on its own connection, at the same time as the other groups"""
+
+    def _statements(self, source, output_driver):
+        """Statements of a command or query file with its args"""
+        params = source.get("params", None)
+        statements = []
+        for sql in script.split_sql(self._sql_text(source), output_driver.dialect):
+            if params is not None and source.get("bind", False):
+                statements.append(output_driver.bind_sql(sql, params))
+            else:
+                statements.append((sql.format(**params) if params is not None else sql, None))
+        return statements
+
+    # noinspection PyMethodMayBeStatic
+    def _execute(self, output_driver, statements, autocommit, log, group=u""):
+        db = output_driver.get_db()
+        try:
+            if autocommit:
+                output_driver.set_autocommit(db, True)
+            cur = output_driver.cursor(db)
+            for i, (sql, args) in enumerate(statements):
+                start = time.time()
+                if args is None:
+                    cur.execute(sql)
+                else:
+                    cur.execute(sql, args)
+                log.write(u"{0}Statement {1}/{2} done in {3:.2f}s: {4}".format(
+                    group, i + 1, len(statements), time.time() - start, u" ".join(sql.split())[:80]))
+            if not autocommit:
+                db.commit()
+        except Exception:
+            if not autocommit:
+                db.rollback()
+            raise
+        finally:
+            if autocommit:
+                output_driver.set_autocommit(db, False)
+            db.close()
 
     def run(self, driver, task, log):
         output_driver = driver.get_driver(task["target"]["connection"])
-        db = output_driver.get_db()
-        sql = self._parse_sql(task["source"])
-        cur = output_driver.cursor(db)
-        cur.execute(sql)
-        db.commit()
-        db.close()
+        source = task["source"]
+        autocommit = task["target"].get("autocommit", False)
+        if "command" in source or "query" in source:
+            self._execute(output_driver, self._statements(source, output_driver), autocommit, log)
+
+        groups = []
+        for group in source.get("parallel_groups", []):
+            # groups inherit path, params and bind of the source
+            node = dict([(k, v) for k, v in source.items() if k in ("path", "params", "bind")])
+            node.update(group)
+            groups.append(self._statements(node, output_driver))
+        if not groups:
+            return
+
+        errors = []
+
+        def run_group(args):
+            number, statements = args
+            try:
+                self._execute(output_driver, statements, autocommit, log, u"Group {}: ".format(number))
+            except Exception:
+                errors.append(number)
+                log.write(u"Group {} failed: {}".format(number, traceback.format_exc()))
+
+        parallel = int(source.get("parallel", len(groups)))
+        log.write(u"Running {} group(s), parallel: {}".format(len(groups), parallel))
+        pool = multiprocessing_pool.ThreadPool(max(1, min(parallel, len(groups))))
+        try:
+            pool.map(run_group, [(i + 1, g) for i, g in enumerate(groups)], 1)
+        finally:
+            pool.close()
+            pool.join()
+        if errors:
+            raise RuntimeError(u"Group(s) failed: {}".format(u", ".join([str(e) for e in sorted(errors)])))
 
 
 class NopTask(BaseTask):
@@ -568,34 +1219,118 @@ class DownloadTask(BaseTask):
         target_path = compat.translate_unicode(target_path)
         target_file = "{}/{}".format(target_path, target)
         with open(target_file, "wb") as file:
-            response = get(source, params=payload, headers=headers)
+            response = requests.get(source, params=payload, headers=headers)
             response.raise_for_status()
             file.write(response.content)
             log.write("Download complete. {} bytes saved".format(len(response.content)))
 
 
+class TeeTask(BaseTask):
+    """Read a source once and write it to many csv files and database tables concurrently"""
+
+    def _source(self, driver, source):
+        if "connection" in source:
+            input_driver = driver.get_driver(source["connection"])
+            db = input_driver.get_db()
+            return self._from_db(db, *self._parse_query(source, input_driver)), db
+        if "row" in source:
+            return self._from_xml(source), None
+
+        separator = source.get("delimiter", ";")
+        separator = compat.translate_unicode(separator)
+        enc = source.get("encoding", "utf-8")
+        enc = compat.translate_unicode(enc)
+        return etl.fromcsv(self._source_file(source), encoding=enc, delimiter=separator), None
+
+    def _target_writer(self, driver, target, log_name, log):
+        def write(record_set):
+            record_set = TransformSubTask(target, log, driver).get_result(record_set)
+            if "connection" in target:
+                self._write_db(record_set, driver, target, log_name, log)
+            else:
+                self._write_csv(record_set, target, log_name)
+        return write
+
+    def run(self, driver, task, log):
+        record_set, db = self._source(driver, task["source"])
+        try:
+            transform = TransformSubTask(task, log, driver)
+            record_set = transform.get_result(record_set)
+
+            batch_size = int(task.get("batch_size", 1000))
+            queue_depth = int(task.get("queue_depth", 8))
+            it = iter(record_set)
+            hdr = next(it, None)
+            first = next(pipeline.batches(it, batch_size), None)
+            if first is None:
+                log.write("Task skipped. No rows on source")
+                return
+
+            targets = task["targets"]
+            fanout = pipeline.Fanout(hdr, len(targets), queue_depth)
+            consumers = []
+            for i, target in enumerate(targets):
+                name = target.get("name", target.get("table", target.get("file")))
+                write = self._target_writer(driver, target, u"tee_{}_{}".format(task["name"], name), log)
+                consumer = pipeline.Consumer(fanout.views[i], write, lambda i=i: fanout.failed.__setitem__(i, True))
+                consumer.start()
+                consumers.append((name, consumer))
+            log.write(u"Writing {} target(s), batch size: {}, queue depth: {}".format(
+                len(targets), batch_size, queue_depth))
+
+            failed = True
+            try:
+                fanout.put(first)
+                for batch in pipeline.batches(it, batch_size):
+                    if all(fanout.failed):
+                        break
+                    fanout.put(batch)
+                failed = False
+            finally:
+                # on a source error the targets roll back instead of committing a partial load
+                fanout.close(failed)
+                for _, consumer in consumers:
+                    consumer.join()
+
+            errors = [(name, c.error) for name, c in consumers if c.error]
+            for name, error in errors:
+                log.write(u"Target {} failed: {}".format(name, error))
+            if errors:
+                raise RuntimeError(u"{} of {} target(s) failed".format(len(errors), len(targets)))
+        finally:
+            if db is not None:
+                db.close()
+
+
 class TaskFactory(object):
-    _tasks = {
-        "db-csv": DbCsvTask,
-        "csv-db": CsvDbTask,
-        "db-db": DbDbTask,
-        "csv-csv": CsvCsvTask,
-        "xls-csv": XlsCsvTask,
-        "xml-csv": XmlCsvTask,
-        "xml-db": XmlDbTask,
-        "ftp-upload": FtpUploadTask,
-        "zip": ZipTask,
-        "unzip": UnzipTask,
-        "py-exec": PyExecTask,
-        "sql-exec": SqlExecTask,
-        "nop": NopTask,
-        "custom": CustomTask,
-        "download": DownloadTask
-    }
+    """Task types of the dasladen.tasks registry. Plugins add types with entry points on that group"""
+
+    _tasks = Registry("dasladen.tasks", {
+        "db-csv": "dasladen.task:DbCsvTask",
+        "csv-db": "dasladen.task:CsvDbTask",
+        "db-db": "dasladen.task:DbDbTask",
+        "csv-csv": "dasladen.task:CsvCsvTask",
+        "xls-csv": "dasladen.task:XlsCsvTask",
+        "xls-db": "dasladen.task:XlsDbTask",
+        "xml-csv": "dasladen.task:XmlCsvTask",
+        "xml-db": "dasladen.task:XmlDbTask",
+        "ftp-upload": "dasladen.task:FtpUploadTask",
+        "zip": "dasladen.task:ZipTask",
+        "unzip": "dasladen.task:UnzipTask",
+        "py-exec": "dasladen.task:PyExecTask",
+        "sql-exec": "dasladen.task:SqlExecTask",
+        "nop": "dasladen.task:NopTask",
+        "custom": "dasladen.task:CustomTask",
+        "download": "dasladen.task:DownloadTask",
+        "tee": "dasladen.task:TeeTask"
+    })
+
+    @staticmethod
+    def register(task_type, task_class):
+        TaskFactory._tasks.register(task_type, task_class)
 
     def get_task(self, task_type):
-        if task_type in self._tasks:
-            return self._tasks[task_type]()
+        task_class = self._tasks.get(task_type)
+        if task_class is not None:
+            return task_class()
         raise NotImplementedError
-
-
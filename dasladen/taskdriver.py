@@ -21,29 +21,35 @@ Features:
 - Connection to MySQL
 - Connection to Oracle
 - Connection to PostgreSQL
+- Export to csv with COPY on PostgreSQL
+- SQL for truncate and swap load strategies
+- Bind variables in the paramstyle of each driver
+- Pool of connections reused across tasks and recurring runs
+- Adaptive batch size for executemany on all drivers
+- SQL to disable and restore indexes, constraints and triggers around loads
+- Limit of sessions opened at same time by connection (max_concurrent)
 
 """
 
 import os
+import sys
+import json
+import time
+import uuid
+import string
+import threading
+
+from itertools import islice
 
 from . import compat
-try:
-    import cx_Oracle as oracle
-except ImportError:
-    pass
-try:
-    import pyodbc as odbc
-except ImportError:
-    pass
-try:
-    import pymysql as mysql
-except ImportError:
-    pass
-try:
-    import psycopg2 as postgres
-    import psycopg2.extras as postres_extras
-except ImportError:
-    pass
+from .governor import GovernedConnection
+
+# driver packages are imported when a connection of its driver is opened
+oracle = compat.LazyModule("cx_Oracle")
+odbc = compat.LazyModule("pyodbc")
+mysql = compat.LazyModule("pymysql")
+postgres = compat.LazyModule("psycopg2")
+postres_extras = compat.LazyModule("psycopg2.extras")
 
 
 def get_env(value):
@@ -54,29 +60,295 @@ def get_env(value):
         return value
 
 
+class AdaptiveBatcher(object):
+    """Batch size for executemany, tuned by the rows/sec of each full batch.
+    The size doubles while throughput improves, goes back to the best size when it drops,
+    and is always bounded by max_size, the max_mb memory estimate of a batch and the rows the
+    caller gives in one executemany (a bigger size would never be used)"""
+
+    def __init__(self, size=500, min_size=50, max_size=20000, max_mb=32, adaptive=True):
+        self.size = int(size)
+        self.min_size = int(min_size)
+        self.max_size = int(max_size)
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.adaptive = adaptive
+        self.row_bytes = None
+        self.best_rate = 0.0
+        self.best_size = self.size
+        self.settled = not adaptive
+        self.batches = 0
+        self.chunk = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Batcher from the batch item of a connection config"""
+        batch = config.get("batch", {}) if config else {}
+        if not isinstance(batch, dict):
+            # a number is a fixed batch size
+            return cls(size=batch, min_size=1, max_size=batch, adaptive=False)
+        return cls(size=batch.get("size", 500), min_size=batch.get("min", 50), max_size=batch.get("max", 20000),
+                   max_mb=batch.get("max_mb", 32), adaptive=batch.get("adaptive", True))
+
+    def _bound(self, size):
+        upper = self.max_size
+        if self.chunk:
+            upper = min(upper, self.chunk)
+        if self.row_bytes:
+            upper = min(upper, max(1, self.max_bytes // self.row_bytes))
+        return max(min(size, upper), min(self.min_size, upper))
+
+    def limit(self, rows):
+        """Take the rows of an executemany call, the size is not grown past the biggest call"""
+        if rows > (self.chunk or 0):
+            self.chunk = rows
+            self.size = self._bound(self.size)
+
+    def measure(self, row):
+        """Estimate memory of a row from the first one"""
+        if self.row_bytes is None:
+            self.row_bytes = sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+            self.size = self._bound(self.size)
+
+    def update(self, rows, seconds):
+        """Take the time of a batch and choose the size of next one"""
+        self.batches += 1
+        if not self.adaptive or rows < self.size:
+            # last partial batch is not a fair measure
+            return
+        rate = rows / max(seconds, 1e-6)
+        if not self.settled:
+            if rate > self.best_rate * 1.05:
+                self.best_rate, self.best_size = rate, self.size
+                size = self._bound(self.size * 2)
+                self.settled = size == self.size
+                self.size = size
+            else:
+                self.size = self.best_size
+                self.settled = True
+        elif rate < self.best_rate * 0.5:
+            # load changed a lot (locks, row width): probe again from a smaller size
+            self.best_rate, self.size = 0.0, self._bound(self.size // 2)
+            self.best_size = self.size
+            self.settled = False
+
+
 class CursorProxy(object):
-    """Proxy for cursor that not has support a executemany with iterators"""
+    """Proxy for cursor that run executemany over iterators in batches of adaptive size"""
 
-    def __init__(self, cursor):
+    def __init__(self, cursor, batcher=None):
         self._cursor = cursor
+        self.batcher = batcher or AdaptiveBatcher()
 
-    def executemany(self, statement, parameters, **kwargs):
-        # convert parameters to a list
-        parameters = list(parameters)
-        # pass through to proxy cursor
+    @property
+    def batch_size(self):
+        return self.batcher.size
+
+    def _execute_batch(self, statement, parameters, **kwargs):
         return self._cursor.executemany(statement, parameters, **kwargs)
 
+    def executemany(self, statement, parameters, **kwargs):
+        batcher = self.batcher
+        if hasattr(parameters, "__len__"):
+            batcher.limit(len(parameters))
+        it = iter(parameters)
+        result = None
+        while True:
+            batch = list(islice(it, batcher.size))
+            if not batch:
+                break
+            batcher.measure(batch[0])
+            start = time.time()
+            result = self._execute_batch(statement, batch, **kwargs)
+            batcher.update(len(batch), time.time() - start)
+        return result
+
     def __getattr__(self, item):
         return getattr(self._cursor, item)
 
 
-class OracleDriver(object):
+class PooledConnection(object):
+    """Proxy of a pooled connection, close gives it back to the pool"""
+
+    def __init__(self, pool, db):
+        self._pool = pool
+        self._db = db
+
+    def close(self):
+        if self._db is not None:
+            db, self._db = self._db, None
+            self._pool.release(db)
+
+    def __getattr__(self, item):
+        return getattr(self._db, item)
+
+    def __setattr__(self, key, value):
+        if key.startswith("_"):
+            object.__setattr__(self, key, value)
+        else:
+            setattr(self._db, key, value)
+
+
+class ConnectionPool(object):
+    """Idle connections kept open to be reused by next tasks and recurring runs,
+    so statements prepared on them (statement cache) are reused too"""
+
+    def __init__(self, connect, size=4):
+        self._connect = connect
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            db = self._idle.pop() if self._idle else None
+        return PooledConnection(self, db if db is not None else self._connect())
+
+    def release(self, db):
+        try:
+            # end any open transaction, keep the connection only if it still works
+            db.rollback()
+        except Exception:
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(db)
+                return
+        db.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, size):
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(connect, size)
+        return _pools[key]
+
+
+class BaseDriver(object):
+    """SQL for load strategies, quoted as petl does (SQL-92 double quotes)"""
+
+    # bind variables style of the DB-API module
+    paramstyle = "qmark"
+    # SQL script dialect, see script.split_sql
+    dialect = None
+    # governor slot of the connection (max_concurrent), where sessions are taken from (the task reservation
+    # or the governor) and log of queue waits, set by DriverFactory
+    slot = None
+    sessions = None
+    log = None
+
+    def get_db(self):
+        """Open a connection, or take one of the pool when connection config has pooled.
+        Takes a session of the governor slot when connection config has max_concurrent"""
+        if self.slot is None:
+            return self._open()
+        release = self.sessions.take(self.slot, self.log)
+        try:
+            return GovernedConnection(release, self._open())
+        except Exception:
+            release()
+            raise
+
+    def _open(self):
+        conn = self.config
+        if not conn.get("pooled", False):
+            return self._connect()
+        key = (self.__class__.__name__, json.dumps(conn, sort_keys=True))
+        return get_pool(key, self._connect, int(conn.get("pool_size", 4))).get()
+
+    def _connect(self):
+        raise NotImplementedError
+
+    # noinspection PyMethodMayBeStatic
+    def set_autocommit(self, db, value):
+        db.autocommit = value
+
+    def marker(self, position):
+        """Bind marker of a positional arg, position starts on 0"""
+        if self.paramstyle == "named":
+            return u":{}".format(position + 1)
+        return u"%s" if self.paramstyle in ("format", "pyformat") else u"?"
+
+    def bind_sql(self, sql, params):
+        """Replace {name} fields of sql with bind markers. Return the sql and its args"""
+        parts = []
+        args = [] if self.paramstyle in ("qmark", "format") else {}
+        for literal, field, spec, conversion in string.Formatter().parse(sql):
+            if self.paramstyle in ("format", "pyformat"):
+                literal = literal.replace("%", "%%")
+            parts.append(literal)
+            if field is None:
+                continue
+            if self.paramstyle == "qmark":
+                parts.append(u"?")
+                args.append(params[field])
+            elif self.paramstyle == "format":
+                parts.append(u"%s")
+                args.append(params[field])
+            elif self.paramstyle == "named":
+                parts.append(u":{}".format(field))
+                args[field] = params[field]
+            else:
+                parts.append(u"%({})s".format(field))
+                args[field] = params[field]
+        return u"".join(parts), args
+
+    # noinspection PyMethodMayBeStatic
+    def quote(self, name):
+        return u'"{}"'.format(name.replace('"', '""'))
+
+    def table_name(self, table, schema=None):
+        return self.quote(table) if schema is None else u"{}.{}".format(self.quote(schema), self.quote(table))
+
+    def truncate_sql(self, table, schema=None):
+        return [u"TRUNCATE TABLE {}".format(self.table_name(table, schema))]
+
+    def drop_sql(self, table, schema=None):
+        return [u"DROP TABLE {}".format(self.table_name(table, schema))]
+
+    # noinspection PyUnusedLocal
+    def shadow_sql(self, db, table, shadow, schema=None):
+        """Create an empty shadow table like the table. Drivers add keys, indexes and grants of the table"""
+        return [u"CREATE TABLE {} AS SELECT * FROM {} WHERE 1 = 0".format(
+            self.table_name(shadow, schema), self.table_name(table, schema))]
+
+    # noinspection PyMethodMayBeStatic,PyUnusedLocal
+    def index_sql(self, db, table, schema=None):
+        """Pairs of (disable, restore) statements for non-unique indexes of table"""
+        return []
+
+    # noinspection PyMethodMayBeStatic,PyUnusedLocal
+    def constraint_sql(self, db, table, schema=None):
+        """Pairs of (disable, restore) statements for constraints and triggers of table"""
+        return []
+
+    # noinspection PyUnusedLocal
+    def transaction_sql(self, db, table, schema=None):
+        """Statements run on the load cursor at start of each load transaction, for constraints
+        that can only be deferred inside the transaction"""
+        return []
+
+    def swap_sql(self, table, shadow, old, schema=None, partition=None):
+        """Put the loaded shadow table in place of the table and drop the old one.
+        Atomic only where DDL is transactional"""
+        return [u"ALTER TABLE {} RENAME TO {}".format(self.table_name(table, schema), self.quote(old)),
+                u"ALTER TABLE {} RENAME TO {}".format(self.table_name(shadow, schema), self.quote(table)),
+                u"DROP TABLE {}".format(self.table_name(old, schema))]
+
+
+class OracleDriver(BaseDriver):
     """Driver for Oracle connections"""
 
+    paramstyle = "named"
+    dialect = "oracle"
+
     def __init__(self, config):
         self.config = config
 
-    def get_db(self):
+    def _connect(self):
         conn = self.config
         host_address = conn.get("host", "localhost")
         port = conn.get("port", "1521")
@@ -85,6 +357,9 @@ class OracleDriver(object):
                                            host_address, port, conn["service"])
         db = oracle.connect(str_conn)
         db.outputtypehandler = self.output_type_handler
+        if "statement_cache" in conn:
+            # parsed statements kept by the connection, reused when the same SQL runs again
+            db.stmtcachesize = int(conn["statement_cache"])
 
         if "initializing" in conn:
             for sql in conn["initializing"]:
@@ -93,23 +368,110 @@ class OracleDriver(object):
         return db
 
     def output_type_handler(self, cursor, name, defaultType, size, precision, scale):
-        if defaultType in (STRING, FIXED_CHAR):
+        if defaultType in (oracle.STRING, oracle.FIXED_CHAR):
             if compat.PY2:
                 return cursor.var(unicode, size, cursor.arraysize)
             else:
-                return cursor.var(cx_Oracle.STRING, size, cursor.arraysize)
+                return cursor.var(oracle.STRING, size, cursor.arraysize)
 
     def cursor(self, db):
-        return CursorProxy(db.cursor())
-
-
-class MSSQLDriver(object):
+        return CursorProxy(db.cursor(), AdaptiveBatcher.from_config(self.config))
+
+    def index_sql(self, db, table, schema=None):
+        """Mark indexes unusable (skipped by inserts) and rebuild them after"""
+        cur = db.cursor()
+        cur.execute("SELECT owner, index_name FROM all_indexes WHERE table_name = :1 AND table_owner = NVL(:2, USER) "
+                    "AND uniqueness = 'NONUNIQUE' AND status = 'VALID' AND index_type <> 'LOB'", [table, schema])
+        pairs = [(u"ALTER SESSION SET skip_unusable_indexes = TRUE", None)]
+        for owner, name in cur.fetchall():
+            index = self.table_name(name, owner)
+            pairs.append((u"ALTER INDEX {} UNUSABLE".format(index), u"ALTER INDEX {} REBUILD".format(index)))
+        return pairs
+
+    def constraint_sql(self, db, table, schema=None):
+        cur = db.cursor()
+        cur.execute("SELECT constraint_name FROM all_constraints WHERE table_name = :1 AND owner = NVL(:2, USER) "
+                    "AND constraint_type = 'R' AND status = 'ENABLED'", [table, schema])
+        name = self.table_name(table, schema)
+        pairs = [(u"ALTER TABLE {} DISABLE ALL TRIGGERS".format(name), u"ALTER TABLE {} ENABLE ALL TRIGGERS".format(name))]
+        for constraint, in cur.fetchall():
+            pairs.append((u"ALTER TABLE {} DISABLE CONSTRAINT {}".format(name, self.quote(constraint)),
+                          u"ALTER TABLE {} ENABLE CONSTRAINT {}".format(name, self.quote(constraint))))
+        return pairs
+
+    def shadow_sql(self, db, table, shadow, schema=None):
+        """Columns by CTAS, then primary key, unique and check constraints, indexes and grants of the table.
+        Index names are generated (unique by schema). Of a partitioned table only local indexes are
+        created, as partition exchange needs. Foreign keys, triggers and column defaults are not copied"""
+        name = self.table_name(shadow, schema)
+        statements = BaseDriver.shadow_sql(self, db, table, shadow, schema)
+        cur = db.cursor()
+        args = {"owner": schema, "name": table}
+        cur.execute("SELECT c.constraint_name, c.constraint_type, c.search_condition FROM all_constraints c "
+                    "WHERE c.owner = COALESCE(:owner, USER) AND c.table_name = :name "
+                    "AND (c.constraint_type IN ('P', 'U') OR (c.constraint_type = 'C' AND c.generated = 'USER NAME')) "
+                    "ORDER BY c.constraint_type", args)
+        constraints = cur.fetchall()
+        for constraint, kind, condition in constraints:
+            if kind == "C":
+                statements.append(u"ALTER TABLE {} ADD CHECK ({})".format(name, condition))
+                continue
+            cur.execute("SELECT column_name FROM all_cons_columns WHERE owner = COALESCE(:owner, USER) "
+                        "AND constraint_name = :name ORDER BY position", {"owner": schema, "name": constraint})
+            statements.append(u"ALTER TABLE {} ADD {} ({})".format(
+                name, u"PRIMARY KEY" if kind == "P" else u"UNIQUE", u", ".join([self.quote(c) for c, in cur])))
+
+        cur.execute("SELECT partitioned FROM all_tables WHERE owner = COALESCE(:owner, USER) AND table_name = :name",
+                    args)
+        row = cur.fetchone()
+        partitioned = row is not None and row[0] == "YES"
+        cur.execute("SELECT i.index_name, i.index_type, i.uniqueness FROM all_indexes i "
+                    "LEFT JOIN all_part_indexes p ON p.owner = i.owner AND p.index_name = i.index_name "
+                    "WHERE i.table_owner = COALESCE(:owner, USER) AND i.table_name = :name "
+                    "AND i.index_type IN ('NORMAL', 'BITMAP') AND (:partitioned = 0 OR p.locality = 'LOCAL') "
+                    "AND NOT EXISTS (SELECT 1 FROM all_constraints c WHERE c.owner = i.table_owner "
+                    "AND c.table_name = i.table_name AND c.index_name = i.index_name)",
+                    {"owner": schema, "name": table, "partitioned": 1 if partitioned else 0})
+        tag = uuid.uuid4().hex[:8].upper()
+        for n, (index, kind, uniqueness) in enumerate(cur.fetchall()):
+            cols = db.cursor()
+            cols.execute("SELECT column_name, descend FROM all_ind_columns WHERE index_owner = COALESCE(:owner, USER) "
+                         "AND index_name = :name ORDER BY column_position", {"owner": schema, "name": index})
+            statements.append(u"CREATE {}INDEX {} ON {} ({})".format(
+                u"BITMAP " if kind == "BITMAP" else u"UNIQUE " if uniqueness == "UNIQUE" else u"",
+                self.table_name(u"IX_{}_{}".format(tag, n + 1), schema), name,
+                u", ".join([self.quote(c) + (u" DESC" if d == "DESC" else u"") for c, d in cols])))
+
+        cur.execute("SELECT privilege, grantee, grantable FROM all_tab_privs WHERE table_schema = COALESCE(:owner, USER) "
+                    "AND table_name = :name AND grantee <> table_schema", args)
+        for privilege, grantee, grantable in cur.fetchall():
+            statements.append(u"GRANT {} ON {} TO {}{}".format(
+                privilege, name, grantee if grantee == "PUBLIC" else self.quote(grantee),
+                u" WITH GRANT OPTION" if grantable == "YES" else u""))
+        return statements
+
+    def swap_sql(self, table, shadow, old, schema=None, partition=None):
+        """Exchange the partition with the shadow table, or rename. Oracle DDL commits on each statement,
+        so between the renames there is a moment without the table"""
+        if partition:
+            return [u"ALTER TABLE {} EXCHANGE PARTITION {} WITH TABLE {} INCLUDING INDEXES WITHOUT VALIDATION "
+                    u"UPDATE GLOBAL INDEXES".format(
+                        self.table_name(table, schema), self.quote(partition), self.table_name(shadow, schema)),
+                    u"DROP TABLE {} PURGE".format(self.table_name(shadow, schema))]
+        return [u"ALTER TABLE {} RENAME TO {}".format(self.table_name(table, schema), self.quote(old)),
+                u"ALTER TABLE {} RENAME TO {}".format(self.table_name(shadow, schema), self.quote(table)),
+                u"DROP TABLE {} PURGE".format(self.table_name(old, schema))]
+
+
+class MSSQLDriver(BaseDriver):
     """Driver for MS SQL connections via ODBC"""
 
+    dialect = "mssql"
+
     def __init__(self, config):
         self.config = config
 
-    def get_db(self):
+    def _connect(self):
         conn = self.config
         db_charset = "CHARSET={};".format(conn["charset"]) if "charset" in conn else ""
         host_address = conn.get("host", "(local)")
@@ -138,16 +500,89 @@ class MSSQLDriver(object):
         return db
 
     def cursor(self, db):
-        return db.cursor()
-
-
-class MySQLDriver(object):
+        return CursorProxy(db.cursor(), AdaptiveBatcher.from_config(self.config))
+
+    def shadow_sql(self, db, table, shadow, schema=None):
+        """Columns by SELECT INTO, then primary key, unique and check constraints, defaults, indexes and
+        permissions of the table. Foreign keys and triggers are not copied"""
+        name = self.table_name(shadow, schema)
+        source = self.table_name(table, schema)
+        statements = [u"SELECT * INTO {} FROM {} WHERE 1 = 0".format(name, source)]
+        cur = db.cursor()
+        cur.execute("SELECT i.index_id, i.name, i.type_desc, i.is_unique, i.is_primary_key, i.is_unique_constraint, "
+                    "i.filter_definition FROM sys.indexes i WHERE i.object_id = OBJECT_ID(?) AND i.type IN (1, 2) "
+                    "ORDER BY i.type, i.index_id", [source])
+        for index_id, index, kind, unique, primary, constraint, condition in cur.fetchall():
+            cols = db.cursor()
+            cols.execute("SELECT c.name, ic.is_descending_key, ic.is_included_column FROM sys.index_columns ic "
+                         "JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+                         "WHERE ic.object_id = OBJECT_ID(?) AND ic.index_id = ? ORDER BY ic.key_ordinal, "
+                         "ic.index_column_id", [source, index_id])
+            keys, included = [], []
+            for column, descending, include in cols.fetchall():
+                if include:
+                    included.append(self.quote(column))
+                else:
+                    keys.append(self.quote(column) + (u" DESC" if descending else u""))
+            if primary or constraint:
+                statements.append(u"ALTER TABLE {} ADD {} {} ({})".format(
+                    name, u"PRIMARY KEY" if primary else u"UNIQUE", kind, u", ".join(keys)))
+            else:
+                statements.append(u"CREATE {}{} INDEX {} ON {} ({}){}{}".format(
+                    u"UNIQUE " if unique else u"", kind, self.quote(index), name, u", ".join(keys),
+                    u" INCLUDE ({})".format(u", ".join(included)) if included else u"",
+                    u" WHERE {}".format(condition) if condition else u""))
+
+        cur.execute("SELECT definition FROM sys.check_constraints WHERE parent_object_id = OBJECT_ID(?)", [source])
+        statements += [u"ALTER TABLE {} ADD CHECK {}".format(name, d) for d, in cur.fetchall()]
+        cur.execute("SELECT c.name, d.definition FROM sys.default_constraints d JOIN sys.columns c "
+                    "ON c.object_id = d.parent_object_id AND c.column_id = d.parent_column_id "
+                    "WHERE d.parent_object_id = OBJECT_ID(?)", [source])
+        statements += [u"ALTER TABLE {} ADD DEFAULT {} FOR {}".format(name, d, self.quote(c))
+                       for c, d in cur.fetchall()]
+        cur.execute("SELECT p.state_desc, p.permission_name, u.name FROM sys.database_permissions p "
+                    "JOIN sys.database_principals u ON u.principal_id = p.grantee_principal_id "
+                    "WHERE p.class = 1 AND p.major_id = OBJECT_ID(?) AND p.minor_id = 0", [source])
+        for state, permission, grantee in cur.fetchall():
+            statements.append(u"{} {} ON {} TO {}{}".format(
+                u"DENY" if state == "DENY" else u"GRANT", permission, name, self.quote(grantee),
+                u" WITH GRANT OPTION" if state == "GRANT_WITH_GRANT_OPTION" else u""))
+        return statements
+
+    def index_sql(self, db, table, schema=None):
+        """Disable nonclustered indexes and rebuild them after"""
+        name = self.table_name(table, schema)
+        cur = db.cursor()
+        cur.execute("SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(?) AND type = 2 "
+                    "AND is_unique = 0 AND is_disabled = 0", [name])
+        return [(u"ALTER INDEX {} ON {} DISABLE".format(self.quote(index), name),
+                 u"ALTER INDEX {} ON {} REBUILD".format(self.quote(index), name)) for index, in cur.fetchall()]
+
+    def constraint_sql(self, db, table, schema=None):
+        name = self.table_name(table, schema)
+        return [(u"ALTER TABLE {} NOCHECK CONSTRAINT ALL".format(name),
+                 u"ALTER TABLE {} WITH CHECK CHECK CONSTRAINT ALL".format(name)),
+                (u"DISABLE TRIGGER ALL ON {}".format(name), u"ENABLE TRIGGER ALL ON {}".format(name))]
+
+    def swap_sql(self, table, shadow, old, schema=None, partition=None):
+        """Rename with sp_rename inside the load transaction"""
+        def name(t):
+            return t if schema is None else u"{}.{}".format(schema, t)
+        return [u"EXEC sp_rename '{}', '{}'".format(name(table).replace("'", "''"), old.replace("'", "''")),
+                u"EXEC sp_rename '{}', '{}'".format(name(shadow).replace("'", "''"), table.replace("'", "''")),
+                u"DROP TABLE {}".format(self.table_name(old, schema))]
+
+
+class MySQLDriver(BaseDriver):
     """Driver for MySQL connections"""
 
+    paramstyle = "pyformat"
+    dialect = "mysql"
+
     def __init__(self, config):
         self.config = config
 
-    def get_db(self):
+    def _connect(self):
         conn = self.config
         db_charset = conn.get("charset", "utf8")
         host_address = conn.get("host", "localhost")
@@ -169,29 +604,65 @@ class MySQLDriver(object):
         return db
 
     def cursor(self, db):
-        return db.cursor()
-
-
-class PostgreBatchCursor():
+        return CursorProxy(db.cursor(), AdaptiveBatcher.from_config(self.config))
+
+    def set_autocommit(self, db, value):
+        db.autocommit(value)
+
+    # noinspection PyUnusedLocal
+    def shadow_sql(self, db, table, shadow, schema=None):
+        """LIKE copies keys and indexes, grants are kept by table name. Foreign keys and triggers are not copied"""
+        return [u"CREATE TABLE {} LIKE {}".format(self.table_name(shadow, schema), self.table_name(table, schema))]
+
+    def index_sql(self, db, table, schema=None):
+        """Drop non-unique secondary indexes and create them again after"""
+        cur = db.cursor()
+        cur.execute("SELECT index_name, column_name, sub_part FROM information_schema.statistics "
+                    "WHERE table_schema = COALESCE(%s, DATABASE()) AND table_name = %s AND non_unique = 1 "
+                    "AND index_type = 'BTREE' ORDER BY index_name, seq_in_index", [schema, table])
+        indexes = []
+        for index, column, sub_part in cur.fetchall():
+            if not indexes or indexes[-1][0] != index:
+                indexes.append((index, []))
+            indexes[-1][1].append(self.quote(column) if sub_part is None else
+                                  u"{}({})".format(self.quote(column), sub_part))
+        name = self.table_name(table, schema)
+        return [(u"DROP INDEX {} ON {}".format(self.quote(index), name),
+                 u"CREATE INDEX {} ON {} ({})".format(self.quote(index), name, u", ".join(columns)))
+                for index, columns in indexes]
+
+    def constraint_sql(self, db, table, schema=None):
+        """Session checks, MySQL can't disable triggers"""
+        return [(u"SET foreign_key_checks = 0", u"SET foreign_key_checks = 1"),
+                (u"SET unique_checks = 0", u"SET unique_checks = 1")]
+
+    def swap_sql(self, table, shadow, old, schema=None, partition=None):
+        """RENAME TABLE of both tables is atomic"""
+        return [u"RENAME TABLE {} TO {}, {} TO {}".format(
+                    self.table_name(table, schema), self.table_name(old, schema),
+                    self.table_name(shadow, schema), self.table_name(table, schema)),
+                u"DROP TABLE {}".format(self.table_name(old, schema))]
+
+
+class PostgreBatchCursor(CursorProxy):
     """Proxy that bypass executemany and run execute_batch on psycopg2 """
 
-    def __init__(self, cursor):
-        self._cursor = cursor
-
-    def executemany(self, statement, parameters, **kwargs):
+    def _execute_batch(self, statement, parameters, **kwargs):
+        # one round trip per batch
+        kwargs.setdefault("page_size", len(parameters))
         return postres_extras.execute_batch(self._cursor, statement, parameters, **kwargs)
 
-    def __getattr__(self, item):
-        return getattr(self._cursor, item)    
-
 
-class PostgreSQLDriver(object):
+class PostgreSQLDriver(BaseDriver):
     """Driver for PostgreSQL connections"""
 
+    paramstyle = "pyformat"
+    dialect = "postgresql"
+
     def __init__(self, config):
         self.config = config
 
-    def get_db(self):
+    def _connect(self):
         conn = self.config
         db_charset = conn.get("charset", "utf8")
         host_address = conn.get("host", "localhost")
@@ -209,4 +680,57 @@ class PostgreSQLDriver(object):
         return db
 
     def cursor(self, db):
-        return PostgreBatchCursor(db.cursor())
+        return PostgreBatchCursor(db.cursor(), AdaptiveBatcher.from_config(self.config))
+
+    def shadow_sql(self, db, table, shadow, schema=None):
+        """LIKE INCLUDING ALL copies defaults, constraints and indexes, then the grants of the table.
+        Foreign keys and triggers are not copied"""
+        name = self.table_name(shadow, schema)
+        source = self.table_name(table, schema)
+        statements = [u"CREATE TABLE {} (LIKE {} INCLUDING ALL)".format(name, source)]
+        cur = db.cursor()
+        cur.execute("SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE pg_get_userbyid(a.grantee) END, "
+                    "a.privilege_type, a.is_grantable FROM pg_class c, aclexplode(c.relacl) a "
+                    "WHERE c.oid = to_regclass(%s) AND a.grantee <> c.relowner", [source])
+        for grantee, privilege, grantable in cur.fetchall():
+            statements.append(u"GRANT {} ON {} TO {}{}".format(
+                privilege, name, grantee if grantee == "PUBLIC" else self.quote(grantee),
+                u" WITH GRANT OPTION" if grantable else u""))
+        return statements
+
+    def index_sql(self, db, table, schema=None):
+        """Drop indexes not backing a constraint and create them again with its definition"""
+        cur = db.cursor()
+        cur.execute("SELECT n.nspname, i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+                    "JOIN pg_class i ON i.oid = x.indexrelid JOIN pg_class t ON t.oid = x.indrelid "
+                    "JOIN pg_namespace n ON n.oid = t.relnamespace "
+                    "WHERE t.relname = %s AND n.nspname = COALESCE(%s, current_schema()) "
+                    "AND NOT x.indisunique AND NOT x.indisprimary "
+                    "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)",
+                    [table, schema])
+        return [(u"DROP INDEX {}".format(self.table_name(index, nsp)), definition)
+                for nsp, index, definition in cur.fetchall()]
+
+    def constraint_sql(self, db, table, schema=None):
+        """User triggers are disabled, deferrable constraints are deferred by transaction_sql"""
+        name = self.table_name(table, schema)
+        return [(u"ALTER TABLE {} DISABLE TRIGGER USER".format(name), u"ALTER TABLE {} ENABLE TRIGGER USER".format(name))]
+
+    def transaction_sql(self, db, table, schema=None):
+        """Deferrable constraints are checked on commit of the load transaction"""
+        return [u"SET CONSTRAINTS ALL DEFERRED"]
+
+    # noinspection PyMethodMayBeStatic
+    def copy_to(self, db, sql, f, delimiter=";", encoding="utf-8", header=False, args=None):
+        """Stream the query result as csv into binary file f with COPY TO STDOUT. Return rows copied"""
+        options = ["FORMAT csv",
+                   "DELIMITER '{}'".format(delimiter.replace("'", "''")),
+                   "ENCODING '{}'".format(encoding.replace("'", "''"))]
+        if header:
+            options.append("HEADER")
+        cur = db.cursor()
+        if args is not None:
+            # COPY has no bind variables, args are bound on client side
+            sql = cur.mogrify(sql, args).decode(postgres.extensions.encodings[db.encoding])
+        cur.copy_expert("COPY ({}) TO STDOUT WITH ({})".format(sql, ", ".join(options)), f)
+        return cur.rowcount
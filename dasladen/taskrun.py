@@ -8,22 +8,37 @@ External Dependencies:
 Features:
 - Wrapper to a json task file
 - Facade to run the tasks
+- Run history of task items
+- Concurrent run of foreach task instances
 
 """
 
 import json
 import os
 import time
+import traceback
 
 from . import compat
-from .task import TaskFactory, DriverFactory
+from .task import TaskFactory, DriverFactory, ForEachSubTask
+from .cache import LookupCache
+from .history import History
+
+multiprocessing_pool = compat.LazyModule("multiprocessing.pool")
 
 
 class Runner(object):
     """Wrapper for json task file"""
 
-    def __init__(self, task):
-        if os.path.isfile(task):
+    # task types that can stream its source file from a zip member
+    zip_source_types = ("csv-db", "csv-csv", "xml-csv", "xml-db")
+
+    def __init__(self, task, config=None):
+        if config is not None:
+            # task config given, task is its name
+            self.filename = task
+            self._config = config
+        elif os.path.isfile(task):
+            self.filename = os.path.basename(task)
             with compat.open(task, 'r', encoding='utf-8') as f:
                 self._config = json.load(f)
         else:
@@ -38,6 +53,37 @@ class Runner(object):
                 return "tasks" in config
         return False
 
+    @staticmethod
+    def zip_sources(config):
+        """Return the source files of tasks that can be read from a zip member"""
+        sources = []
+        for item in config.get("tasks", []):
+            source = item.get("source", {})
+            if item.get("type") in Runner.zip_source_types and "file" in source \
+                    and "folder" not in source and "zip_member" not in source:
+                sources.append(source["file"])
+        return sources
+
+    @staticmethod
+    def input_files(config):
+        """Return the files that tasks read from the input folder"""
+        files = []
+        for item in config.get("tasks", []):
+            source = item.get("source", {})
+            if isinstance(source, dict) and isinstance(source.get("file"), compat.string_types) \
+                    and "folder" not in source:
+                files.append(source["file"].split("!")[0])
+        return files
+
+    def use_archive(self, archive, members):
+        """Point sources found in members to the archive file in input folder"""
+        for item in self._config.get("tasks", []):
+            source = item.get("source", {})
+            if item.get("type") in Runner.zip_source_types and source.get("file") in members \
+                    and "folder" not in source and "zip_member" not in source:
+                source["zip_member"] = source["file"]
+                source["file"] = archive
+
     @property
     def has_schedule(self):
         if "schedule" in self._config:
@@ -58,19 +104,91 @@ class Runner(object):
 class TaskRunner(object):
     """Facade to run the task runner object"""
 
-    def __init__(self, runner):
+    history = History()
+
+    def __init__(self, runner, lookups=None, progress=None):
         self._config = runner.config
+        self._filename = runner.filename
+        self._lookups = lookups if lookups is not None else LookupCache()
+        # called with task item name and count of finished items
+        self._progress = progress
+
+    def _record(self, log, item, task, start, status, error=None):
+        try:
+            self.history.record(self._filename, item["name"], item.get("type"), start, time.time(),
+                                task.rows_written, task.bytes_written, status, error)
+        except Exception as e:
+            log.write(u"History not recorded: {}".format(e))
+
+    def _run_item(self, driver, item, log):
+        if item.get("disabled", False):
+            return self._run_task(driver, item, log)
+        task_driver = driver.reserve(item, self._filename, self._config.get("max_parallel"))
+        try:
+            self._run_task(task_driver, item, log)
+        finally:
+            task_driver.release()
+
+    def _run_task(self, driver, item, log):
+        start = time.time()
+        log.write(u"Executing task item: {}".format(item["name"]))
+        disabled = item.get("disabled", False)
+        if disabled:
+            task = TaskFactory().get_task("nop")
+        else:
+            task = TaskFactory().get_task(item["type"])
+        try:
+            task.run(driver, item, log)
+        except Exception:
+            self._record(log, item, task, start, "failed", traceback.format_exc())
+            raise
+        self._record(log, item, task, start, "disabled" if disabled else "success")
+        log.write(u"Task item finished: {0}, time: {1:.2f}s".format(item["name"], (time.time() - start)))
+
+    def _run_foreach(self, driver, item, log):
+        """Run the instances of a foreach task, up to parallel at same time. Fails after all ran"""
+        start = time.time()
+        foreach = ForEachSubTask(item, driver)
+        instances = foreach.instances()
+        log.write(u"Executing task item: {}, {} instance(s), parallel: {}".format(
+            item["name"], len(instances), foreach.parallel))
+        errors = []
+
+        def run(instance):
+            try:
+                self._run_item(driver, instance, log)
+            except Exception:
+                errors.append(instance["name"])
+                log.write(u"Error: {}".format(traceback.format_exc()))
+
+        if foreach.parallel > 1 and len(instances) > 1:
+            pool = multiprocessing_pool.ThreadPool(min(foreach.parallel, len(instances)))
+            try:
+                pool.map(run, instances, 1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for instance in instances:
+                run(instance)
+
+        log.write(u"Task item finished: {0}, {1} instance(s), time: {2:.2f}s".format(
+            item["name"], len(instances), (time.time() - start)))
+        if errors:
+            raise RuntimeError(u"{} of {} instance(s) failed: {}".format(len(errors), len(instances),
+                                                                       u", ".join(errors)))
 
     def run(self, log):
         if "tasks" in self._config:
-            driver = DriverFactory(self._config)
-            for item in self._config["tasks"]:
-                start = time.time()
-                log.write(u"Executing task item: {}".format(item["name"]))
-                if item.get("disabled", False):
-                    task = TaskFactory().get_task("nop")
+            self._lookups.expire()
+            driver = DriverFactory(self._config, self._lookups, log)
+            for done, item in enumerate(self._config["tasks"]):
+                if self._progress:
+                    self._progress(item["name"], done)
+                if "foreach" in item and not item.get("disabled", False):
+                    self._run_foreach(driver, item, log)
                 else:
-                    task = TaskFactory().get_task(item["type"])
-                task.run(driver, item, log)
-                log.write(u"Task item finished: {0}, time: {1:.2f}s".format(item["name"], (time.time() - start)))
+                    self._run_item(driver, item, log)
+            if self._progress:
+                self._progress(None, len(self._config["tasks"]))
             return True
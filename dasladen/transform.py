@@ -0,0 +1,213 @@
+"""
+Transform Module
+Built-in transform stages for tasks
+
+External Dependencies:
+- petl : (c) 2012 Alistair Miles - MIT License (https://pypi.python.org/pypi/petl/)
+
+Features:
+- External sort with a memory budget, sorted runs spilled to disk and k-way merged
+- Distinct rows and dedupe on key fields over the external sort
+- Lookup join against a key index shared by tasks, with optional ttl for next runs
+
+"""
+
+import os
+import sys
+import gzip
+import operator
+
+import petl as etl
+from petl.comparison import comparable_itemgetter
+from tempfile import mkstemp
+
+from . import compat
+from .cache import LookupCache
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+def _fields(fields):
+    """Field names as a list, a single field may be given by its name"""
+    if fields is None or isinstance(fields, bool):
+        return fields
+    if isinstance(fields, compat.string_types):
+        return [fields]
+    return list(fields)
+
+
+class ExternalSortView(etl.Table):
+    """Sort rows by key fields. Rows are buffered up to memory budget and each sorted buffer is
+    spilled to a temp file as a run of pickled blocks, the runs are merged on iteration.
+    If unique is given, only the first row of each unique key (True for whole row) is kept"""
+
+    block_size = 1000
+
+    def __init__(self, table, key=None, reverse=False, unique=None, memory_mb=64, compress=False, folder=None):
+        self.table = table
+        self.key = _fields(key)
+        self.reverse = reverse
+        self.unique = _fields(unique)
+        self.memory = int(float(memory_mb) * 1024 * 1024)
+        self.compress = compress
+        self.folder = folder
+
+    @staticmethod
+    def _indexes(hdr, fields):
+        flds = [compat.translate_unicode(f) for f in hdr]
+        return [flds.index(f) for f in fields]
+
+    def _spill(self, rows):
+        fd, temp_file = mkstemp(suffix=".run", dir=self.folder)
+        with os.fdopen(fd, "wb") as raw:
+            f = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1) if self.compress else raw
+            for i in range(0, len(rows), self.block_size):
+                pickle.dump(rows[i:i + self.block_size], f, pickle.HIGHEST_PROTOCOL)
+            if self.compress:
+                f.close()
+        return temp_file
+
+    def _read_run(self, temp_file):
+        with open(temp_file, "rb") as raw:
+            f = gzip.GzipFile(fileobj=raw, mode="rb") if self.compress else raw
+            while True:
+                try:
+                    block = pickle.load(f)
+                except EOFError:
+                    break
+                for row in block:
+                    yield row
+
+    def __iter__(self):
+        it = iter(self.table)
+        try:
+            hdr = tuple(next(it))
+        except StopIteration:
+            return
+        yield hdr
+
+        indexes = self._indexes(hdr, self.key) if self.key else []
+        if self.unique is True or not indexes:
+            # whole row after key fields
+            indexes += [i for i in range(len(hdr)) if i not in indexes]
+        sort_key = comparable_itemgetter(*indexes) if indexes else None
+        if self.unique is True:
+            unique_key = tuple
+        elif self.unique:
+            unique_key = operator.itemgetter(*self._indexes(hdr, self.unique))
+        else:
+            unique_key = None
+
+        runs = []
+        try:
+            rows, size, exhausted = [], 0, False
+            while not exhausted:
+                for row in it:
+                    row = tuple(row)
+                    rows.append(row)
+                    size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+                    if size >= self.memory:
+                        break
+                else:
+                    exhausted = True
+                rows.sort(key=sort_key, reverse=self.reverse)
+                if exhausted and not runs:
+                    # everything fits on memory budget
+                    merged = rows
+                elif rows:
+                    runs.append(self._spill(rows))
+                rows, size = [], 0
+
+            if runs:
+                merged = compat.merge([self._read_run(r) for r in runs], sort_key, self.reverse)
+
+            previous = object()
+            for row in merged:
+                if unique_key is not None:
+                    current = unique_key(row)
+                    if current == previous:
+                        continue
+                    previous = current
+                yield row
+        finally:
+            for temp_file in runs:
+                os.remove(temp_file)
+
+
+def sort(table, key=None, reverse=False, **spill):
+    return ExternalSortView(table, key, reverse, **spill)
+
+
+def distinct(table, key=None, reverse=False, **spill):
+    """Distinct rows, sorted by key then by remaining fields"""
+    return ExternalSortView(table, key, reverse, True, **spill)
+
+
+def dedupe_on(table, fields, key=None, reverse=False, **spill):
+    """Keep the first row of each value of fields, sorted by key if given.
+    First is on input order, or on key order when key starts with fields"""
+    fields = _fields(fields)
+    key = _fields(key)
+    if key and key[:len(fields)] == fields:
+        # same order, only one pass
+        return ExternalSortView(table, key, reverse, fields, **spill)
+    table = ExternalSortView(table, fields, False, fields, **spill)
+    return ExternalSortView(table, key, reverse, **spill) if key else table
+
+
+def build_index(table, key, values):
+    """Hash index of key fields to value fields, single fields are stored as plain values"""
+    key, values = _fields(key), _fields(values)
+    it = iter(table)
+    hdr = [compat.translate_unicode(f) for f in next(it)]
+    get_key = operator.itemgetter(*[hdr.index(f) for f in key])
+    get_values = operator.itemgetter(*[hdr.index(f) for f in values])
+    index = {}
+    for row in it:
+        k = get_key(row)
+        if k not in index:
+            index[k] = get_values(row)
+    return index
+
+
+class LookupView(etl.Table):
+    """Append value fields found on index by the on fields of each row.
+    Rows not found get default values, or are dropped if inner"""
+
+    def __init__(self, table, index, on, values, default=None, inner=False):
+        self.table = table
+        self.index = index
+        self.on = _fields(on)
+        self.values = _fields(values)
+        self.default = default
+        self.inner = inner
+
+    def __iter__(self):
+        it = iter(self.table)
+        try:
+            hdr = tuple(next(it))
+        except StopIteration:
+            return
+        yield hdr + tuple(self.values)
+
+        flds = [compat.translate_unicode(f) for f in hdr]
+        get_key = operator.itemgetter(*[flds.index(f) for f in self.on])
+        single = len(self.values) == 1
+        missing = (self.default, ) if single else (self.default, ) * len(self.values)
+        index = self.index
+        not_found = object()
+        for row in it:
+            found = index.get(get_key(row), not_found)
+            if found is not_found:
+                if self.inner:
+                    continue
+                yield tuple(row) + missing
+            else:
+                yield tuple(row) + ((found, ) if single else found)
+
+
+def lookup(table, index, on, values, default=None, inner=False):
+    return LookupView(table, index, on, values, default, inner)
@@ -0,0 +1,99 @@
+"""
+Writer Module
+Writers for file targets
+
+Features:
+- CSV output split into parts by rows or bytes, each part with header
+- Manifest of parts with rows, bytes and sha256 checksum
+
+"""
+
+import io
+import os
+import csv
+import re
+import json
+import hashlib
+
+from . import compat
+
+
+class SplitCsvWriter(object):
+    """Stream rows into name_part0001.ext, name_part0002.ext... rolling over at max_rows or max_bytes.
+    Writes name_manifest.json listing the parts"""
+
+    def __init__(self, out, encoding="utf-8", delimiter=";", max_rows=None, max_bytes=None):
+        self.out = out
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.max_rows = int(max_rows) if max_rows else None
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.base, self.ext = os.path.splitext(out)
+        self.manifest = u"{}_manifest.json".format(self.base)
+
+    def _part_name(self, number):
+        return u"{}_part{:04d}{}".format(self.base, number, self.ext)
+
+    def _encoder(self):
+        if compat.PY2:
+            buf = io.BytesIO()
+            writer = csv.writer(buf, delimiter=str(self.delimiter), lineterminator="\r\n")
+
+            def encode(row):
+                buf.seek(0)
+                buf.truncate()
+                writer.writerow([v.encode(self.encoding) if isinstance(v, compat.text) else v for v in row])
+                return buf.getvalue()
+        else:
+            buf = io.StringIO()
+            writer = csv.writer(buf, delimiter=self.delimiter, lineterminator="\r\n")
+
+            def encode(row):
+                buf.seek(0)
+                buf.truncate()
+                writer.writerow(row)
+                return buf.getvalue().encode(self.encoding)
+        return encode
+
+    def write(self, table):
+        # parts of a previous run, only names made by _part_name
+        folder = os.path.dirname(self.base) or u"."
+        stale = re.compile(u"{}_part\\d{{4,}}{}$".format(re.escape(os.path.basename(self.base)), re.escape(self.ext)))
+        for name in os.listdir(folder):
+            if stale.match(name):
+                os.remove(os.path.join(folder, name))
+
+        encode = self._encoder()
+        it = iter(table)
+        hdr = next(it)
+        header = encode(hdr)
+        parts = []
+        f, part = None, None
+        try:
+            for row in it:
+                data = encode(row)
+                if f is None or (self.max_rows and part["rows"] >= self.max_rows) or \
+                        (self.max_bytes and part["rows"] and part["bytes"] + len(data) > self.max_bytes):
+                    if f is not None:
+                        f.close()
+                        part["sha256"] = part.pop("hash").hexdigest()
+                    part = {"file": os.path.basename(self._part_name(len(parts) + 1)),
+                            "rows": 0, "bytes": len(header), "hash": hashlib.sha256(header)}
+                    parts.append(part)
+                    f = open(self._part_name(len(parts)), "wb")
+                    f.write(header)
+                f.write(data)
+                part["hash"].update(data)
+                part["bytes"] += len(data)
+                part["rows"] += 1
+        finally:
+            if f is not None:
+                f.close()
+                part["sha256"] = part.pop("hash").hexdigest()
+
+        manifest = {"header": [compat.text(h) for h in hdr],
+                    "rows": sum([p["rows"] for p in parts]),
+                    "parts": parts}
+        with compat.open(self.manifest, "w", encoding="utf-8") as m:
+            m.write(compat.text(json.dumps(manifest, indent=2)))
+        return parts
@@ -26,6 +26,7 @@ setup(
         'backports.tempfile',
         'ftputil',
         'xlrd',
+        'openpyxl',
         'xlwt-future',
         'requests'
     ],
@@ -0,0 +1,93 @@
+"""
+Zip files assembled by ZipWriter, read back with zipfile
+"""
+
+import os
+import shutil
+import struct
+import zipfile
+import tempfile
+import unittest
+
+from dasladen import archive
+
+
+class ZipWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _file(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _zip(self, members, method, level=None):
+        zip_file = os.path.join(self.folder, "out.zip")
+        with archive.ZipWriter(zip_file) as z:
+            for name, path in members:
+                z.add(path, name, method, archive.compress_member((path, method, level, self.folder)))
+        return zip_file
+
+    def test_methods(self):
+        data = b"id;name\n" + b"".join([u"{};name {}\n".format(i, i % 7).encode("ascii") for i in range(20000)])
+        path = self._file("data.csv", data)
+        empty = self._file("empty.csv", b"")
+        for method in (archive.STORED, archive.DEFLATED, archive.BZIP2, archive.LZMA):
+            zip_file = self._zip([("data.csv", path), ("sub/empty.csv", empty)], method, 6)
+            with zipfile.ZipFile(zip_file) as z:
+                self.assertIsNone(z.testzip())
+                self.assertEqual(z.read("data.csv"), data)
+                self.assertEqual(z.read("sub/empty.csv"), b"")
+                info = z.getinfo("data.csv")
+                self.assertEqual(info.compress_type, method)
+                if method != archive.STORED:
+                    self.assertTrue(info.compress_size < info.file_size)
+
+    def test_temp_files_removed(self):
+        path = self._file("a.csv", b"a\n1\n")
+        self._zip([("a.csv", path)], archive.DEFLATED)
+        self.assertEqual(sorted(os.listdir(self.folder)), ["a.csv", "out.zip"])
+
+    def test_member_stat(self):
+        path = self._file("a.csv", b"a\n1\n")
+        os.utime(path, (1262347200, 1262347200))  # 2010-01-01
+        zip_file = self._zip([("a.csv", path)], archive.DEFLATED)
+        with zipfile.ZipFile(zip_file) as z:
+            info = z.getinfo("a.csv")
+        self.assertEqual(info.date_time[0], 2010)
+        self.assertEqual(info.external_attr >> 16, os.stat(path).st_mode & 0xFFFF)
+
+    def test_zip64_end_records(self):
+        # more than 65535 entries need the zip64 end of central directory
+        path = self._file("a.txt", b"x")
+        member = archive.compress_member((path, archive.STORED, None, self.folder))
+        zip_file = os.path.join(self.folder, "many.zip")
+        writer = archive.ZipWriter(zip_file)
+        for i in range(0x10000):
+            with open(member[0], "wb") as f:
+                f.write(b"x")
+            writer.add(path, "f{}".format(i), archive.STORED, member)
+        writer.close()
+        with zipfile.ZipFile(zip_file) as z:
+            self.assertEqual(len(z.namelist()), 0x10000)
+            self.assertEqual(z.read("f65535"), b"x")
+        with open(zip_file, "rb") as f:
+            f.seek(-22, os.SEEK_END)
+            eocd = struct.unpack("<4sHHHHIIH", f.read(22))
+        self.assertEqual(eocd[3], 0xFFFF)
+
+    def test_failed_writer_is_not_finished(self):
+        zip_file = os.path.join(self.folder, "bad.zip")
+        with self.assertRaises(RuntimeError):
+            with archive.ZipWriter(zip_file):
+                raise RuntimeError("compress failed")
+        self.assertFalse(zipfile.is_zipfile(zip_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
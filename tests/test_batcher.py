@@ -0,0 +1,96 @@
+"""
+Adaptive batch size of executemany
+"""
+
+import unittest
+
+from dasladen.taskdriver import AdaptiveBatcher, CursorProxy
+
+
+class Cursor(object):
+
+    def __init__(self):
+        self.batches = []
+
+    def executemany(self, statement, parameters):
+        self.batches.append(len(parameters))
+
+
+def feed(batcher, rate, batches=20):
+    """Update with full batches at rate(size) rows per second"""
+    for _ in range(batches):
+        batcher.update(batcher.size, batcher.size / float(rate(batcher.size)))
+
+
+class AdaptiveBatcherTest(unittest.TestCase):
+
+    def test_grows_while_faster(self):
+        batcher = AdaptiveBatcher(size=100, max_size=20000)
+        feed(batcher, lambda size: min(size, 1600) * 10)
+        self.assertEqual(batcher.size, 1600)
+        self.assertTrue(batcher.settled)
+
+    def test_back_to_best_size(self):
+        batcher = AdaptiveBatcher(size=100, max_size=20000)
+        feed(batcher, lambda size: 1000.0 / size if size > 400 else size)
+        self.assertEqual(batcher.size, 400)
+
+    def test_bounds(self):
+        batcher = AdaptiveBatcher(size=100, max_size=20000, max_mb=1)
+        batcher.measure((u"x" * 1000, 1, 2.0))
+        feed(batcher, lambda size: size)
+        self.assertTrue(batcher.size * batcher.row_bytes <= 1024 * 1024)
+        batcher = AdaptiveBatcher(size=100, max_size=300)
+        feed(batcher, lambda size: size)
+        self.assertEqual(batcher.size, 300)
+
+    def test_partial_batch_ignored(self):
+        batcher = AdaptiveBatcher(size=100)
+        batcher.update(10, 10.0)
+        self.assertEqual((batcher.size, batcher.best_rate, batcher.batches), (100, 0.0, 1))
+
+    def test_probe_again_on_drop(self):
+        batcher = AdaptiveBatcher(size=100, max_size=800)
+        feed(batcher, lambda size: size)
+        self.assertEqual(batcher.size, 800)
+        batcher.update(800, 100.0)
+        self.assertFalse(batcher.settled)
+        self.assertEqual(batcher.size, 400)
+
+    def test_fixed_size(self):
+        batcher = AdaptiveBatcher.from_config({"batch": 250})
+        feed(batcher, lambda size: size)
+        self.assertEqual(batcher.size, 250)
+
+    def test_size_capped_by_call(self):
+        batcher = AdaptiveBatcher(size=500, max_size=20000)
+        batcher.limit(1000)
+        feed(batcher, lambda size: size * 10)
+        # not grown past the rows given by each call, so batches keep counting
+        self.assertEqual(batcher.size, 1000)
+        self.assertTrue(batcher.settled)
+        batcher.limit(10)
+        self.assertEqual(batcher.size, 1000)
+
+
+class CursorProxyTest(unittest.TestCase):
+
+    def test_split_in_batches(self):
+        cursor = Cursor()
+        proxy = CursorProxy(cursor, AdaptiveBatcher(size=300, adaptive=False))
+        proxy.executemany("insert", iter([(i, ) for i in range(1000)]))
+        self.assertEqual(cursor.batches, [300, 300, 300, 100])
+
+    def test_calls_of_petl_chunks(self):
+        cursor = Cursor()
+        batcher = AdaptiveBatcher(size=5000, max_size=20000)
+        proxy = CursorProxy(cursor, batcher)
+        for _ in range(5):
+            proxy.executemany("insert", [(i, ) for i in range(1000)])
+        self.assertEqual(cursor.batches, [1000] * 5)
+        self.assertEqual(batcher.size, 1000)
+        self.assertEqual(batcher.batches, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Claims of a shared capture folder by several node processes
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from dasladen.claim import ClaimQueue
+from dasladen.processor import Watcher
+
+NODES = 4
+DROPS = 20
+
+
+class RecordWatcher(Watcher):
+    """Watcher that records the files it would process instead of processing them"""
+
+    def __init__(self, path, claims, results):
+        Watcher.__init__(self, path, claims)
+        self.before = {}
+        self.results = results
+
+    def _process_list(self, file_list, file_type_log, path=None):
+        for f in file_list:
+            os.remove(os.path.join(path, f))
+        self.results.put((self.claims.node, sorted(file_list)))
+
+
+def _node(path, node, start, results):
+    claims = ClaimQueue(path, node, lease=60)
+    watcher = RecordWatcher(path, claims, results)
+    start.wait()
+    deadline = time.time() + 10
+    while time.time() < deadline and [f for f in os.listdir(path) if not ClaimQueue.is_claim(f)]:
+        watcher.check()
+    claims.stop()
+    results.put((node, None))
+
+
+class ClaimTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(data)
+
+    def test_drops_on_one_node(self):
+        drops = {}
+        for i in range(DROPS):
+            task = "task{}.json".format(i)
+            data = ["a{}.csv".format(i), "b{}.csv".format(i)]
+            self._write(task, json.dumps({"tasks": [
+                {"type": "csv-db", "source": {"file": data[0]}, "target": {}},
+                {"type": "csv-csv", "source": {"file": data[1]}, "target": {}}]}))
+            for name in data:
+                self._write(name, "id\n1\n")
+            drops[task] = sorted([task] + data)
+        for i in range(DROPS):
+            self._write("alone{}.csv".format(i), "id\n1\n")
+
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        nodes = [multiprocessing.Process(target=_node, args=(self.path, "node{}".format(n), start, results))
+                 for n in range(NODES)]
+        for p in nodes:
+            p.start()
+        start.set()
+
+        claimed = []
+        finished = 0
+        while finished < NODES:
+            node, files = results.get(timeout=30)
+            if files is None:
+                finished += 1
+            else:
+                claimed.append((node, files))
+        for p in nodes:
+            p.join()
+
+        names = [f for _, files in claimed for f in files]
+        self.assertEqual(len(names), len(set(names)), "file claimed by more than one node")
+        self.assertEqual(len(names), DROPS * 4)
+        for _, files in claimed:
+            task = [f for f in files if f.endswith(".json")]
+            if task:
+                self.assertEqual(files, drops[task[0]])
+            else:
+                self.assertEqual(len(files), 1)
+        self.assertEqual([f for f in os.listdir(self.path) if not ClaimQueue.is_claim(f)], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
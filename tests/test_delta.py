@@ -0,0 +1,179 @@
+"""
+Delta load of snapshots by row fingerprints, on a SQLite target
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from dasladen.loader import DeltaLoader, Fingerprints
+from dasladen.taskdriver import BaseDriver
+
+HEADER = ("id", "name")
+
+
+class SqliteDriver(BaseDriver):
+
+    def __init__(self, path):
+        self.config = {}
+        self.path = path
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    # noinspection PyMethodMayBeStatic
+    def cursor(self, db):
+        return db.cursor()
+
+
+class Factory(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_driver(self, name):
+        return SqliteDriver(self.path)
+
+
+class Log(object):
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, msg):
+        self.lines.append(msg)
+
+
+class FailingCommit(object):
+    """Connection proxy whose commit fails, after commit really happened when done is True"""
+
+    def __init__(self, db, done):
+        self.db = db
+        self.done = done
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def commit(self):
+        if self.done:
+            self.db.commit()
+        raise sqlite3.OperationalError("connection lost")
+
+
+class DeltaLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+        os.mkdir("log")
+        self.path = os.path.join(self.folder, "target.db")
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE person (id INTEGER, name TEXT)")
+        db.commit()
+        db.close()
+        self.target = {"connection": "db", "table": "person", "delta": {"key": "id", "batch_size": 3}}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def _loader(self):
+        loader = DeltaLoader(Factory(self.path), self.target, "delta", Log())
+        loader.fingerprints.query_size = 2
+        return loader
+
+    def _load(self, rows):
+        loader = self._loader()
+        loader.load([HEADER] + rows)
+        return loader.log.lines[-1]
+
+    def _table(self):
+        db = sqlite3.connect(self.path)
+        try:
+            return sorted(db.execute("SELECT id, name FROM person").fetchall())
+        finally:
+            db.close()
+
+    def test_delta(self):
+        self._load([(i, u"n{}".format(i)) for i in range(10)])
+        self.assertEqual(len(self._table()), 10)
+        rows = [(i, u"n{}".format(i)) for i in range(2, 12)]
+        rows[0] = (2, u"changed")
+        line = self._load(rows)
+        self.assertIn(u"2 inserted, 1 updated, 2 deleted, 7 unchanged, 0 duplicate keys skipped", line)
+        self.assertEqual(self._table(), sorted(rows))
+        self.assertEqual(os.listdir("checkpoint"), ["delta_db_person.fpdb"])
+
+    def test_duplicate_keys(self):
+        self._load([(1, u"a")])
+        line = self._load([(1, u"a"), (2, u"b"), (2, u"c"), (3, u"d"), (2, u"e")])
+        self.assertIn(u"2 inserted, 0 updated, 0 deleted, 1 unchanged, 2 duplicate keys skipped", line)
+        self.assertEqual(self._table(), [(1, u"a"), (2, u"b"), (3, u"d")])
+        # the fingerprint of the loaded row is kept
+        self.assertIn(u"0 inserted, 0 updated, 0 deleted, 3 unchanged", self._load([(1, u"a"), (2, u"b"), (3, u"d")]))
+
+    def _failed_load(self, rows, done):
+        loader = self._loader()
+        get_db = loader.output_driver.get_db
+        loader.output_driver.get_db = lambda: FailingCommit(get_db(), done)
+        self.assertRaises(sqlite3.OperationalError, loader.load, [HEADER] + rows)
+
+    def test_recover_after_commit(self):
+        self._load([(1, u"a"), (2, u"b"), (3, u"c")])
+        self._failed_load([(1, u"a"), (2, u"x"), (4, u"d")], True)
+        self.assertTrue(os.path.isfile("checkpoint/delta_db_person.fpdb.new"))
+        line = self._load([(1, u"a"), (2, u"x"), (5, u"e")])
+        # rows replaced by key, keys of both snapshots missing here deleted
+        self.assertIn(u"3 inserted, 0 updated, 2 deleted", line)
+        self.assertEqual(self._table(), [(1, u"a"), (2, u"x"), (5, u"e")])
+        self.assertEqual(os.listdir("checkpoint"), ["delta_db_person.fpdb"])
+        self.assertIn(u"0 inserted, 0 updated, 0 deleted, 3 unchanged", self._load([(1, u"a"), (2, u"x"), (5, u"e")]))
+
+    def test_recover_after_rollback(self):
+        self._load([(1, u"a"), (2, u"b"), (3, u"c")])
+        self._failed_load([(1, u"a"), (4, u"d")], False)
+        # a second failed recover keeps the keys of both snapshots
+        self._failed_load([(1, u"z")], False)
+        self.assertEqual(self._table(), [(1, u"a"), (2, u"b"), (3, u"c")])
+        self._load([(1, u"a"), (4, u"d")])
+        self.assertEqual(self._table(), [(1, u"a"), (4, u"d")])
+
+    def test_failed_before_commit(self):
+        self._load([(1, u"a")])
+        loader = self._loader()
+        self.assertRaises(sqlite3.ProgrammingError, loader.load, [HEADER, (1, u"a"), (2, )])
+        self.assertEqual(os.listdir("checkpoint"), ["delta_db_person.fpdb"])
+
+
+class FingerprintsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_lookup_by_batches(self):
+        fingerprints = Fingerprints("fp", self.folder).open()
+        fingerprints.query_size = 3
+        for i in range(10):
+            fingerprints.add(i, b"h%d" % i)
+        fingerprints.prepare()
+        fingerprints.save()
+
+        fingerprints = Fingerprints("fp", self.folder).open()
+        fingerprints.query_size = 3
+        try:
+            found = fingerprints.lookup([(i, b"x") for i in (8, 20, 3, 8, 20, (1, 2))])
+            self.assertEqual(found, [b"h8", None, b"h3", Fingerprints.DUPLICATE, Fingerprints.DUPLICATE, None])
+            self.assertEqual(sorted(k[0] for k in fingerprints.missing()), [0, 1, 2, 4, 5, 6, 7, 9])
+        finally:
+            fingerprints.close()
+        self.assertEqual(os.listdir(self.folder), ["fp.fpdb"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+FTP upload over a pool of sessions, with a stand-in of ftputil.FTPHost
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from dasladen.task import FtpUploadTask
+
+
+class FakeHost(object):
+    """FTPHost stand-in that copies files to a local folder"""
+
+    lock = threading.Lock()
+    opened = []
+
+    def __init__(self, item):
+        self.root = item["host"]
+        self.closed = False
+        with self.lock:
+            self.opened.append(self)
+
+    def upload_if_newer(self, source, target):
+        if "broken" in source:
+            raise IOError("550 Permission denied")
+        target = os.path.join(self.root, target.lstrip("/"))
+        if os.path.isfile(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            return False
+        shutil.copy2(source, target)
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+class Log(object):
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, msg):
+        self.lines.append(msg)
+
+
+class Driver(object):
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_connection(self, name):
+        return {"name": name, "host": self.root, "user": "u", "pass": "p"}
+
+
+class FtpUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.remote = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.remote, "in"))
+        FakeHost.opened = []
+        self.task = FtpUploadTask()
+        self.task.host_factory = FakeHost
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.remote)
+
+    def _write(self, name, data="id\n1\n"):
+        with open(os.path.join(self.source, name), "w") as f:
+            f.write(data)
+
+    def _run(self, files, **target):
+        target.update({"connection": "ftp", "path": "/in"})
+        task = {"name": "up", "source": {"path": self.source, "files": files}, "target": target}
+        log = Log()
+        self.task.run(Driver(self.remote), task, log)
+        return log
+
+    def test_pooled_upload(self):
+        for i in range(10):
+            self._write("part{}.csv".format(i))
+        log = self._run("part*.csv", sessions=3)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.remote, "in"))),
+                         ["part{}.csv".format(i) for i in range(10)])
+        # sessions are reused, not opened by file, and all closed at the end
+        self.assertTrue(1 <= len(FakeHost.opened) <= 3)
+        self.assertTrue(all(h.closed for h in FakeHost.opened))
+        self.assertTrue(log.lines[-1].startswith("Upload complete. 50 bytes"))
+
+        log = self._run("part*.csv", sessions=3)
+        self.assertEqual(len([m for m in log.lines if m.startswith("Skipped:")]), 10)
+
+    def test_single_file_target_name(self):
+        self._write("a.csv")
+        self._run("a.csv", file="b.csv")
+        self.assertEqual(os.listdir(os.path.join(self.remote, "in")), ["b.csv"])
+
+    def test_target_file_with_many_files(self):
+        self._write("a.csv")
+        self._write("b.csv")
+        log = self._run(["a.csv", "b.csv"], file="c.csv")
+        self.assertTrue([m for m in log.lines if m.startswith("Warning: target file ignored")])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.remote, "in"))), ["a.csv", "b.csv"])
+
+    def test_error(self):
+        for name in ("a.csv", "broken.csv", "c.csv"):
+            self._write(name)
+        with self.assertRaises(IOError):
+            self._run("*.csv", sessions=1)
+        self.assertTrue(all(h.closed for h in FakeHost.opened))
+
+    def test_no_files(self):
+        log = self._run("none*.csv")
+        self.assertEqual(log.lines, ["Task skipped. No files on source"])
+        self.assertEqual(FakeHost.opened, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Slots of the governor taken at once by reservations of task items
+"""
+
+import threading
+import time
+import unittest
+
+from dasladen.governor import Governor, Reservation
+
+
+class GovernorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.governor = Governor()
+        self.slot = self.governor.slot("connection db", 2)
+
+    def test_lowest_limit_kept(self):
+        self.assertEqual(self.governor.slot("connection db", 5).limit, 2)
+        self.assertEqual(self.governor.slot("connection db", 1).limit, 1)
+
+    def test_over_limit(self):
+        self.assertRaises(ValueError, self.governor.acquire, {self.slot: 3})
+
+    def test_reserved_sessions(self):
+        reservation = Reservation(self.governor, {self.slot: 1})
+        reservation.acquire()
+        release = reservation.take(self.slot)
+        self.assertEqual(self.slot.active, 1)
+        release()
+        # given back to the reservation, not to the governor
+        self.assertEqual(self.slot.active, 1)
+        reservation.take(self.slot)
+        reservation.release()
+        self.assertEqual(self.slot.active, 0)
+
+    def test_extra_session_waits_on_governor(self):
+        reservation = Reservation(self.governor, {self.slot: 1})
+        reservation.acquire()
+        reservation.take(self.slot)
+        other = Reservation(self.governor, {self.slot: 1})
+        other.acquire()
+        taken = []
+        thread = threading.Thread(target=lambda: taken.append(reservation.take(self.slot)))
+        thread.start()
+        time.sleep(0.1)
+        self.assertEqual(taken, [])
+        other.release()
+        thread.join(5)
+        self.assertEqual(len(taken), 1)
+        self.assertEqual(self.slot.active, 2)
+        taken[0]()
+        self.assertEqual(self.slot.active, 1)
+
+    def test_whole_limit_held_raises(self):
+        reservation = Reservation(self.governor, {self.slot: 2})
+        reservation.acquire()
+        reservation.take(self.slot)
+        reservation.take(self.slot)
+        # would wait forever for a session only this task can give back
+        self.assertRaises(ValueError, reservation.take, self.slot)
+        reservation.release()
+
+        reservation = Reservation(self.governor, {self.governor.slot("connection other", 2): 1})
+        reservation.acquire()
+        release = reservation.take(self.slot)
+        reservation.take(self.slot)
+        self.assertRaises(ValueError, reservation.take, self.slot)
+        release()
+        reservation.take(self.slot)
+
+
+if __name__ == "__main__":
+    unittest.main()
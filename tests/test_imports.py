@@ -0,0 +1,32 @@
+"""
+Modules loaded by importing the engine, before any task runs
+"""
+
+import os
+import sys
+import subprocess
+import unittest
+
+# loaded on first use by the tasks that need them
+LAZY = ("zipfile", "sqlite3", "petl", "dasladen.archive", "dasladen.script", "dasladen.loader")
+
+CHECK = "import sys, {}; print(','.join(m for m in {!r} if m in sys.modules))"
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def _loaded(self, module):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+        # -S: no site hooks, they may import some of these modules on their own
+        out = subprocess.check_output([sys.executable, "-S", "-c", CHECK.format(module, LAZY)], env=env)
+        return [m for m in out.decode("ascii").strip().split(",") if m]
+
+    def test_import_base(self):
+        self.assertEqual(self._loaded("dasladen.base"), [])
+
+    def test_import_daemon(self):
+        self.assertEqual(self._loaded("dasladen.daemon"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Loggers by key, released when closed
+"""
+
+import logging
+import unittest
+
+from dasladen import log
+
+
+class RecordHandler(object):
+
+    def __init__(self, fail_open=None, fail_close=False):
+        self.open_keys = []
+        self.lines = []
+        self.fail_open = fail_open
+        self.fail_close = fail_close
+
+    def open(self, key):
+        if key == self.fail_open:
+            raise IOError("log folder not found")
+        self.open_keys.append(key)
+
+    def write(self, data, key=None):
+        self.lines.append((key, data))
+
+    def close(self, key=None):
+        if self.fail_close:
+            raise IOError("disk full")
+        self.open_keys.remove(key)
+
+
+class LoggerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handlers = list(log._manager.handlers)
+        self.keys = dict(log._manager.log_manager_instance)
+
+    def tearDown(self):
+        log._manager.handlers[:] = self.handlers
+        log._manager.log_manager_instance = self.keys
+
+    def test_keys_released(self):
+        handler = RecordHandler()
+        log.add_log_handler(handler)
+        for i in range(100):
+            with log.Logger("job_{}".format(i)) as lg:
+                lg.write(u"run {}".format(i))
+        self.assertEqual(len(handler.lines), 100)
+        self.assertEqual(handler.open_keys, [])
+        self.assertEqual(log._manager.log_manager_instance, self.keys)
+
+    def test_released_on_failed_handler(self):
+        closing = RecordHandler()
+        log.add_log_handler(closing)
+        log.add_log_handler(RecordHandler(fail_close=True))
+        logging.disable(logging.CRITICAL)
+        try:
+            with log.Logger("job_a"):
+                pass
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertEqual(closing.open_keys, [])
+        self.assertNotIn("job_a", log._manager.log_manager_instance)
+
+        log._manager.handlers[:] = self.handlers
+        log.add_log_handler(closing)
+        log.add_log_handler(RecordHandler(fail_open="job_b"))
+        with self.assertRaises(IOError):
+            with log.Logger("job_b"):
+                pass
+        self.assertEqual(closing.open_keys, [])
+        self.assertNotIn("job_b", log._manager.log_manager_instance)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Remove and filter transforms pushed down into the query of a db source
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import petl as etl
+
+from dasladen.cache import LookupCache
+from dasladen.task import PushdownSubTask, TransformSubTask
+from dasladen.taskdriver import BaseDriver
+
+SQL = u"SELECT id, name, city, code FROM person"
+
+
+class Log(object):
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, msg):
+        self.lines.append(msg)
+
+
+class Driver(object):
+
+    def __init__(self):
+        self.lookups = LookupCache()
+
+
+class PushdownTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.execute("CREATE TABLE person (id INTEGER, name TEXT, city TEXT, code TEXT)")
+        self.db.executemany("INSERT INTO person VALUES (?, ?, ?, ?)", [
+            (1, u"Ann", u"Rome", u"a"), (2, u"Bob", None, u"b"), (3, u"O'Neil", u"Oslo", u"a")])
+        self.pushdown = PushdownSubTask(None, Log())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _optimize(self, transform, **source):
+        source.setdefault("connection", "db")
+        task = {"source": source, "transform": transform}
+        self.pushdown = PushdownSubTask(task, Log())
+        return self.pushdown.optimize(self.db, BaseDriver(), SQL)
+
+    def _rows(self, sql, task, driver=None):
+        return list(TransformSubTask(task, Log(), driver).get_result(etl.fromdb(self.db, sql)))
+
+    def test_filter_sql(self):
+        quote = BaseDriver().quote
+        self.assertEqual(self.pushdown._filter_sql(u"{id} >= 2 and {name} == 'O\\'Neil'", quote),
+                         u"q.\"id\" >= 2 AND q.\"name\" = 'O''Neil'")
+        self.assertEqual(self.pushdown._filter_sql(u"{city} == None and {code} != None", quote),
+                         u"q.\"city\" IS NULL AND q.\"code\" IS NOT NULL")
+        # None != value is True on python
+        self.assertEqual(self.pushdown._filter_sql(u"{city} != 'Rome'", quote),
+                         u"(q.\"city\" <> 'Rome' OR q.\"city\" IS NULL)")
+        for expr in (u"{id} > None", u"{id} > 1 or {id} < 0", u"{id} + 1 > 2", u"len({name}) > 2"):
+            self.assertIsNone(self.pushdown._filter_sql(expr, quote), expr)
+
+    def test_filter_only_when_opted_in(self):
+        transform = {"filter": u"{city} != 'Rome'"}
+        sql, task = self._optimize(transform)
+        self.assertEqual((sql, task["transform"]), (SQL, transform))
+
+        sql, task = self._optimize(transform, pushdown_filter=True)
+        self.assertTrue(sql.endswith(u"WHERE (q.\"city\" <> 'Rome' OR q.\"city\" IS NULL)"))
+        self.assertNotIn("transform", task)
+        self.assertEqual(self._rows(sql, task), self._rows(SQL, {"transform": transform}))
+
+    def test_filter_on_converted_field(self):
+        transform = {"convert": [["id", "lambda v: v * 10"]], "filter": u"{id} > 10"}
+        sql, task = self._optimize(transform, pushdown_filter=True)
+        self.assertEqual(sql, SQL)
+        self.assertTrue([m for m in self.pushdown.log.lines if m.startswith(u"Pushdown skipped for filter")])
+
+    def test_remove_pruned(self):
+        transform = {"filter": u"{code} == 'a'", "remove": ["code", "city"]}
+        sql, task = self._optimize(transform)
+        # code is used by the filter left to petl
+        self.assertEqual(sql, u"SELECT q.\"id\", q.\"name\", q.\"code\" FROM ({}) q".format(SQL))
+        self.assertEqual(task["transform"], {"filter": u"{code} == 'a'", "remove": ["code"]})
+        self.assertEqual(self._rows(sql, task), [("id", "name"), (1, u"Ann"), (3, u"O'Neil")])
+
+        sql, task = self._optimize({"remove": ["code", "missing"]})
+        self.assertEqual(task["transform"], {"remove": ["missing"]})
+        self.assertEqual(self._optimize({"remove": ["code"]}, pushdown=False)[0], SQL)
+        self.assertEqual(self._optimize({"remove": ["code"], "module": "x"})[0], SQL)
+
+    def test_lookup_with_string_key(self):
+        folder = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(folder, "codes.csv"), "w") as f:
+                f.write("code;label\na;Alpha\nb;Beta\n")
+            lookup = {"source": {"folder": folder, "file": "codes.csv"}, "key": "code", "values": "label"}
+            transform = {"lookup": lookup, "remove": ["city", "code"]}
+            sql, task = self._optimize(transform)
+            # the key field is fetched for the lookup, not split into characters
+            self.assertEqual(sql, u"SELECT q.\"id\", q.\"name\", q.\"code\" FROM ({}) q".format(SQL))
+            self.assertEqual(self._rows(sql, task, Driver()), [
+                ("id", "name", "label"), (1, u"Ann", u"Alpha"), (2, u"Bob", u"Beta"), (3, u"O'Neil", u"Alpha")])
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    unittest.main()
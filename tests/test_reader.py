@@ -0,0 +1,55 @@
+"""
+Streamed xml rows compared to petl fromxml
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import petl as etl
+
+from dasladen.reader import XmlIterView
+
+XML = b"""<root xmlns:n="http://x/y">
+<items>
+  <item id="1"><v>a</v><item id="1.1"><v>b</v></item></item>
+  <item id="2"><v>c</v></item>
+</items>
+<item id="3"><v>d</v></item>
+<n:item id="4"><v>e</v></n:item>
+</root>"""
+
+
+class XmlIterViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file = os.path.join(self.folder, "data.xml")
+        with open(self.file, "wb") as f:
+            f.write(XML)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_same_rows_as_fromxml(self):
+        mapping = {"id": (".", "id"), "v": "v"}
+        for path in ("items/item", ".//item", "item", "*/item", "items//item", "{http://x/y}item",
+                     "./items/item/item"):
+            for value in ("v", ".//v"):
+                self.assertEqual(list(XmlIterView(self.file, path, value)),
+                                 list(etl.fromxml(self.file, path, value)), path)
+            self.assertEqual(list(XmlIterView(self.file, path, mapping=mapping)),
+                             list(etl.fromxml(self.file, path, mapping)), path)
+
+    def test_nested_rows_in_document_order(self):
+        self.assertEqual(list(XmlIterView(self.file, ".//item", "v")), [("a",), ("b",), ("c",), ("d",)])
+        # a nested element of the same name is not a row of a child path
+        self.assertEqual(list(XmlIterView(self.file, "items/item", "v")), [("a",), ("c",)])
+
+    def test_unsupported_path(self):
+        self.assertRaises(ValueError, XmlIterView, self.file, "item[@id='1']", "v")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Split of SQL scripts into statements by dialect
+"""
+
+import unittest
+
+from dasladen.script import split_sql
+
+
+class SplitSqlTest(unittest.TestCase):
+
+    def test_quotes_and_comments(self):
+        script = u"""insert into t values ('a;b', 'it''s', "x;y");
+-- comment; not a statement
+select 1 /* a; b */ from t;
+/* only a comment; */
+"""
+        self.assertEqual(split_sql(script), [
+            u"insert into t values ('a;b', 'it''s', \"x;y\")",
+            u"-- comment; not a statement\nselect 1 /* a; b */ from t"])
+
+    def test_no_final_delimiter(self):
+        self.assertEqual(split_sql(u"select 1;\n\nselect 2\n"), [u"select 1", u"select 2"])
+        self.assertEqual(split_sql(u"  ;\n-- end\n"), [])
+
+    def test_postgresql_dollar_quotes(self):
+        script = u"""create function f() returns int as $body$
+begin
+  perform 'x;'; return 1;
+end; $body$ language plpgsql;
+do $$ begin raise notice 'a;b'; end $$;
+select 1"""
+        statements = split_sql(script, "postgresql")
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[0].endswith(u"$body$ language plpgsql"))
+        self.assertEqual(statements[1], u"do $$ begin raise notice 'a;b'; end $$")
+        # no dollar quotes on other dialects
+        self.assertEqual(len(split_sql(u"select '$$'; select $$;$$", "mysql")), 3)
+
+    def test_mysql_delimiter_and_escapes(self):
+        script = u"""select 'a\\';b';
+# hash comment;
+DELIMITER //
+create procedure p() begin select 1; select 2; end//
+DELIMITER ;
+select `a;b` from t;"""
+        self.assertEqual(split_sql(script, "mysql"), [
+            u"select 'a\\';b'",
+            u"create procedure p() begin select 1; select 2; end",
+            u"select `a;b` from t"])
+
+    def test_mssql_go_batches(self):
+        script = u"""create table t (id int);
+insert into [t;x] values (1)
+GO
+-- only comments
+go
+insert into t values (2)
+GO 3
+select 1"""
+        self.assertEqual(split_sql(script, "mssql"), [
+            u"create table t (id int);\ninsert into [t;x] values (1)",
+            u"insert into t values (2)", u"insert into t values (2)", u"insert into t values (2)",
+            u"select 1"])
+
+    def test_oracle_plsql_blocks(self):
+        script = u"""select 1 from dual;
+/
+begin
+  insert into t values (1);
+  commit;
+end;
+/
+create or replace procedure p as
+begin
+  null;
+end;
+/
+select 2 from dual
+/
+"""
+        self.assertEqual(split_sql(script, "oracle"), [
+            u"select 1 from dual",
+            u"begin\n  insert into t values (1);\n  commit;\nend;",
+            u"create or replace procedure p as\nbegin\n  null;\nend;",
+            u"select 2 from dual"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+External sort, distinct and dedupe, on memory and spilled to temp files
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from dasladen import transform
+
+# about a hundred rows per spilled run
+SPILL = 0.02
+
+
+class ExternalSortTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rnd = random.Random(7)
+        self.rows = [(rnd.randint(1, 50), u"name {}".format(rnd.randint(1, 9)), i) for i in range(2000)]
+        self.table = [("id", "name", "seq")] + self.rows
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _spill(self, **options):
+        options.update({"memory_mb": SPILL, "folder": self.folder})
+        return options
+
+    def test_sort(self):
+        expected = sorted(self.rows, key=lambda r: (r[0], r[1]))
+        for options in ({}, self._spill(), self._spill(compress=True)):
+            rows = list(transform.sort(self.table, ["id", "name"], **options))
+            self.assertEqual(rows[0], ("id", "name", "seq"))
+            # stable: ties keep input order, also across runs
+            self.assertEqual(rows[1:], expected)
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_sort_reverse_string_key(self):
+        rows = list(transform.sort(self.table, "seq", reverse=True, **self._spill()))
+        self.assertEqual([r[2] for r in rows[1:]], list(range(1999, -1, -1)))
+
+    def test_sort_whole_row_with_none(self):
+        table = [("a", "b"), (2, None), (1, u"x"), (None, u"y"), (1, None)]
+        rows = list(transform.sort(table))
+        self.assertEqual(rows[1:], [(None, u"y"), (1, None), (1, u"x"), (2, None)])
+
+    def test_distinct(self):
+        table = [("id", "name")] + [(r[0], r[1]) for r in self.rows]
+        expected = sorted(set(table[1:]))
+        for options in ({}, self._spill()):
+            self.assertEqual(list(transform.distinct(table, "id", **options))[1:], expected)
+
+    def test_dedupe_on_keeps_first(self):
+        first = {}
+        for row in self.rows:
+            first.setdefault(row[0], row)
+        for options in ({}, self._spill()):
+            rows = list(transform.dedupe_on(self.table, "id", **options))[1:]
+            self.assertEqual(rows, [first[k] for k in sorted(first)])
+            rows = list(transform.dedupe_on(self.table, "id", key="seq", reverse=True, **options))[1:]
+            self.assertEqual(rows, sorted(first.values(), key=lambda r: r[2], reverse=True))
+
+    def test_empty(self):
+        self.assertEqual(list(transform.sort([], "id")), [])
+        self.assertEqual(list(transform.sort([("id", )], "id")), [("id", )])
+
+
+if __name__ == "__main__":
+    unittest.main()